@@ -1,12 +1,71 @@
 from flask import Flask
 from flask_cors import CORS
+from database.aio import configure_async
+from database.db import configure_connection
+from database.engine import configure_engine
+from database.query import configure_plan_cache
+from database.search import configure_search
+from .cache import configure_cache
+from .config import Config
+from .responses import install_json
 from .routes import api
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
     CORS(app)
+    install_json(app)
+    
+    # Shared MongoDB connection pool, owned by the app for its whole lifetime
+    app.extensions['mongo'] = configure_connection(
+        app.config['DB_CONNECTION_STRING'],
+        db_name=app.config['DB_NAME'],
+        max_pool_size=app.config['DB_MAX_POOL_SIZE'],
+        min_pool_size=app.config['DB_MIN_POOL_SIZE'],
+        max_idle_time_ms=app.config['DB_MAX_IDLE_TIME_MS'],
+        connect_timeout_ms=app.config['DB_CONNECT_TIMEOUT_MS'],
+        server_selection_timeout_ms=app.config['DB_SERVER_SELECTION_TIMEOUT_MS'],
+        socket_timeout_ms=app.config['DB_SOCKET_TIMEOUT_MS'],
+        wait_queue_timeout_ms=app.config['DB_WAIT_QUEUE_TIMEOUT_MS'],
+        health_check_interval=app.config['DB_HEALTH_CHECK_INTERVAL']
+    )
+    
+    # Backend that answers the API queries
+    if app.config['QUERY_ENGINE'] == 'columnar':
+        engine_options = {
+            'version_check_interval': app.config['DATA_VERSION_CHECK_INTERVAL'],
+            'snapshot_path': app.config['SNAPSHOT_PATH']
+        }
+    else:
+        engine_options = {
+            'pushdown': app.config['AGGREGATION_PUSHDOWN'],
+            'parity_check': app.config['AGGREGATION_PARITY_CHECK'],
+            'cube': app.config['CUBE_ENABLED'],
+            'version_check_interval': app.config['DATA_VERSION_CHECK_INTERVAL']
+        }
+    app.extensions['query_engine'] = configure_engine(app.config['QUERY_ENGINE'], **engine_options)
+    
+    # Thread pool the asyncio layer runs blocking queries on
+    app.extensions['async_engine'] = configure_async(app.config['ASYNC_QUERY_WORKERS'])
+    
+    # Full-text index over title and insight, synced when the data changes
+    app.extensions['search_index'] = configure_search(app.config['DATA_VERSION_CHECK_INTERVAL'])
+    
+    # Compiled filter plans, shared by every endpoint and the result cache keys
+    app.extensions['query_plans'] = configure_plan_cache(app.config['QUERY_PLAN_CACHE_SIZE'])
+    
+    # Cache of computed results, keyed by endpoint, filters and dataset version
+    app.extensions['result_cache'] = configure_cache(
+        app.config['CACHE_BACKEND'],
+        version_check_interval=app.config['DATA_VERSION_CHECK_INTERVAL'],
+        max_bytes=app.config['CACHE_MAX_BYTES'],
+        ttl=app.config['CACHE_TTL'],
+        redis_url=app.config['CACHE_REDIS_URL']
+    )
     
     # Register blueprints
     app.register_blueprint(api, url_prefix='/api')
     
-    return app 
\ No newline at end of file
+    return app 
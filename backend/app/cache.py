@@ -0,0 +1,313 @@
+import gzip
+import hashlib
+import json
+import logging
+import struct
+import threading
+import time
+from collections import OrderedDict
+from database.db import current_data_version
+from database.query import compile_filters
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies shorter than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+def make_key(endpoint, filters, version):
+    """Cache key of a result; filters are identified by their compiled plan's canonical key"""
+    return f"{endpoint}:v{version}:{compile_filters(filters).key}"
+
+
+class CachedResponse:
+    """A finished response body with its precompressed variants and strong ETag"""
+
+    __slots__ = ('body', 'gzip', 'br', 'etag')
+
+    def __init__(self, body, gzip=None, br=None, etag=None):
+        self.body = body
+        self.gzip = gzip
+        self.br = br
+        self.etag = etag or hashlib.sha1(body).hexdigest()
+
+    @classmethod
+    def build(cls, body):
+        """Compress body once with every available encoding"""
+        if len(body) < MIN_COMPRESS_SIZE:
+            return cls(body)
+        return cls(
+            body,
+            gzip=gzip.compress(body, compresslevel=6, mtime=0),
+            br=brotli.compress(body) if brotli is not None else None,
+        )
+
+    @property
+    def nbytes(self):
+        return sum(len(part) for part in (self.body, self.gzip, self.br) if part is not None)
+
+    def pack(self):
+        parts = [self.etag.encode(), self.body, self.gzip or b'', self.br or b'']
+        return struct.pack('>4I', *(len(part) for part in parts)) + b''.join(parts)
+
+    @classmethod
+    def unpack(cls, raw):
+        lengths = struct.unpack('>4I', raw[:16])
+        parts, offset = [], 16
+        for length in lengths:
+            parts.append(raw[offset:offset + length])
+            offset += length
+        etag, body, gzip_body, br_body = parts
+        return cls(body, gzip=gzip_body or None, br=br_body or None, etag=etag.decode())
+
+
+def _size(value):
+    if isinstance(value, CachedResponse):
+        return value.nbytes
+    return len(json.dumps(value, separators=(',', ':')))
+
+
+class CacheStats:
+    """Hit/miss/eviction counters shared by the cache backends"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    def incr(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'rejected': self.rejected,
+        }
+
+
+class InProcessCache:
+    """LRU cache with per-entry TTLs and a bound on the total size of the stored values.
+
+    Sizes are the length of each value's JSON encoding, or the stored bytes
+    of a CachedResponse. Values bigger than
+    a quarter of the budget are not stored, so one huge result cannot
+    flush everything else.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.incr('misses')
+                return None
+            expires, size, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.size -= size
+                self.stats.incr('expirations')
+                self.stats.incr('misses')
+                return None
+            self._entries.move_to_end(key)
+            self.stats.incr('hits')
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = _size(value)
+        if size > self.max_bytes // 4:
+            self.stats.incr('rejected')
+            return
+        expires = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (expires, size, value)
+            self.size += size
+            while self.size > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.stats.incr('evictions')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def info(self):
+        return {
+            'backend': self.name,
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            **self.stats.as_dict(),
+        }
+
+
+class RedisCache:
+    """Cache shared between workers through a Redis-compatible server.
+
+    Values are stored as JSON, except CachedResponses which are stored as
+    their packed bytes behind a marker byte that JSON never starts with.
+    Entries expire through Redis TTLs and memory is bounded by the server's
+    maxmemory setting, which should use an LRU eviction policy
+    (allkeys-lru). Hit and miss counters are kept per process.
+    """
+
+    name = 'redis'
+    _RESPONSE_MARKER = b'\x00'
+
+    def __init__(self, url='redis://localhost:6379/0', ttl=300, prefix='dashboard:', client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("The redis cache backend requires the 'redis' package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.stats.incr('misses')
+            return None
+        self.stats.incr('hits')
+        if raw[:1] == self._RESPONSE_MARKER:
+            return CachedResponse.unpack(raw[1:])
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        if isinstance(value, CachedResponse):
+            raw = self._RESPONSE_MARKER + value.pack()
+        else:
+            raw = json.dumps(value, separators=(',', ':'))
+        self.client.set(self.prefix + key, raw, ex=ttl if ttl is not None else self.ttl)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def info(self):
+        info = {'backend': self.name, 'ttl': self.ttl, **self.stats.as_dict()}
+        try:
+            server = self.client.info('stats')
+            info['evictions'] = server.get('evicted_keys', info['evictions'])
+            info['expirations'] = server.get('expired_keys', info['expirations'])
+        except Exception as e:
+            logger.warning(f"Could not read Redis cache stats: {str(e)}")
+        return info
+
+
+class ResultCache:
+    """Caches endpoint results by endpoint, normalized filters and dataset version.
+
+    The dataset version is part of every key, so bumping it makes all
+    older entries unreachable. They then age out through LRU or TTL.
+    """
+
+    def __init__(self, backend, version_check_interval=5.0):
+        self.backend = backend
+        self.version_check_interval = version_check_interval
+
+    def _key(self, endpoint, filters):
+        return make_key(endpoint, filters, current_data_version(self.version_check_interval))
+
+    def get(self, endpoint, filters):
+        """Cached result, or None on a miss or when the cache is unavailable"""
+        try:
+            return self.backend.get(self._key(endpoint, filters))
+        except Exception as e:
+            logger.warning(f"Result cache unavailable for {endpoint}: {str(e)}")
+            return None
+
+    def set(self, endpoint, filters, value):
+        try:
+            self.backend.set(self._key(endpoint, filters), value)
+        except Exception as e:
+            logger.warning(f"Could not store {endpoint} in the result cache: {str(e)}")
+
+    def get_or_compute(self, endpoint, filters, compute):
+        value = self.get(endpoint, filters)
+        if value is None:
+            value = compute()
+            self.set(endpoint, filters, value)
+        return value
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return self.backend.info()
+
+
+class NullCache:
+    """Result cache that never stores anything"""
+
+    def get(self, endpoint, filters):
+        return None
+
+    def set(self, endpoint, filters, value):
+        pass
+
+    def get_or_compute(self, endpoint, filters, compute):
+        return compute()
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'none'}
+
+
+_cache = NullCache()
+
+
+def create_cache_backend(name, max_bytes=64 * 1024 * 1024, ttl=300, redis_url=None):
+    """Instantiate the cache backend registered under the given name"""
+    if name == 'memory':
+        return InProcessCache(max_bytes=max_bytes, ttl=ttl)
+    if name == 'redis':
+        return RedisCache(url=redis_url or 'redis://localhost:6379/0', ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+def configure_cache(name='memory', version_check_interval=5.0, **options):
+    """Install the process-wide result cache; 'none' disables caching"""
+    global _cache
+    if name in [None, '', 'none']:
+        _cache = NullCache()
+    else:
+        _cache = ResultCache(create_cache_backend(name, **options), version_check_interval)
+    return _cache
+
+
+def get_cache():
+    return _cache
@@ -0,0 +1,96 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in [None, ''] else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in [None, ''] else default
+
+
+class Config:
+    """Default configuration, overridable through environment variables"""
+
+    # MongoDB connection
+    DB_CONNECTION_STRING = os.getenv('DB_CONNECTION_STRING')
+    DB_NAME = os.getenv('DB_NAME', 'visualization_db')
+
+    # Connection pool sizing and timeouts
+    DB_MAX_POOL_SIZE = _env_int('DB_MAX_POOL_SIZE', 50)
+    DB_MIN_POOL_SIZE = _env_int('DB_MIN_POOL_SIZE', 0)
+    DB_MAX_IDLE_TIME_MS = _env_int('DB_MAX_IDLE_TIME_MS', 60000)
+    DB_CONNECT_TIMEOUT_MS = _env_int('DB_CONNECT_TIMEOUT_MS', 5000)
+    DB_SERVER_SELECTION_TIMEOUT_MS = _env_int('DB_SERVER_SELECTION_TIMEOUT_MS', 5000)
+    DB_SOCKET_TIMEOUT_MS = _env_int('DB_SOCKET_TIMEOUT_MS', 30000)
+    DB_WAIT_QUEUE_TIMEOUT_MS = _env_int('DB_WAIT_QUEUE_TIMEOUT_MS', 5000)
+
+    # Seconds between background pings; 0 disables them
+    DB_HEALTH_CHECK_INTERVAL = _env_float('DB_HEALTH_CHECK_INTERVAL', 30)
+
+    # Query engine: 'mongo' reads MongoDB per request, 'columnar' serves from
+    # an in-memory NumPy copy of the collection
+    QUERY_ENGINE = os.getenv('QUERY_ENGINE', 'mongo')
+
+    # Snapshot file the columnar engine memory-maps at startup while it
+    # matches the dataset version, and rewrites after loading from MongoDB
+    SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH') or None
+
+    # Run dashboard aggregations as MongoDB pipelines instead of in Python,
+    # optionally running both and logging any difference
+    AGGREGATION_PUSHDOWN = os.getenv('AGGREGATION_PUSHDOWN', 'true').lower() == 'true'
+    AGGREGATION_PARITY_CHECK = os.getenv('AGGREGATION_PARITY_CHECK', 'false').lower() == 'true'
+
+    # Answer covered metrics/timeseries/geo/topic requests from the
+    # pre-aggregated cube while it matches the dataset version
+    CUBE_ENABLED = os.getenv('CUBE_ENABLED', 'true').lower() == 'true'
+
+    # Compute the views of an /api/dashboard request concurrently on a pool
+    # of query threads, instead of one after the other
+    ASYNC_QUERIES = os.getenv('ASYNC_QUERIES', 'false').lower() == 'true'
+    ASYNC_QUERY_WORKERS = _env_int('ASYNC_QUERY_WORKERS', 32)
+
+    # Result cache: 'memory' (per process), 'redis' (shared between workers) or 'none'
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_MAX_BYTES = _env_int('CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    CACHE_TTL = _env_int('CACHE_TTL', 300)
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # /api/network link pruning (0 keeps every link) and force layout iterations
+    NETWORK_MAX_EDGES = _env_int('NETWORK_MAX_EDGES', 0)
+    NETWORK_MIN_WEIGHT = _env_int('NETWORK_MIN_WEIGHT', 1)
+    NETWORK_LAYOUT_ITERATIONS = _env_int('NETWORK_LAYOUT_ITERATIONS', 150)
+
+    # Results per /api/search request by default, and the most a client may ask for
+    SEARCH_DEFAULT_LIMIT = _env_int('SEARCH_DEFAULT_LIMIT', 10)
+    SEARCH_MAX_LIMIT = _env_int('SEARCH_MAX_LIMIT', 100)
+
+    # Compiled filter plans kept per process, keyed by canonical filter set
+    QUERY_PLAN_CACHE_SIZE = _env_int('QUERY_PLAN_CACHE_SIZE', 1024)
+
+    # Seconds a known dataset version is trusted before it is re-read
+    DATA_VERSION_CHECK_INTERVAL = _env_float('DATA_VERSION_CHECK_INTERVAL', 5)
+
+    # Rows per /api/data page when paginating, and the most a client may ask for
+    DATA_PAGE_SIZE = _env_int('DATA_PAGE_SIZE', 100)
+    DATA_MAX_PAGE_SIZE = _env_int('DATA_MAX_PAGE_SIZE', 1000)
+
+    # Documents fetched and flushed per chunk of a streamed /api/data response
+    DATA_STREAM_BATCH_SIZE = _env_int('DATA_STREAM_BATCH_SIZE', 1000)
+
+    # Pre-forked server (serve.py): listening address, worker processes,
+    # requests before a worker is replaced (0 never), seconds without a
+    # heartbeat before a worker is killed, and seconds workers get to finish
+    # on reload or shutdown
+    SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+    SERVER_PORT = _env_int('SERVER_PORT', 5000)
+    SERVER_WORKERS = _env_int('SERVER_WORKERS', os.cpu_count() or 1)
+    SERVER_MAX_REQUESTS = _env_int('SERVER_MAX_REQUESTS', 0)
+    SERVER_WORKER_TIMEOUT = _env_float('SERVER_WORKER_TIMEOUT', 30)
+    SERVER_GRACEFUL_TIMEOUT = _env_float('SERVER_GRACEFUL_TIMEOUT', 30)
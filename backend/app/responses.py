@@ -0,0 +1,82 @@
+from flask import Response, json, request
+from database.records import Record
+from .cache import CachedResponse, get_cache
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask < 2.2 serializes through app.json_encoder
+    DefaultJSONProvider = None
+
+# Preferred first when the client accepts several equally
+ENCODINGS = ['br', 'gzip', 'identity']
+
+
+def _encoded_body(entry):
+    """Pick the best precompressed variant the client accepts"""
+    available = [encoding for encoding in ENCODINGS if encoding == 'identity' or getattr(entry, encoding)]
+    encoding = request.accept_encodings.best_match(available, default='identity')
+    if encoding == 'identity':
+        return None, entry.body
+    return encoding, getattr(entry, encoding)
+
+
+def make_response(entry):
+    """Serve a CachedResponse, answering a matching If-None-Match with 304"""
+    encoding, body = _encoded_body(entry)
+    # Strong ETags identify one exact byte sequence, so each encoding gets its own
+    etag = entry.etag if encoding is None else f"{entry.etag}-{encoding}"
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Clients may keep the body but must revalidate, since the data can change
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+if DefaultJSONProvider is not None:
+    class RecordJSONProvider(DefaultJSONProvider):
+        """JSON provider that turns Records into dicts as they are serialized"""
+
+        @staticmethod
+        def default(o):
+            if isinstance(o, Record):
+                return o.to_dict()
+            return DefaultJSONProvider.default(o)
+else:
+    class RecordJSONEncoder(json.JSONEncoder):
+        """JSON encoder that turns Records into dicts as they are serialized"""
+
+        def default(self, o):
+            if isinstance(o, Record):
+                return o.to_dict()
+            return super().default(o)
+
+
+def install_json(app):
+    """Serialize Records in every jsonify() and flask.json.dumps() of the app"""
+    if DefaultJSONProvider is not None:
+        app.json = RecordJSONProvider(app)
+    else:
+        app.json_encoder = RecordJSONEncoder
+
+
+def cached_json(endpoint, filters, compute):
+    """JSON response for an endpoint result, serialized and compressed once per dataset version.
+
+    The result itself stays cached under the endpoint's own name, so
+    /api/dashboard can keep reusing it.
+    """
+    cache = get_cache()
+    entry = cache.get(f'{endpoint}.response', filters)
+    if entry is None:
+        value = cache.get_or_compute(endpoint, filters, compute)
+        body = (json.dumps(value, separators=(',', ':')) + '\n').encode('utf-8')
+        entry = CachedResponse.build(body)
+        cache.set(f'{endpoint}.response', filters, entry)
+    return make_response(entry)
@@ -1,128 +1,229 @@
-from flask import Blueprint, jsonify, request
-from database.db import (
-    get_all_data, 
-    get_filtered_data, 
-    get_distinct_values,
-    get_base_metrics,
-    calculate_base_metrics
-)
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from database.aio import get_async_engine
+from database.db import get_connection_manager
+from database.engine import get_engine, DASHBOARD_VIEWS, InvalidPageToken
+from database.query import parse_filters, parse_fields, get_plan_cache, InvalidFilter
+from database.encoding import encode_columns
+from database.records import to_json
+from database.search import get_search_index
+from database.layout import layout_network
+from .cache import get_cache
+from .responses import cached_json
+import json
 import logging
-from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 api = Blueprint('api', __name__)
 
+@api.errorhandler(InvalidFilter)
+def invalid_filter(e):
+    return jsonify({"error": str(e)}), 400
+
+@api.route('/health', methods=['GET'])
+def get_health():
+    """Report the state of the pooled MongoDB connection"""
+    status = get_connection_manager().status()
+    return jsonify(status), 200 if status['healthy'] is not False else 503
+
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Report result cache hit/miss/eviction counters and compiled plan reuse"""
+    return jsonify({**get_cache().stats(), 'plans': get_plan_cache().stats()})
+
+# Response layouts of /api/data: a list of row objects, or per-field arrays
+DATA_FORMATS = ['rows', 'columnar']
+
 @api.route('/data', methods=['GET'])
 def get_data():
-    filters = {
-        'end_year': request.args.get('end_year'),
-        'topic': request.args.get('topic'),
-        'sector': request.args.get('sector'),
-        'region': request.args.get('region'),
-        'pest': request.args.get('pest'),
-        'source': request.args.get('source'),
-        'country': request.args.get('country'),
-        'city': request.args.get('city')
-    }
-    
-    # Remove None values from filters
-    filters = {k: v for k, v in filters.items() if v is not None}
-    
+    """
+    Get the matching records one page at a time: limit rows (DATA_PAGE_SIZE
+    by default, at most DATA_MAX_PAGE_SIZE) and the after token of the next
+    page. fields= limits them to the named fields, and format=columnar
+    returns one array per field, with repeating strings dictionary-encoded,
+    instead of one object per row. Every matching row at once is only
+    available as a stream (stream=1 or Accept: application/x-ndjson).
+    """
+    filters = parse_filters(request.args)
+    fields = parse_fields(request.args)
+    data_format = request.args.get('format') or 'rows'
+    if data_format not in DATA_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(DATA_FORMATS)}"}), 400
+    columnar = data_format == 'columnar'
+
     try:
-        if filters:
-            data = get_filtered_data(filters)
-        else:
-            data = get_all_data()
-        return jsonify(data)
+        paged = 'limit' in request.args or 'after' in request.args
+        if not paged and not columnar and _wants_stream():
+            return _data_stream(filters, fields)
+        return _data_page(filters, fields, columnar)
+    except InvalidPageToken as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching data: {str(e)}")
         return jsonify({"error": "Failed to fetch data"}), 500
 
+def _data_page(filters, fields, columnar):
+    """One keyset page of /api/data; limit is clamped to the server maximum"""
+    max_size = current_app.config['DATA_MAX_PAGE_SIZE']
+    try:
+        limit = int(request.args.get('limit', current_app.config['DATA_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = min(max(limit, 1), max_size)
+
+    rows, next_token = get_engine().page(filters, limit, request.args.get('after') or None, fields)
+    return jsonify({'data': encode_columns(rows, fields) if columnar else rows, 'next': next_token, 'limit': limit})
+
+NDJSON = 'application/x-ndjson'
+
+def _wants_stream():
+    if request.args.get('stream') in ['1', 'true']:
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+def _data_stream(filters, fields):
+    """Stream /api/data as newline-delimited JSON, one cursor batch per chunk"""
+    batch_size = current_app.config['DATA_STREAM_BATCH_SIZE']
+    rows = get_engine().iter_records(filters, batch_size=batch_size, fields=fields)
+
+    def generate():
+        batch = []
+        try:
+            for row in rows:
+                batch.append(json.dumps(row, separators=(',', ':'), default=to_json))
+                if len(batch) >= batch_size:
+                    yield '\n'.join(batch) + '\n'
+                    batch = []
+            if batch:
+                yield '\n'.join(batch) + '\n'
+        except Exception as e:
+            # Headers are already sent, so the client sees a truncated stream
+            logger.error(f"Error streaming data: {str(e)}")
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+@api.route('/search', methods=['GET'])
+def search():
+    """
+    Rank records by how well their title and insight match the q parameter (BM25).
+    Accepts the same filters as the other endpoints and returns the best
+    limit matches with their scores.
+    """
+    filters = parse_filters(request.args)
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = int(request.args.get('limit', current_app.config['SEARCH_DEFAULT_LIMIT']))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = min(max(limit, 1), current_app.config['SEARCH_MAX_LIMIT'])
+
+    try:
+        results = get_search_index().search(query, limit, filters)
+        return jsonify({
+            'query': query,
+            'limit': limit,
+            'results': [{'score': round(score, 4), 'record': record} for score, record in results]
+        })
+    except Exception as e:
+        logger.error(f"Error searching records: {str(e)}")
+        return jsonify({"error": "Failed to search records"}), 500
+
 @api.route('/filters', methods=['GET'])
 def get_filters():
+    """
+    Get the values of every filter field, with how many records each would match.
+    Counts for a field are conditioned on the active filters on all other fields,
+    so values that would return no rows are left out.
+    """
+    filters = parse_filters(request.args)
+
     try:
-        filters = {
-            'end_years': get_distinct_values('end_year'),
-            'topics': get_distinct_values('topic'),
-            'sectors': get_distinct_values('sector'),
-            'regions': get_distinct_values('region'),
-            'pests': get_distinct_values('pestle'),
-            'sources': get_distinct_values('source'),
-            'countries': get_distinct_values('country'),
-            'cities': get_distinct_values('city')
-        }
-        return jsonify(filters)
+        return cached_json('filters', filters, lambda: _filter_options(filters))
     except Exception as e:
         logger.error(f"Error fetching filters: {str(e)}")
         return jsonify({"error": "Failed to fetch filters"}), 500
 
+# Response key -> stored field of each filter facet
+FACETS = {
+    'end_years': 'end_year',
+    'topics': 'topic',
+    'sectors': 'sector',
+    'regions': 'region',
+    'pests': 'pestle',
+    'sources': 'source',
+    'countries': 'country',
+    'cities': 'city'
+}
+
+def _filter_options(filters):
+    facets = get_engine().facets(filters, list(FACETS.values()))
+    options = {name: list(facets[field]) for name, field in FACETS.items()}
+    options['counts'] = {name: facets[field] for name, field in FACETS.items()}
+    return options
+
 @api.route('/metrics', methods=['GET'])
 def get_metrics():
+    filters = parse_filters(request.args)
+
     try:
-        # Always get the base metrics first for total records
-        base_metrics = get_base_metrics()
-        if not base_metrics:
-            # Fallback: calculate base metrics if cache is empty
-            data = get_all_data()
-            base_metrics = calculate_base_metrics(data)
-        
-        # Check if there are any filters applied
-        filters = {
-            'end_year': request.args.get('end_year'),
-            'topic': request.args.get('topic'),
-            'sector': request.args.get('sector'),
-            'region': request.args.get('region'),
-            'pest': request.args.get('pest'),
-            'source': request.args.get('source'),
-            'country': request.args.get('country'),
-            'city': request.args.get('city')
-        }
-        
-        # Remove None values from filters
-        filters = {k: v for k, v in filters.items() if v is not None}
-        
-        if not filters:
-            # Return base metrics if no filters are applied
-            return jsonify(base_metrics)
-        else:
-            # Get filtered data and calculate averages
-            filtered_data = get_filtered_data(filters)
-            filtered_count = len(filtered_data)
-            
-            if filtered_count == 0:
-                # Return zero averages if no data matches the filters
-                return jsonify({
-                    'total_records': base_metrics['total_records'],  # Keep total records from base
-                    'avg_intensity': 0,
-                    'avg_likelihood': 0,
-                    'avg_relevance': 0
-                })
-            
-            # Helper function to safely convert values to float
-            def safe_float(value):
-                try:
-                    return float(value) if value not in [None, '', 'null'] else 0.0
-                except (ValueError, TypeError):
-                    return 0.0
-            
-            # Calculate averages for filtered data only
-            intensity_values = [safe_float(d.get('intensity')) for d in filtered_data]
-            likelihood_values = [safe_float(d.get('likelihood')) for d in filtered_data]
-            relevance_values = [safe_float(d.get('relevance')) for d in filtered_data]
-            
-            filtered_metrics = {
-                'total_records': base_metrics['total_records'],  # Keep total records from base
-                'avg_intensity': round(sum(intensity_values) / filtered_count, 2),
-                'avg_likelihood': round(sum(likelihood_values) / filtered_count, 2),
-                'avg_relevance': round(sum(relevance_values) / filtered_count, 2)
-            }
-            
-            return jsonify(filtered_metrics)
+        return cached_json('metrics', filters, lambda: get_engine().metrics(filters))
             
     except Exception as e:
         logger.error(f"Error calculating metrics: {str(e)}")
         return jsonify({"error": "Failed to calculate metrics"}), 500
 
+@api.route('/dashboard', methods=['GET'])
+def get_dashboard():
+    """
+    Get several dashboard views for one filter set in a single response.
+    The views parameter is a comma-separated subset of data, metrics, network,
+    topic_distribution, timeseries, geo and charts; all of them are returned by default.
+    With ASYNC_QUERIES on, aggregate views without data are queried concurrently.
+    """
+    filters = parse_filters(request.args)
+
+    views = request.args.get('views')
+    if views:
+        views = [view.strip().replace('-', '_') for view in views.split(',') if view.strip()]
+        unknown = [view for view in views if view not in DASHBOARD_VIEWS]
+        if unknown:
+            return jsonify({"error": f"Unknown views: {', '.join(unknown)}"}), 400
+    else:
+        views = DASHBOARD_VIEWS
+    
+    try:
+        # Aggregate views already cached by their own endpoints are reused;
+        # everything else is computed from one pass over the matching rows,
+        # or, in async mode when the rows are not requested, view by view in
+        # parallel
+        cache = get_cache()
+        result = {}
+        for view in views:
+            if view != 'data':
+                cached = cache.get(view.replace('_', '-'), filters)
+                if cached is not None:
+                    result[view] = cached
+        
+        missing = [view for view in views if view not in result]
+        if missing:
+            async_engine = get_async_engine()
+            if current_app.config['ASYNC_QUERIES'] and async_engine.fans_out(missing):
+                computed = async_engine.call(async_engine.dashboard(filters, missing))
+            else:
+                computed = get_engine().dashboard(filters, missing)
+            if 'network' in computed:
+                computed['network'] = _layout(computed['network'], *_network_defaults())
+            for view, value in computed.items():
+                if view != 'data':
+                    cache.set(view.replace('_', '-'), filters, value)
+            result.update(computed)
+        
+        return jsonify({view: result[view] for view in views})
+    except Exception as e:
+        logger.error(f"Error fetching dashboard data: {str(e)}")
+        return jsonify({"error": "Failed to fetch dashboard data"}), 500
+
 # New endpoints for D3.js visualizations
 
 @api.route('/timeseries', methods=['GET'])
@@ -131,62 +232,10 @@ def get_timeseries_data():
     Get time series data for D3.js visualizations.
     Returns intensity, likelihood, and relevance over time.
     """
+    filters = parse_filters(request.args)
+
     try:
-        filters = {
-            'end_year': request.args.get('end_year'),
-            'topic': request.args.get('topic'),
-            'sector': request.args.get('sector'),
-            'region': request.args.get('region'),
-            'pest': request.args.get('pest'),
-            'source': request.args.get('source'),
-            'country': request.args.get('country'),
-            'city': request.args.get('city')
-        }
-        
-        # Remove None values from filters
-        filters = {k: v for k, v in filters.items() if v is not None}
-        
-        if filters:
-            data = get_filtered_data(filters)
-        else:
-            data = get_all_data()
-        
-        # Helper function to safely convert values to float
-        def safe_float(value):
-            try:
-                return float(value) if value not in [None, '', 'null'] else 0.0
-            except (ValueError, TypeError):
-                return 0.0
-        
-        # Group data by year
-        time_data = defaultdict(lambda: {'intensity': [], 'likelihood': [], 'relevance': []})
-        
-        for item in data:
-            year = item.get('end_year')
-            if year and year != 'Unknown':
-                time_data[year]['intensity'].append(safe_float(item.get('intensity')))
-                time_data[year]['likelihood'].append(safe_float(item.get('likelihood')))
-                time_data[year]['relevance'].append(safe_float(item.get('relevance')))
-        
-        # Calculate averages for each year
-        result = []
-        for year, values in time_data.items():
-            intensity_avg = sum(values['intensity']) / len(values['intensity']) if values['intensity'] else 0
-            likelihood_avg = sum(values['likelihood']) / len(values['likelihood']) if values['likelihood'] else 0
-            relevance_avg = sum(values['relevance']) / len(values['relevance']) if values['relevance'] else 0
-            
-            result.append({
-                'year': year,
-                'intensity': round(intensity_avg, 2),
-                'likelihood': round(likelihood_avg, 2),
-                'relevance': round(relevance_avg, 2),
-                'count': len(values['intensity'])
-            })
-        
-        # Sort by year
-        result.sort(key=lambda x: x['year'])
-        
-        return jsonify(result)
+        return cached_json('timeseries', filters, lambda: get_engine().timeseries(filters))
     
     except Exception as e:
         logger.error(f"Error fetching time series data: {str(e)}")
@@ -196,260 +245,79 @@ def get_timeseries_data():
 def get_network_data():
     """
     Get network data for D3.js force-directed graph visualization.
-    Returns relationships between topics, sectors, and regions.
+    Returns relationships between topics, sectors, and regions, with node
+    positions laid out on the server. max_edges keeps the heaviest links and
+    min_weight drops lighter ones.
     """
+    filters = parse_filters(request.args)
     try:
-        filters = {
-            'end_year': request.args.get('end_year'),
-            'topic': request.args.get('topic'),
-            'sector': request.args.get('sector'),
-            'region': request.args.get('region'),
-            'pest': request.args.get('pest'),
-            'source': request.args.get('source'),
-            'country': request.args.get('country'),
-            'city': request.args.get('city')
-        }
-        
-        # Remove None values from filters
-        filters = {k: v for k, v in filters.items() if v is not None}
-        
-        if filters:
-            data = get_filtered_data(filters)
-        else:
-            data = get_all_data()
-        
-        # Create nodes and links for network visualization
-        nodes = []
-        links = []
-        
-        # Track unique nodes and their indices
-        node_map = {}
-        node_index = 0
-        
-        # Track connections between nodes
-        connections = defaultdict(int)
-        
-        for item in data:
-            topic = item.get('topic')
-            sector = item.get('sector')
-            region = item.get('region')
-            
-            # Skip items with missing data
-            if not topic or topic == 'Unknown' or not sector or sector == 'Unknown':
-                continue
-            
-            # Add topic node if not exists
-            if topic not in node_map:
-                node_map[topic] = node_index
-                nodes.append({
-                    'id': node_index,
-                    'name': topic,
-                    'type': 'topic',
-                    'value': 1
-                })
-                node_index += 1
-            else:
-                # Increment existing node value
-                nodes[node_map[topic]]['value'] += 1
-            
-            # Add sector node if not exists
-            if sector not in node_map:
-                node_map[sector] = node_index
-                nodes.append({
-                    'id': node_index,
-                    'name': sector,
-                    'type': 'sector',
-                    'value': 1
-                })
-                node_index += 1
-            else:
-                # Increment existing node value
-                nodes[node_map[sector]]['value'] += 1
-            
-            # Add region node if not exists and not Unknown
-            if region and region != 'Unknown':
-                if region not in node_map:
-                    node_map[region] = node_index
-                    nodes.append({
-                        'id': node_index,
-                        'name': region,
-                        'type': 'region',
-                        'value': 1
-                    })
-                    node_index += 1
-                else:
-                    # Increment existing node value
-                    nodes[node_map[region]]['value'] += 1
-                
-                # Create links between topic, sector, and region
-                topic_sector_key = f"{node_map[topic]}-{node_map[sector]}"
-                connections[topic_sector_key] += 1
-                
-                sector_region_key = f"{node_map[sector]}-{node_map[region]}"
-                connections[sector_region_key] += 1
-            else:
-                # Create link between topic and sector only
-                topic_sector_key = f"{node_map[topic]}-{node_map[sector]}"
-                connections[topic_sector_key] += 1
-        
-        # Create links from connections
-        for connection, weight in connections.items():
-            source, target = map(int, connection.split('-'))
-            links.append({
-                'source': source,
-                'target': target,
-                'value': weight
-            })
-        
-        return jsonify({
-            'nodes': nodes,
-            'links': links
-        })
+        max_edges = int(request.args.get('max_edges', current_app.config['NETWORK_MAX_EDGES']))
+        min_weight = int(request.args.get('min_weight', current_app.config['NETWORK_MIN_WEIGHT']))
+    except ValueError:
+        return jsonify({"error": "max_edges and min_weight must be integers"}), 400
+    options = (max(max_edges, 0), max(min_weight, 1))
+
+    # The default pruning shares its cache entry with /api/dashboard
+    endpoint = 'network' if options == _network_defaults() else 'network:{}:{}'.format(*options)
+    try:
+        return cached_json(endpoint, filters, lambda: _layout(get_engine().network(filters), *options))
     
     except Exception as e:
         logger.error(f"Error fetching network data: {str(e)}")
         return jsonify({"error": "Failed to fetch network data"}), 500
 
+def _network_defaults():
+    return (current_app.config['NETWORK_MAX_EDGES'], current_app.config['NETWORK_MIN_WEIGHT'])
+
+def _layout(network, max_edges, min_weight):
+    """Network view with pruned links and server-side node positions"""
+    return layout_network(
+        network,
+        max_edges=max_edges or None,
+        min_weight=min_weight,
+        iterations=current_app.config['NETWORK_LAYOUT_ITERATIONS']
+    )
+
 @api.route('/geo', methods=['GET'])
 def get_geo_data():
     """
     Get geographic data for D3.js map visualizations.
     Returns country-level data for choropleth maps.
     """
+    filters = parse_filters(request.args)
+
     try:
-        filters = {
-            'end_year': request.args.get('end_year'),
-            'topic': request.args.get('topic'),
-            'sector': request.args.get('sector'),
-            'region': request.args.get('region'),
-            'pest': request.args.get('pest'),
-            'source': request.args.get('source'),
-            'country': request.args.get('country'),
-            'city': request.args.get('city')
-        }
-        
-        # Remove None values from filters
-        filters = {k: v for k, v in filters.items() if v is not None}
-        
-        if filters:
-            data = get_filtered_data(filters)
-        else:
-            data = get_all_data()
-        
-        # Helper function to safely convert values to float
-        def safe_float(value):
-            try:
-                return float(value) if value not in [None, '', 'null'] else 0.0
-            except (ValueError, TypeError):
-                return 0.0
-        
-        # Group data by country
-        country_data = defaultdict(lambda: {
-            'intensity': [], 
-            'likelihood': [], 
-            'relevance': [],
-            'count': 0
-        })
-        
-        for item in data:
-            country = item.get('country')
-            if country and country != 'Unknown':
-                country_data[country]['intensity'].append(safe_float(item.get('intensity')))
-                country_data[country]['likelihood'].append(safe_float(item.get('likelihood')))
-                country_data[country]['relevance'].append(safe_float(item.get('relevance')))
-                country_data[country]['count'] += 1
-        
-        # Calculate averages for each country
-        result = []
-        for country, values in country_data.items():
-            intensity_avg = sum(values['intensity']) / len(values['intensity']) if values['intensity'] else 0
-            likelihood_avg = sum(values['likelihood']) / len(values['likelihood']) if values['likelihood'] else 0
-            relevance_avg = sum(values['relevance']) / len(values['relevance']) if values['relevance'] else 0
-            
-            result.append({
-                'country': country,
-                'intensity': round(intensity_avg, 2),
-                'likelihood': round(likelihood_avg, 2),
-                'relevance': round(relevance_avg, 2),
-                'count': values['count']
-            })
-        
-        return jsonify(result)
+        return cached_json('geo', filters, lambda: get_engine().geo(filters))
     
     except Exception as e:
         logger.error(f"Error fetching geographic data: {str(e)}")
         return jsonify({"error": "Failed to fetch geographic data"}), 500
 
+@api.route('/charts', methods=['GET'])
+def get_charts_data():
+    """
+    Get the sums plotted by the standard charts: intensity by sector,
+    likelihood by region and relevance by end year.
+    """
+    filters = parse_filters(request.args)
+
+    try:
+        return cached_json('charts', filters, lambda: get_engine().charts(filters))
+
+    except Exception as e:
+        logger.error(f"Error fetching chart data: {str(e)}")
+        return jsonify({"error": "Failed to fetch chart data"}), 500
+
 @api.route('/topic-distribution', methods=['GET'])
 def get_topic_distribution():
     """
     Get topic distribution data for D3.js visualizations.
     Returns hierarchical data for treemap or sunburst charts.
     """
+    filters = parse_filters(request.args)
+
     try:
-        filters = {
-            'end_year': request.args.get('end_year'),
-            'topic': request.args.get('topic'),
-            'sector': request.args.get('sector'),
-            'region': request.args.get('region'),
-            'pest': request.args.get('pest'),
-            'source': request.args.get('source'),
-            'country': request.args.get('country'),
-            'city': request.args.get('city')
-        }
-        
-        # Remove None values from filters
-        filters = {k: v for k, v in filters.items() if v is not None}
-        
-        if filters:
-            data = get_filtered_data(filters)
-        else:
-            data = get_all_data()
-        
-        # Create hierarchical structure: sector -> topic -> pestle
-        hierarchy = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-        
-        for item in data:
-            sector = item.get('sector') or 'Unknown'
-            topic = item.get('topic') or 'Unknown'
-            pestle = item.get('pestle') or 'Unknown'
-            
-            # Skip items with all unknown values
-            if sector == 'Unknown' and topic == 'Unknown' and pestle == 'Unknown':
-                continue
-            
-            # Increment count for this combination
-            hierarchy[sector][topic][pestle] += 1
-        
-        # Convert to hierarchical format for D3.js
-        result = {
-            'name': 'Topics',
-            'children': []
-        }
-        
-        for sector, topics in hierarchy.items():
-            sector_node = {
-                'name': sector,
-                'children': []
-            }
-            
-            for topic, pestles in topics.items():
-                topic_node = {
-                    'name': topic,
-                    'children': []
-                }
-                
-                for pestle, count in pestles.items():
-                    topic_node['children'].append({
-                        'name': pestle,
-                        'value': count
-                    })
-                
-                sector_node['children'].append(topic_node)
-            
-            result['children'].append(sector_node)
-        
-        return jsonify(result)
+        return cached_json('topic-distribution', filters, lambda: get_engine().topic_distribution(filters))
     
     except Exception as e:
         logger.error(f"Error fetching topic distribution data: {str(e)}")
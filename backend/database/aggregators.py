@@ -0,0 +1,305 @@
+from abc import ABC, abstractmethod
+from .query import compile_filters, matches
+
+SCORE_FIELDS = ['intensity', 'likelihood', 'relevance']
+
+# Standard charts: name -> (field grouped by, score summed per group)
+CHART_SUMS = {
+    'intensity_by_sector': ('sector', 'intensity'),
+    'likelihood_by_region': ('region', 'likelihood'),
+    'relevance_by_year': ('end_year', 'relevance'),
+}
+
+
+def safe_float(value):
+    """Convert a stored score to float, treating blanks as zero"""
+    try:
+        return float(value) if value not in [None, '', 'null'] else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+
+class RunningStats:
+    """Constant-memory running count, sum, min and max of one value"""
+
+    __slots__ = ('count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+class ScoreStats:
+    """RunningStats for each score field of a group"""
+
+    __slots__ = ('count', 'fields')
+
+    def __init__(self):
+        self.count = 0
+        self.fields = {field: RunningStats() for field in SCORE_FIELDS}
+
+    def add(self, item):
+        self.count += 1
+        for field, stats in self.fields.items():
+            stats.add(safe_float(item.get(field)))
+
+    def rounded_means(self):
+        return {field: round(stats.mean(), 2) for field, stats in self.fields.items()}
+
+
+class Accumulator(ABC):
+    """One view's aggregation, fed one record at a time by scan()"""
+
+    @abstractmethod
+    def add(self, item):
+        """Fold one matching record into the aggregate"""
+
+    @abstractmethod
+    def result(self):
+        """The view's response for every record added so far"""
+
+
+class MetricsAccumulator(Accumulator):
+    """Filtered score averages, keeping total records from the base metrics"""
+
+    def __init__(self, base_metrics):
+        self.base_metrics = base_metrics
+        self.stats = ScoreStats()
+
+    def add(self, item):
+        self.stats.add(item)
+
+    def result(self):
+        if self.stats.count == 0:
+            # Return zero averages if no data matches the filters
+            return {
+                'total_records': self.base_metrics['total_records'],  # Keep total records from base
+                'avg_intensity': 0,
+                'avg_likelihood': 0,
+                'avg_relevance': 0
+            }
+        means = self.stats.rounded_means()
+        return {
+            'total_records': self.base_metrics['total_records'],  # Keep total records from base
+            'avg_intensity': means['intensity'],
+            'avg_likelihood': means['likelihood'],
+            'avg_relevance': means['relevance']
+        }
+
+
+class GroupedScoresAccumulator(Accumulator):
+    """Score statistics per value of one field, groups kept in first-seen order"""
+
+    field = None
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, item):
+        key = item.get(self.field)
+        if key and key != 'Unknown':
+            stats = self.groups.get(key)
+            if stats is None:
+                stats = self.groups[key] = ScoreStats()
+            stats.add(item)
+
+
+class TimeSeriesAccumulator(GroupedScoresAccumulator):
+    """Average intensity, likelihood and relevance per end year"""
+
+    field = 'end_year'
+
+    def result(self):
+        result = []
+        for year, stats in self.groups.items():
+            result.append({'year': year, **stats.rounded_means(), 'count': stats.count})
+        # Sort by year
+        result.sort(key=lambda x: x['year'])
+        return result
+
+
+class GeoAccumulator(GroupedScoresAccumulator):
+    """Average scores and record counts per country"""
+
+    field = 'country'
+
+    def result(self):
+        return [
+            {'country': country, **stats.rounded_means(), 'count': stats.count}
+            for country, stats in self.groups.items()
+        ]
+
+
+class ChartsAccumulator(Accumulator):
+    """Score sums plotted by the standard charts, groups kept in first-seen order"""
+
+    def __init__(self):
+        self.sums = {name: {} for name in CHART_SUMS}
+
+    def add(self, item):
+        for name, (field, score) in CHART_SUMS.items():
+            key = item.get(field)
+            if key and key != 'Unknown':
+                sums = self.sums[name]
+                sums[key] = sums.get(key, 0.0) + safe_float(item.get(score))
+
+    def result(self):
+        return {name: {key: round(total, 2) for key, total in sums.items()} for name, sums in self.sums.items()}
+
+
+class TopicHierarchyAccumulator(Accumulator):
+    """Record counts per sector -> topic -> pestle"""
+
+    def __init__(self):
+        self.hierarchy = {}
+
+    def add(self, item):
+        sector = item.get('sector') or 'Unknown'
+        topic = item.get('topic') or 'Unknown'
+        pestle = item.get('pestle') or 'Unknown'
+
+        # Skip items with all unknown values
+        if sector == 'Unknown' and topic == 'Unknown' and pestle == 'Unknown':
+            return
+
+        pestles = self.hierarchy.setdefault(sector, {}).setdefault(topic, {})
+        pestles[pestle] = pestles.get(pestle, 0) + 1
+
+    def result(self):
+        return hierarchy_to_tree(self.hierarchy)
+
+
+class NetworkAccumulator(Accumulator):
+    """Topic/sector/region nodes and their co-occurrence counts"""
+
+    def __init__(self):
+        self.nodes = []
+        self.node_map = {}
+        self.connections = {}
+
+    def _node(self, name, node_type):
+        index = self.node_map.get(name)
+        if index is None:
+            index = self.node_map[name] = len(self.nodes)
+            self.nodes.append({'id': index, 'name': name, 'type': node_type, 'value': 1})
+        else:
+            self.nodes[index]['value'] += 1
+        return index
+
+    def _connect(self, source, target):
+        key = (source, target)
+        self.connections[key] = self.connections.get(key, 0) + 1
+
+    def add(self, item):
+        topic = item.get('topic')
+        sector = item.get('sector')
+        region = item.get('region')
+
+        # Skip items with missing data
+        if not topic or topic == 'Unknown' or not sector or sector == 'Unknown':
+            return
+
+        topic_id = self._node(topic, 'topic')
+        sector_id = self._node(sector, 'sector')
+        self._connect(topic_id, sector_id)
+        if region and region != 'Unknown':
+            self._connect(sector_id, self._node(region, 'region'))
+
+    def result(self):
+        links = [
+            {'source': source, 'target': target, 'value': weight}
+            for (source, target), weight in self.connections.items()
+        ]
+        return {
+            'nodes': self.nodes,
+            'links': links
+        }
+
+
+class FacetAccumulator(Accumulator):
+    """Value counts per facet field, each conditioned on the filters on the other fields"""
+
+    def __init__(self, filters, fields):
+        self.filters = compile_filters(filters).filters
+        self.fields = fields
+        self.counts = {field: {} for field in fields}
+
+    def add(self, item):
+        failed = [field for field, value in self.filters.items() if not matches(field, item.get(field), value)]
+        if len(failed) > 1:
+            return
+        for field in self.fields:
+            # A row counts for a facet if the only filter it fails is the facet's own
+            if failed and failed[0] != field:
+                continue
+            counts = self.counts[field]
+            value = item.get(field)
+            counts[value] = counts.get(value, 0) + 1
+
+    def result(self):
+        return {field: facet_counts(counts.items()) for field, counts in self.counts.items()}
+
+
+def facet_counts(pairs):
+    """{value: count} for the non-blank values with matches, sorted like get_distinct_values"""
+    values = [(str(value), count) for value, count in pairs if value not in [None, ''] and count > 0]
+    values.sort(key=lambda pair: pair[0].lower())
+    return {value: int(count) for value, count in values}
+
+
+def hierarchy_to_tree(hierarchy):
+    """Convert nested {sector: {topic: {pestle: count}}} mappings to the D3 tree format"""
+    result = {
+        'name': 'Topics',
+        'children': []
+    }
+
+    for sector, topics in hierarchy.items():
+        sector_node = {
+            'name': sector,
+            'children': []
+        }
+
+        for topic, pestles in topics.items():
+            topic_node = {
+                'name': topic,
+                'children': []
+            }
+
+            for pestle, count in pestles.items():
+                topic_node['children'].append({
+                    'name': pestle,
+                    'value': count
+                })
+
+            sector_node['children'].append(topic_node)
+
+        result['children'].append(sector_node)
+
+    return result
+
+
+def scan(data, accumulators):
+    """Drive every accumulator in a single pass over the records.
+
+    Takes a dict of name -> Accumulator and returns name -> result, so any
+    number of views costs one iteration and O(groups) memory.
+    """
+    feeds = [accumulator.add for accumulator in accumulators.values()]
+    for item in data:
+        for add in feeds:
+            add(item)
+    return {name: accumulator.result() for name, accumulator in accumulators.items()}
@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import db
+from .engine import get_engine
+
+DEFAULT_WORKERS = 32
+
+
+class AsyncEngine:
+    """Asyncio front end to the process-wide query engine.
+
+    pymongo blocks, so every call runs on a shared thread pool and awaits
+    its result. The queries of one request can then run side by side with
+    asyncio.gather: a dashboard costs its slowest view instead of the sum
+    of all of them. Synchronous callers such as Flask handlers submit
+    coroutines to one event loop that lives on its own thread for the life
+    of the engine, instead of starting a loop per request. They still wait
+    for the result, so this shortens each dashboard without letting a
+    worker thread serve more of them at once.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, engine=None):
+        self.max_workers = max_workers
+        self._engine = engine
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query')
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def engine(self):
+        return self._engine if self._engine is not None else get_engine()
+
+    @property
+    def loop(self):
+        """Event loop the engine's coroutines run on, started on a daemon thread on first use"""
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='query-loop', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def call(self, coro):
+        """Result of a coroutine run on the engine's loop, for callers that are not async themselves"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def run(self, fn, *args, **kwargs):
+        """Result of a blocking call, run on the query thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def records(self, filters, fields=None):
+        return await self.run(self.engine.records, filters, fields)
+
+    async def columns(self, filters, fields=None):
+        return await self.run(self.engine.columns, filters, fields)
+
+    async def facets(self, filters, fields):
+        return await self.run(self.engine.facets, filters, fields)
+
+    async def base_metrics(self):
+        return await self.run(self.engine.base_metrics)
+
+    async def metrics(self, filters):
+        return await self.run(self.engine.metrics, filters)
+
+    async def timeseries(self, filters):
+        return await self.run(self.engine.timeseries, filters)
+
+    async def network(self, filters):
+        return await self.run(self.engine.network, filters)
+
+    async def geo(self, filters):
+        return await self.run(self.engine.geo, filters)
+
+    async def topic_distribution(self, filters):
+        return await self.run(self.engine.topic_distribution, filters)
+
+    async def charts(self, filters):
+        return await self.run(self.engine.charts, filters)
+
+    async def view(self, view, filters):
+        """One dashboard view; data is the matching rows"""
+        if view == 'data':
+            return await self.records(filters)
+        return await getattr(self, view)(filters)
+
+    def fans_out(self, views):
+        """Whether dashboard() would query these views one by one.
+
+        Only aggregate views that wait on the server are worth splitting.
+        When the rows are requested the engine fetches them once and builds
+        every view from them, which separate queries would undo.
+        """
+        return getattr(self.engine, 'concurrent_queries', False) and 'data' not in views
+
+    async def dashboard(self, filters, views):
+        """Several views for one filter set, queried concurrently when the engine waits on I/O"""
+        engine = self.engine
+        if not self.fans_out(views):
+            return await self.run(engine.dashboard, filters, views)
+        results = await asyncio.gather(*(self.view(view, filters) for view in views))
+        return dict(zip(views, results))
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait=False)
+
+
+# Awaitable versions of the data-access functions in db.py
+
+async def get_all_data(fields=None):
+    return await get_async_engine().run(db.get_all_data, fields)
+
+
+async def get_filtered_data(filters, fields=None):
+    return await get_async_engine().run(db.get_filtered_data, filters, fields)
+
+
+async def get_distinct_values(field):
+    return await get_async_engine().run(db.get_distinct_values, field)
+
+
+async def get_base_metrics():
+    return await get_async_engine().run(db.get_base_metrics)
+
+
+_async_engine = None
+_async_engine_lock = threading.Lock()
+
+
+def configure_async(max_workers=DEFAULT_WORKERS):
+    """Install the process-wide async engine and its query thread pool"""
+    global _async_engine
+    with _async_engine_lock:
+        if _async_engine is not None:
+            _async_engine.close()
+        _async_engine = AsyncEngine(max_workers)
+        return _async_engine
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        with _async_engine_lock:
+            if _async_engine is None:
+                _async_engine = AsyncEngine()
+    return _async_engine
+
+
+def _reset_after_fork():
+    # Pool and loop threads do not survive a fork; start fresh ones in the child
+    global _async_engine, _async_engine_lock
+    _async_engine_lock = threading.Lock()
+    if _async_engine is not None:
+        _async_engine = AsyncEngine(_async_engine.max_workers, _async_engine._engine)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,120 @@
+import numpy as np
+
+# Bits set in every byte value, for popcount by table lookup
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def word_count(size):
+    return (size + 63) // 64
+
+
+def pack(mask):
+    """Pack a boolean row mask into little-endian uint64 words"""
+    packed = np.packbits(mask, bitorder='little')
+    words = np.zeros(word_count(len(mask)) * 8, dtype=np.uint8)
+    words[:len(packed)] = packed
+    return words.view(np.uint64)
+
+
+def unpack(words, size):
+    """Row indices of the set bits in a bitmap covering size rows"""
+    bits = np.unpackbits(words.view(np.uint8), bitorder='little', count=size)
+    return np.flatnonzero(bits)
+
+
+def popcount(words):
+    """Number of set bits in a bitmap"""
+    return int(_POPCOUNT[words.view(np.uint8)].sum(dtype=np.int64))
+
+
+def full(size):
+    """Bitmap with the first size bits set"""
+    return pack(np.ones(size, dtype=bool))
+
+
+def empty(size):
+    return np.zeros(word_count(size), dtype=np.uint64)
+
+
+def intersect(bitmaps, size):
+    """Word-wise AND of bitmaps; no bitmaps means every row"""
+    if not bitmaps:
+        return full(size)
+    result = bitmaps[0].copy()
+    for words in bitmaps[1:]:
+        np.bitwise_and(result, words, out=result)
+    return result
+
+
+def union(bitmaps, size):
+    """Word-wise OR of bitmaps; no bitmaps means no rows"""
+    result = empty(size)
+    for words in bitmaps:
+        np.bitwise_or(result, words, out=result)
+    return result
+
+
+def invert(words, size):
+    """Bitmap of the rows not set in words"""
+    return np.bitwise_and(np.bitwise_not(words), full(size))
+
+
+class BitmapIndex:
+    """Per-value bitmaps over one integer-coded column"""
+
+    def __init__(self):
+        self.size = 0
+        self.bitmaps = {}
+
+    @classmethod
+    def build(cls, codes):
+        index = cls()
+        index.append(codes)
+        return index
+
+    def append(self, codes):
+        """Index rows appended to the end of the column.
+
+        Bitmaps are replaced rather than changed in place, so a copy() taken
+        before the append, or a bitmap mapped from a snapshot, is left as it was.
+        """
+        codes = np.asarray(codes)
+        start, self.size = self.size, self.size + len(codes)
+        words = word_count(self.size)
+
+        if start == 0:
+            # Fresh index: pack each value's mask in one go
+            for code in np.unique(codes).tolist():
+                self.bitmaps[code] = pack(codes == code)
+            return
+
+        positions = np.arange(start, self.size, dtype=np.uint64)
+        grown = {}
+        for code in np.unique(codes).tolist():
+            rows = positions[codes == code]
+            bitmap = np.zeros(words, dtype=np.uint64)
+            previous = self.bitmaps.get(code)
+            if previous is not None:
+                bitmap[:len(previous)] = previous
+            np.bitwise_or.at(bitmap, (rows >> np.uint64(6)).astype(np.intp), np.uint64(1) << (rows & np.uint64(63)))
+            grown[code] = bitmap
+        for code, bitmap in self.bitmaps.items():
+            if code not in grown and len(bitmap) < words:
+                grown[code] = np.concatenate([bitmap, np.zeros(words - len(bitmap), dtype=np.uint64)])
+        self.bitmaps.update(grown)
+
+    def copy(self):
+        """Index sharing this one's bitmaps, which append() never changes in place"""
+        index = BitmapIndex()
+        index.size = self.size
+        index.bitmaps = dict(self.bitmaps)
+        return index
+
+    def get(self, code):
+        """Bitmap of rows holding the code, or an empty bitmap"""
+        bitmap = self.bitmaps.get(code)
+        return bitmap if bitmap is not None else empty(self.size)
+
+    def count(self, code):
+        bitmap = self.bitmaps.get(code)
+        return popcount(bitmap) if bitmap is not None else 0
@@ -0,0 +1,775 @@
+import logging
+import os
+import threading
+from collections import Counter
+import numpy as np
+from . import bitmap
+from .bitmap import BitmapIndex
+from .db import HASH_FIELDS, get_database, get_base_metrics, calculate_base_metrics, current_data_version, get_data_state
+from .engine import encode_page_token, decode_page_token, InvalidPageToken
+from .encoding import columnar_result, encode_column
+from .records import Record
+from .aggregators import CHART_SUMS
+from .views import hierarchy_to_tree, facet_counts
+from .query import canonical_key, compile_filters, matches
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_FIELDS = ['intensity', 'likelihood', 'relevance']
+CATEGORICAL_FIELDS = ['sector', 'topic', 'region', 'country', 'city', 'pestle', 'source']
+
+# Filter fields that get a bitmap per value
+INDEXED_FIELDS = ['end_year', 'topic', 'sector', 'region', 'pestle', 'source', 'country', 'city']
+
+# end_year is stored as an int32 column; -1 stands for 'Unknown'
+UNKNOWN_YEAR = -1
+
+_MISSING = object()
+
+# Record fields plus _id, to track the newest record loaded
+_LOAD_PROJECTION = {field: 0 for field in HASH_FIELDS}
+
+# Operator predicates whose bitmaps are kept for reuse
+PREDICATE_CACHE_SIZE = 256
+
+
+def _parse_year(value):
+    """Map a cleaned end_year string to its integer code, or None if it cannot match"""
+    if value == 'Unknown':
+        return UNKNOWN_YEAR
+    try:
+        year = int(value)
+    except (ValueError, TypeError):
+        return None
+    # Stored years are canonical strings, so '2017.0' or ' 2017' never match
+    return year if str(year) == value else None
+
+
+def _is_known(value):
+    return value is not _MISSING and bool(value) and value != 'Unknown'
+
+
+class Dictionary:
+    """Dictionary encoding of one categorical column: integer codes plus a value table"""
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def encode(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(value)
+        return code
+
+    def copy(self):
+        dictionary = Dictionary()
+        dictionary.values = list(self.values)
+        dictionary.index = dict(self.index)
+        return dictionary
+
+    def code_of(self, value):
+        return self.index.get(value)
+
+    def lookup(self):
+        """Object array of values, for vectorized decoding with codes[idx]"""
+        table = np.empty(len(self.values), dtype=object)
+        table[:] = self.values
+        return table
+
+
+class ColumnarStore:
+    """Read-mostly, in-memory columnar copy of the visualizations collection.
+
+    Scores are float64 columns, end_year is an int32 column and the
+    categorical fields are dictionary-encoded int32 codes. Everything else
+    (title, insight, url, ...) is kept as object columns so rows can be
+    rebuilt exactly as MongoDB returns them. Records are expected to have
+    gone through clean_data().
+
+    The filter fields also carry a bitmap index per value, so an equality
+    filter resolves to an AND of bitmaps instead of a column scan.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.field_order = []
+        self.numeric = {}
+        self.end_year = np.empty(0, dtype=np.int32)
+        self.codes = {}
+        self.dictionaries = {field: Dictionary() for field in CATEGORICAL_FIELDS}
+        self.objects = {}
+        self.indexes = {field: BitmapIndex() for field in INDEXED_FIELDS}
+        # Bitmaps of recently evaluated operator predicates
+        self._predicates = {}
+
+    @classmethod
+    def from_records(cls, records):
+        store = cls()
+        store.append(records)
+        return store
+
+    def copy(self):
+        """Store sharing this one's columns and bitmaps, to append to while this one keeps serving.
+
+        append() replaces columns and bitmaps instead of changing them, so
+        only the containers and the dictionaries are copied.
+        """
+        store = ColumnarStore()
+        store.size = self.size
+        store.field_order = list(self.field_order)
+        store.numeric = dict(self.numeric)
+        store.end_year = self.end_year
+        store.codes = dict(self.codes)
+        store.dictionaries = {field: dictionary.copy() for field, dictionary in self.dictionaries.items()}
+        store.objects = dict(self.objects)
+        store.indexes = {field: index.copy() for field, index in self.indexes.items()}
+        return store
+
+    def append(self, records):
+        """Encode and append records to the columns"""
+        records = list(records)
+        if not records:
+            return
+        count = len(records)
+        for record in records:
+            for field in record:
+                if field not in self.field_order:
+                    self.field_order.append(field)
+
+        for field in NUMERIC_FIELDS:
+            values = np.fromiter(
+                (record.get(field, 0.0) for record in records), dtype=np.float64, count=count
+            )
+            self.numeric[field] = np.concatenate([self.numeric.get(field, np.empty(0)), values])
+
+        years = [_parse_year(record.get('end_year', 'Unknown')) for record in records]
+        years = np.array([UNKNOWN_YEAR if y is None else y for y in years], dtype=np.int32)
+        self.end_year = np.concatenate([self.end_year, years])
+        self.indexes['end_year'].append(years)
+
+        for field in CATEGORICAL_FIELDS:
+            dictionary = self.dictionaries[field]
+            codes = np.fromiter(
+                (dictionary.encode(record.get(field, _MISSING)) for record in records),
+                dtype=np.int32, count=count
+            )
+            self.codes[field] = np.concatenate([self.codes.get(field, np.empty(0, dtype=np.int32)), codes])
+            if field in self.indexes:
+                self.indexes[field].append(codes)
+
+        for field in self.field_order:
+            if field in NUMERIC_FIELDS or field in CATEGORICAL_FIELDS or field == 'end_year':
+                continue
+            values = np.empty(count, dtype=object)
+            values[:] = [record.get(field, _MISSING) for record in records]
+            existing = self.objects.get(field)
+            if existing is None:
+                existing = np.empty(self.size, dtype=object)
+                existing[:] = [_MISSING] * self.size
+            self.objects[field] = np.concatenate([existing, values])
+
+        self.size += count
+        self._predicates = {}
+
+    # Filtering
+
+    def select(self, filters):
+        """Bitmap of the rows matching a conjunction of filters"""
+        plan = compile_filters(filters)
+        return bitmap.intersect([self._bitmap(field, value) for field, value in plan.filters.items()], self.size)
+
+    def indices(self, filters):
+        return bitmap.unpack(self.select(filters), self.size)
+
+    def count(self, filters):
+        return bitmap.popcount(self.select(filters))
+
+    def _bitmap(self, field, value):
+        if isinstance(value, dict):
+            key = canonical_key({field: value})
+            words = self._predicates.get(key)
+            if words is None:
+                if len(self._predicates) >= PREDICATE_CACHE_SIZE:
+                    self._predicates.clear()
+                words = self._predicates[key] = self._predicate_bitmap(field, value)
+            return words
+        index = self.indexes.get(field)
+        if index is None:
+            return bitmap.pack(self._equals(field, value))
+        code = _parse_year(value) if field == 'end_year' else self.dictionaries[field].code_of(value)
+        if code is None:
+            return bitmap.empty(self.size)
+        return index.get(code)
+
+    def _predicate_bitmap(self, field, predicate):
+        """Bitmap of the rows satisfying an operator predicate ($in, $nin, ranges).
+
+        Indexed fields test the predicate once per distinct value and OR the
+        bitmaps of the values that pass, or of those that fail and invert,
+        whichever are fewer. Scores test each distinct score, and other
+        columns each row. A missing value is tested as None, like MongoDB.
+        """
+        index = self.indexes.get(field)
+        if index is not None:
+            if field == 'end_year':
+                values = {code: 'Unknown' if code == UNKNOWN_YEAR else str(code) for code in index.bitmaps}
+            else:
+                dictionary = self.dictionaries[field].values
+                values = {code: None if dictionary[code] is _MISSING else dictionary[code] for code in index.bitmaps}
+            passed = {code for code, value in values.items() if matches(field, value, predicate)}
+            if len(passed) * 2 <= len(values):
+                return bitmap.union([index.get(code) for code in passed], self.size)
+            failed = [code for code in values if code not in passed]
+            return bitmap.invert(bitmap.union([index.get(code) for code in failed], self.size), self.size)
+
+        if field in NUMERIC_FIELDS:
+            scores, inverse = np.unique(self.numeric[field], return_inverse=True)
+            passed = np.array([matches(field, score, predicate) for score in scores.tolist()], dtype=bool)
+            return bitmap.pack(passed[inverse.reshape(-1)])
+        if field in self.objects:
+            mask = np.fromiter(
+                (matches(field, None if value is _MISSING else value, predicate) for value in self.objects[field]),
+                dtype=bool, count=self.size
+            )
+            return bitmap.pack(mask)
+        # A field no record has matches everywhere or nowhere
+        return bitmap.full(self.size) if matches(field, None, predicate) else bitmap.empty(self.size)
+
+    def _equals(self, field, value):
+        if field in CATEGORICAL_FIELDS:
+            code = self.dictionaries[field].code_of(value)
+            if code is None:
+                return np.zeros(self.size, dtype=bool)
+            return self.codes[field] == code
+        if field == 'end_year':
+            year = _parse_year(value)
+            if year is None:
+                return np.zeros(self.size, dtype=bool)
+            return self.end_year == year
+        if field in self.objects:
+            return np.asarray(self.objects[field]) == value
+        # Scores are stored as floats, so string filter values never match them,
+        # and unknown fields match nothing, exactly as in MongoDB
+        return np.zeros(self.size, dtype=bool)
+
+    # Decoding
+
+    def decode(self, field, idx):
+        """Values of a column for the given row indices, as Python objects"""
+        if field in NUMERIC_FIELDS:
+            return self.numeric[field][idx].tolist()
+        if field in CATEGORICAL_FIELDS:
+            return self.dictionaries[field].lookup()[self.codes[field][idx]].tolist()
+        if field == 'end_year':
+            return ['Unknown' if y == UNKNOWN_YEAR else str(y) for y in self.end_year[idx].tolist()]
+        return self.objects[field][idx].tolist()
+
+    def rows(self, idx, fields=None):
+        """Rebuild the records at the given row indices, optionally only some fields.
+
+        Categorical values come from the dictionaries, so every row shares
+        one copy of each string.
+        """
+        columns = [(field, self.decode(field, idx)) for field in self.field_order if fields is None or field in fields]
+        return Record.from_columns(columns, len(idx), _MISSING)
+
+    def columns(self, idx, fields=None):
+        """The records at the given row indices in columnar form, as encoding.encode_columns builds it.
+
+        Categorical columns are re-coded straight from their dictionary
+        codes instead of decoding every value first.
+        """
+        if fields is None:
+            fields = [field for field in self.field_order if self._present(field, idx)]
+        return columnar_result(len(idx), fields, [self._column(field, idx) for field in fields])
+
+    def _present(self, field, idx):
+        """Whether any of the given rows has the field"""
+        if field in CATEGORICAL_FIELDS:
+            missing = self.dictionaries[field].code_of(_MISSING)
+            return bool(len(idx)) and (missing is None or bool((self.codes[field][idx] != missing).any()))
+        if field in self.objects:
+            return any(value is not _MISSING for value in self.objects[field][idx].tolist())
+        return bool(len(idx))
+
+    def _column(self, field, idx):
+        if field not in self.field_order:
+            return encode_column([None] * len(idx))
+        if field in CATEGORICAL_FIELDS:
+            values = self.dictionaries[field].values
+            codes, first, inverse = np.unique(self.codes[field][idx], return_index=True, return_inverse=True)
+            names = [None if values[code] is _MISSING else values[code] for code in codes.tolist()]
+            known = [i for i, name in enumerate(names) if name is not None]
+            if all(isinstance(names[i], str) for i in known) and known and len(known) * 2 <= len(idx):
+                # Dictionary order is the order values first appear in the rows
+                order = sorted(known, key=lambda i: first[i])
+                rank = np.full(len(codes), -1, dtype=np.int64)
+                rank[order] = np.arange(len(order))
+                column = rank[inverse.reshape(-1)].tolist()
+                if len(known) < len(codes):
+                    column = [None if code < 0 else code for code in column]
+                return column, [names[i] for i in order]
+        return encode_column([None if value is _MISSING else value for value in self.decode(field, idx)])
+
+    def distinct(self, field):
+        if field in CATEGORICAL_FIELDS:
+            values = self.dictionaries[field].values
+        elif field == 'end_year':
+            values = ['Unknown' if y == UNKNOWN_YEAR else str(y) for y in np.unique(self.end_year).tolist()]
+        elif field in NUMERIC_FIELDS:
+            values = np.unique(self.numeric[field]).tolist()
+        elif field in self.objects:
+            values = list(dict.fromkeys(self.objects[field].tolist()))
+        else:
+            values = []
+        values = [v for v in values if v is not _MISSING and v not in [None, '']]
+        return sorted([str(v) for v in values], key=lambda x: x.lower())
+
+    def facets(self, filters, fields):
+        """{field: {value: count}} for each field over the rows matching the other fields' filters"""
+        selected = {field: self._bitmap(field, value) for field, value in compile_filters(filters).filters.items()}
+        result = {}
+        for field in fields:
+            others = [words for other, words in selected.items() if other != field]
+            idx = bitmap.unpack(bitmap.intersect(others, self.size), self.size)
+            if field in CATEGORICAL_FIELDS:
+                values = self.dictionaries[field].values
+                counts = np.bincount(self.codes[field][idx], minlength=len(values)).tolist()
+                pairs = [(value, count) for value, count in zip(values, counts) if value is not _MISSING]
+            elif field == 'end_year':
+                years, counts = np.unique(self.end_year[idx], return_counts=True)
+                pairs = [('Unknown' if year == UNKNOWN_YEAR else year, count) for year, count in zip(years.tolist(), counts.tolist())]
+            elif field in NUMERIC_FIELDS or field in self.objects:
+                pairs = Counter(value for value in self.decode(field, idx) if value is not _MISSING).items()
+            else:
+                pairs = []
+            result[field] = facet_counts(pairs)
+        return result
+
+    def known_codes(self, field):
+        """Boolean table over a dictionary: which codes hold a real (non-Unknown) value"""
+        return np.array([_is_known(v) for v in self.dictionaries[field].values], dtype=bool)
+
+
+def _first_seen_groups(keys):
+    """Unique keys ordered by first appearance, with inverse indices and counts"""
+    uniq, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return uniq[order], rank[inverse.reshape(-1)], counts[order]
+
+
+class ColumnarEngine:
+    """Query engine that answers every endpoint from an in-memory ColumnarStore.
+
+    The collection is loaded once on first use; filters become vectorized
+    masks and group-bys become bincounts. Results are identical to the
+    MongoEngine for data loaded through init_db(). When the dataset
+    version changes because records were only inserted, they are appended
+    to the columns and bitmap indexes; any other change reloads the copy.
+
+    With a snapshot_path the copy is memory-mapped from that snapshot file
+    when it holds the current dataset version. Otherwise it is loaded from
+    MongoDB and the snapshot rewritten for the next start.
+    """
+
+    name = 'columnar'
+
+    # Queries run in Python and NumPy under the GIL, so splitting a
+    # dashboard across threads would not make it faster
+    concurrent_queries = False
+
+    def __init__(self, store=None, version_check_interval=5.0, snapshot_path=None):
+        self._store = store
+        self._version = None
+        self._rewrites = None
+        self._last_id = None
+        self._base_metrics = None
+        self._lock = threading.Lock()
+        self.version_check_interval = version_check_interval
+        self.snapshot_path = snapshot_path
+
+    @property
+    def store(self):
+        if self._store is not None and self._version is not None:
+            if current_data_version(self.version_check_interval) != self._version:
+                self._refresh()
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._load()
+        return self._store
+
+    def _load(self):
+        db = get_database()
+        state = get_data_state()
+        self._version, self._rewrites = state['version'], state['rewrites']
+        self._last_id = None
+        store = self._load_snapshot() if self.snapshot_path else None
+        if store is None:
+            store = ColumnarStore.from_records(self._without_ids(db.visualizations.find({}, _LOAD_PROJECTION)))
+            logger.info(f"Loaded {store.size} records into the columnar engine")
+            if self.snapshot_path:
+                self._write_snapshot(store)
+        else:
+            last = db.visualizations.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+            self._last_id = last['_id'] if last else None
+        self._base_metrics = get_base_metrics() or None
+        self._store = store
+
+    def _without_ids(self, documents):
+        """Records without their _id, remembering the highest _id seen"""
+        for document in documents:
+            _id = document.pop('_id')
+            if self._last_id is None or _id > self._last_id:
+                self._last_id = _id
+            yield document
+
+    def _refresh(self):
+        """Catch up with a new dataset version, appending the new records when nothing else changed"""
+        with self._lock:
+            if self._store is None:
+                return
+            state = get_data_state()
+            if state['version'] == self._version:
+                return
+            if state['rewrites'] != self._rewrites or self._last_id is None:
+                logger.info("Dataset version changed, reloading the columnar engine")
+                self._store = None
+                self._base_metrics = None
+                return
+            try:
+                # Natural order, as the collection returns rows to the MongoEngine
+                documents = get_database().visualizations.find({'_id': {'$gt': self._last_id}}, _LOAD_PROJECTION).hint([('$natural', 1)])
+                self._append(self._without_ids(documents), state['version'])
+            except Exception as e:
+                logger.error(f"Error appending new records, reloading the columnar engine: {str(e)}")
+                self._store = None
+                self._base_metrics = None
+
+    def _load_snapshot(self):
+        """The store mapped from the snapshot file, or None if it is missing or stale"""
+        from .snapshot import load_snapshot
+        if not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            store, version = load_snapshot(self.snapshot_path)
+        except Exception as e:
+            logger.error(f"Error loading snapshot {self.snapshot_path}: {str(e)}")
+            return None
+        if version != self._version:
+            logger.info(f"Snapshot {self.snapshot_path} holds dataset version {version}, not {self._version}; ignoring it")
+            return None
+        logger.info(f"Mapped {store.size} records from snapshot {self.snapshot_path} into the columnar engine")
+        return store
+
+    def _write_snapshot(self, store):
+        from .snapshot import write_snapshot
+        try:
+            write_snapshot(store, self.snapshot_path, self._version)
+        except Exception as e:
+            logger.error(f"Error writing snapshot {self.snapshot_path}: {str(e)}")
+
+    def append(self, records, version=None):
+        """Add newly inserted records to the columns and bitmap indexes, optionally as of a dataset version"""
+        with self._lock:
+            if self._store is not None:
+                self._append(records, version)
+
+    def _append(self, records, version):
+        # The records go into a copy of the store that replaces it once they
+        # are all in, so queries running meanwhile keep a consistent view
+        store = self._store.copy()
+        store.append(records)
+        logger.info(f"Appended {store.size - self._store.size} records to the columnar engine")
+        self._base_metrics = None
+        self._store = store
+        if version is not None:
+            # The store now holds exactly that version: its rollups and snapshot apply
+            self._version = version
+            self._base_metrics = get_base_metrics() or None
+            if self.snapshot_path:
+                self._write_snapshot(store)
+
+    def reload(self):
+        """Drop the in-memory copy so the next query reloads it"""
+        with self._lock:
+            self._store = None
+            self._base_metrics = None
+
+    def warm(self):
+        """Load the in-memory copy now rather than on the first request"""
+        self.base_metrics()
+
+    def records(self, filters, fields=None):
+        store = self.store
+        return store.rows(store.indices(filters), fields)
+
+    def columns(self, filters, fields=None):
+        """Matching rows in columnar form, without building them as dicts"""
+        store = self.store
+        return store.columns(store.indices(filters), fields)
+
+    def iter_records(self, filters, batch_size=1000, fields=None):
+        """Matching rows decoded batch_size at a time"""
+        store = self.store
+        idx = store.indices(filters)
+        for start in range(0, len(idx), batch_size):
+            yield from store.rows(idx[start:start + batch_size], fields)
+
+    def page(self, filters, limit, after=None, fields=None):
+        """One page of matching rows in load order, plus the token for the next page.
+
+        Tokens hold the position of the last row returned, which is stable
+        for as long as this copy of the dataset is loaded.
+        """
+        store = self.store
+        idx = store.indices(filters)
+        if after is not None:
+            row = decode_page_token(after, 'row')
+            if not isinstance(row, int):
+                raise InvalidPageToken("Malformed pagination token")
+            idx = idx[np.searchsorted(idx, row, side='right'):]
+
+        next_token = encode_page_token('row', int(idx[limit - 1])) if len(idx) > limit else None
+        return store.rows(idx[:limit], fields), next_token
+
+    def distinct(self, field):
+        return self.store.distinct(field)
+
+    def facets(self, filters, fields):
+        return self.store.facets(filters, fields)
+
+    def base_metrics(self):
+        store = self.store
+        if not self._base_metrics:
+            self._base_metrics = calculate_base_metrics(store.rows(np.arange(store.size)))
+        return self._base_metrics
+
+    def metrics(self, filters):
+        base_metrics = self.base_metrics()
+        if not filters:
+            return base_metrics
+
+        # The popcount answers the empty case without touching any rows
+        store = self.store
+        selection = store.select(filters)
+        if bitmap.popcount(selection) == 0:
+            return self._metrics(store, np.empty(0, dtype=np.intp), base_metrics)
+        return self._metrics(store, bitmap.unpack(selection, store.size), base_metrics)
+
+    def _metrics(self, store, idx, base_metrics):
+        count = len(idx)
+        if count == 0:
+            return {
+                'total_records': base_metrics['total_records'],
+                'avg_intensity': 0,
+                'avg_likelihood': 0,
+                'avg_relevance': 0
+            }
+        result = {'total_records': base_metrics['total_records']}
+        for field in NUMERIC_FIELDS:
+            result[f'avg_{field}'] = round(float(store.numeric[field][idx].sum()) / count, 2)
+        return result
+
+    def _grouped_averages(self, store, idx, keys):
+        """Per-group counts and rounded score averages, groups in first-seen order"""
+        groups, inverse, counts = _first_seen_groups(keys)
+        averages = {}
+        for field in NUMERIC_FIELDS:
+            sums = np.bincount(inverse, weights=store.numeric[field][idx], minlength=len(groups))
+            averages[field] = [round(s / c, 2) for s, c in zip(sums.tolist(), counts.tolist())]
+        return groups.tolist(), averages, counts.tolist()
+
+    def timeseries(self, filters):
+        store = self.store
+        return self._timeseries(store, store.indices(filters))
+
+    def _timeseries(self, store, idx):
+        idx = idx[store.end_year[idx] != UNKNOWN_YEAR]
+        years, averages, counts = self._grouped_averages(store, idx, store.end_year[idx])
+
+        result = []
+        for i, year in enumerate(years):
+            result.append({
+                'year': str(year),
+                'intensity': averages['intensity'][i],
+                'likelihood': averages['likelihood'][i],
+                'relevance': averages['relevance'][i],
+                'count': counts[i]
+            })
+        result.sort(key=lambda x: x['year'])
+        return result
+
+    def geo(self, filters):
+        store = self.store
+        return self._geo(store, store.indices(filters))
+
+    def _geo(self, store, idx):
+        codes = store.codes['country']
+        idx = idx[store.known_codes('country')[codes[idx]]]
+        countries, averages, counts = self._grouped_averages(store, idx, codes[idx])
+
+        names = store.dictionaries['country'].values
+        result = []
+        for i, code in enumerate(countries):
+            result.append({
+                'country': names[code],
+                'intensity': averages['intensity'][i],
+                'likelihood': averages['likelihood'][i],
+                'relevance': averages['relevance'][i],
+                'count': counts[i]
+            })
+        return result
+
+    def charts(self, filters):
+        store = self.store
+        return self._charts(store, store.indices(filters))
+
+    def _charts(self, store, idx):
+        result = {}
+        for name, (field, score) in CHART_SUMS.items():
+            if field == 'end_year':
+                rows = idx[store.end_year[idx] != UNKNOWN_YEAR]
+                keys, names = store.end_year[rows], None
+            else:
+                codes = store.codes[field]
+                rows = idx[store.known_codes(field)[codes[idx]]]
+                keys, names = codes[rows], store.dictionaries[field].values
+            groups, inverse, _ = _first_seen_groups(keys)
+            sums = np.bincount(inverse, weights=store.numeric[score][rows], minlength=len(groups))
+            result[name] = {
+                (str(key) if names is None else names[key]): round(total, 2)
+                for key, total in zip(groups.tolist(), sums.tolist())
+            }
+        return result
+
+    def _names(self, store, field, idx):
+        """Codes of the given rows remapped so that blank values collapse into 'Unknown', plus the name table"""
+        dictionary = Dictionary()
+        remap = np.array(
+            [dictionary.encode((None if v is _MISSING else v) or 'Unknown') for v in store.dictionaries[field].values],
+            dtype=np.int64
+        )
+        return remap[store.codes[field][idx]], dictionary.values
+
+    def topic_distribution(self, filters):
+        store = self.store
+        return self._topic_distribution(store, store.indices(filters))
+
+    def _topic_distribution(self, store, idx):
+        fields = ['sector', 'topic', 'pestle']
+        codes, names = [], []
+        for field in fields:
+            field_codes, field_names = self._names(store, field, idx)
+            codes.append(field_codes)
+            names.append(field_names)
+
+        # Skip items with all unknown values
+        unknown = [n.index('Unknown') if 'Unknown' in n else -1 for n in names]
+        keep = ~((codes[0] == unknown[0]) & (codes[1] == unknown[1]) & (codes[2] == unknown[2]))
+        codes = [c[keep] for c in codes]
+
+        sizes = [len(n) for n in names]
+        keys = (codes[0] * sizes[1] + codes[1]) * sizes[2] + codes[2]
+        triples, _, counts = _first_seen_groups(keys)
+
+        hierarchy = {}
+        for key, count in zip(triples.tolist(), counts.tolist()):
+            key, pestle = divmod(key, sizes[2])
+            sector, topic = divmod(key, sizes[1])
+            topics = hierarchy.setdefault(names[0][sector], {})
+            topics.setdefault(names[1][topic], {})[names[2][pestle]] = count
+        return hierarchy_to_tree(hierarchy)
+
+    def network(self, filters):
+        store = self.store
+        return self._network(store, store.indices(filters))
+
+    def _network(self, store, idx):
+        # Nodes are keyed by name across all three fields, as in the Python path
+        vocabulary = Dictionary()
+        global_ids = {}
+        for field in ['topic', 'sector', 'region']:
+            global_ids[field] = np.array(
+                [vocabulary.encode(v) for v in store.dictionaries[field].values], dtype=np.int64
+            )
+
+        topic = store.codes['topic'][idx]
+        sector = store.codes['sector'][idx]
+        region = store.codes['region'][idx]
+        keep = store.known_codes('topic')[topic] & store.known_codes('sector')[sector]
+        topic, sector, region = topic[keep], sector[keep], region[keep]
+        has_region = store.known_codes('region')[region]
+
+        # Occurrence sequence in visiting order: topic, sector, then region if known
+        sequence = np.stack([
+            global_ids['topic'][topic],
+            global_ids['sector'][sector],
+            np.where(has_region, global_ids['region'][region], -1)
+        ], axis=1).reshape(-1)
+        types = np.tile(np.arange(3), len(topic))
+        valid = sequence >= 0
+        sequence, types = sequence[valid], types[valid]
+
+        node_keys, node_ids, node_counts = _first_seen_groups(sequence)
+        _, first = np.unique(node_ids, return_index=True)
+        type_names = ['topic', 'sector', 'region']
+        nodes = []
+        for i, (key, count) in enumerate(zip(node_keys.tolist(), node_counts.tolist())):
+            nodes.append({
+                'id': i,
+                'name': vocabulary.values[key],
+                'type': type_names[types[first[i]]],
+                'value': count
+            })
+
+        # Links in visiting order: topic-sector, then sector-region if known
+        ids = np.full(len(valid), -1, dtype=np.int64)
+        ids[valid] = node_ids
+        ids = ids.reshape(-1, 3)
+        sources = np.stack([ids[:, 0], ids[:, 1]], axis=1).reshape(-1)
+        targets = np.stack([ids[:, 1], ids[:, 2]], axis=1).reshape(-1)
+        valid_links = targets >= 0
+        sources, targets = sources[valid_links], targets[valid_links]
+
+        pairs, _, weights = _first_seen_groups(sources * max(len(nodes), 1) + targets)
+        links = []
+        for pair, weight in zip(pairs.tolist(), weights.tolist()):
+            source, target = divmod(pair, max(len(nodes), 1))
+            links.append({
+                'source': source,
+                'target': target,
+                'value': weight
+            })
+
+        return {
+            'nodes': nodes,
+            'links': links
+        }
+
+    def dashboard(self, filters, views):
+        """Several views for one filter set, resolving the filter bitmap once"""
+        store = self.store
+        idx = store.indices(filters)
+        result = {}
+        if 'data' in views:
+            result['data'] = store.rows(idx)
+        if 'metrics' in views:
+            base_metrics = self.base_metrics()
+            result['metrics'] = self._metrics(store, idx, base_metrics) if filters else base_metrics
+        if 'timeseries' in views:
+            result['timeseries'] = self._timeseries(store, idx)
+        if 'geo' in views:
+            result['geo'] = self._geo(store, idx)
+        if 'topic_distribution' in views:
+            result['topic_distribution'] = self._topic_distribution(store, idx)
+        if 'network' in views:
+            result['network'] = self._network(store, idx)
+        if 'charts' in views:
+            result['charts'] = self._charts(store, idx)
+        return result
@@ -0,0 +1,264 @@
+import argparse
+import json
+import logging
+import os
+import time
+from itertools import combinations
+from bson import ObjectId
+from .db import get_database, get_data_version
+from .query import compile_filters, matches
+from . import pipelines
+
+logger = logging.getLogger(__name__)
+
+SCORE_FIELDS = ['intensity', 'likelihood', 'relevance']
+
+# Low-cardinality dimensions most dashboard filters use, for metrics and
+# the timeseries, plus smaller cuboids with the extra grouping fields of
+# the geo and topic views. High-cardinality fields such as source and city
+# are left out: with them nearly every record is a cell of its own, and
+# the cube would cost as much to scan as the records.
+CUBE_DIMENSIONS = ('end_year', 'sector', 'region', 'pestle')
+DEFAULT_CUBOIDS = [
+    CUBE_DIMENSIONS,
+    ('end_year', 'region', 'country'),
+    ('sector', 'region', 'country'),
+    ('end_year', 'sector', 'topic', 'pestle'),
+]
+
+# Fields each view groups by on top of the filtered ones
+VIEW_FIELDS = {
+    'metrics': (),
+    'timeseries': ('end_year',),
+    'geo': ('country',),
+    'topic_distribution': ('sector', 'topic', 'pestle'),
+}
+
+# Filter fields the coverage report enumerates
+REPORT_FILTER_FIELDS = ['end_year', 'sector', 'topic', 'region', 'country', 'city', 'pestle', 'source']
+
+_BLANK = [None, '', 'Unknown']
+
+
+def parse_cuboids(spec):
+    """Cuboids from a spec like 'end_year,sector;region,country'; blank means the defaults"""
+    if not spec:
+        return list(DEFAULT_CUBOIDS)
+    return [tuple(field.strip() for field in group.split(',') if field.strip()) for group in spec.split(';') if group.strip()]
+
+
+def cuboid_name(dims):
+    return '+'.join(dims)
+
+
+class Cube:
+    """In-memory copy of the pre-aggregated cells, answering covered view requests.
+
+    Each cell holds the count, score sums and first _id of the records
+    sharing one combination of its cuboid's dimension values, so a view
+    request costs one pass over the cells of the smallest covering cuboid.
+    """
+
+    def __init__(self, version, cuboids):
+        self.version = version
+        # dims -> list of (key, count, intensity, likelihood, relevance, first)
+        self.cuboids = cuboids
+        # (view, filtered fields) -> covering cuboid, or None
+        self._lookups = {}
+
+    @classmethod
+    def load(cls, db=None, attempts=3):
+        """The stored cube, or None if it was never built.
+
+        Only the cells of the build the cube metadata points at are read.
+        If a newer build replaces them mid-read, fewer cells come back than
+        the metadata lists and the load starts over.
+        """
+        db = db if db is not None else get_database()
+        for _ in range(attempts):
+            meta = db['meta'].find_one({'_id': 'cube'})
+            if not meta:
+                return None
+            cuboids = {tuple(dims): [] for dims in meta['cuboids']}
+            names = {cuboid_name(dims): dims for dims in cuboids}
+            loaded = 0
+            for doc in db['cube'].find({'build': meta.get('build')}, {'_id': 0}):
+                loaded += 1
+                dims = names.get(doc['cuboid'])
+                if dims is not None:
+                    cuboids[dims].append((
+                        doc['key'], doc['count'],
+                        doc['intensity'], doc['likelihood'], doc['relevance'],
+                        doc['first'],
+                    ))
+            if loaded == meta.get('cells', loaded):
+                return cls(meta['version'], cuboids)
+        logger.warning("The cube was rebuilt while it was being read; answering from the pipelines for now")
+        return None
+
+    @property
+    def cells(self):
+        return sum(len(cells) for cells in self.cuboids.values())
+
+    def cuboid_for(self, view, filters):
+        """Smallest cuboid holding every filtered and grouped field, or None"""
+        fields = frozenset(filters)
+        lookup = (view, fields)
+        if lookup not in self._lookups:
+            needed = fields | set(VIEW_FIELDS[view])
+            covering = [dims for dims in self.cuboids if needed <= set(dims)]
+            self._lookups[lookup] = min(covering, key=lambda dims: len(self.cuboids[dims])) if covering else None
+        return self._lookups[lookup]
+
+    def answer(self, view, filters, base_metrics=None):
+        """The view's result computed from the cube, or None if the filters are not covered"""
+        plan = compile_filters(filters)
+        dims = self.cuboid_for(view, plan.fields)
+        if dims is None:
+            return None
+        cells = [cell for cell in self.cuboids[dims] if all(matches(field, cell[0].get(field), value) for field, value in plan.filters.items())]
+
+        if view == 'metrics':
+            return pipelines.metrics_result([_combine(cells)] if cells else [], base_metrics)
+        if view == 'timeseries':
+            return pipelines.timeseries_result(_grouped(cells, lambda key: key.get('end_year')))
+        if view == 'geo':
+            return pipelines.geo_result(_grouped(cells, lambda key: key.get('country')))
+        if view == 'topic_distribution':
+            return pipelines.topic_distribution_result(_grouped(cells, _topic_key))
+        return None
+
+
+def _or_unknown(value):
+    return 'Unknown' if value in [None, ''] else value
+
+
+def _topic_key(key):
+    group = {field: _or_unknown(key.get(field)) for field in ['sector', 'topic', 'pestle']}
+    if all(value == 'Unknown' for value in group.values()):
+        return None
+    return group
+
+
+def _combine(cells):
+    group = {'count': 0, 'intensity': 0, 'likelihood': 0, 'relevance': 0}
+    for _, count, intensity, likelihood, relevance, _ in cells:
+        group['count'] += count
+        group['intensity'] += intensity
+        group['likelihood'] += likelihood
+        group['relevance'] += relevance
+    return group
+
+
+def _grouped(cells, group_key):
+    """Cells merged per group key in pipeline result shape, ordered by first record"""
+    groups = {}
+    for cell in cells:
+        key = group_key(cell[0])
+        if key is None or key in _BLANK:
+            continue
+        marker = json.dumps(key, sort_keys=True) if isinstance(key, dict) else key
+        group = groups.get(marker)
+        if group is None:
+            group = groups[marker] = {'_id': key, 'count': 0, 'intensity': 0, 'likelihood': 0, 'relevance': 0, 'first': cell[5]}
+        group['count'] += cell[1]
+        group['intensity'] += cell[2]
+        group['likelihood'] += cell[3]
+        group['relevance'] += cell[4]
+        group['first'] = min(group['first'], cell[5])
+    return sorted(groups.values(), key=lambda group: group['first'])
+
+
+def build_cube(cuboids=None, collection=None):
+    """Recompute every cuboid with one $group each and store the cells in the cube collection.
+
+    The cube is stamped with the dataset version read before the build,
+    so a load racing with it leaves the cube stale rather than wrong. The
+    new cells carry a build id that the metadata switches to once they are
+    all written, so readers never see a half-built cube; the previous
+    build's cells are removed after the switch.
+    """
+    db = get_database()
+    collection = collection if collection is not None else db['visualizations']
+    cuboids = cuboids if cuboids is not None else parse_cuboids(os.getenv('CUBE_CUBOIDS'))
+    version = get_data_version()
+    build = str(ObjectId())
+    started = time.perf_counter()
+
+    sums = {'count': {'$sum': 1}, **{field: {'$sum': f'${field}'} for field in SCORE_FIELDS}}
+    sizes = {}
+    for dims in cuboids:
+        pipeline = [{'$group': {'_id': {field: f'${field}' for field in dims}, 'first': {'$min': '$_id'}, **sums}}]
+        cells = [
+            {'build': build, 'cuboid': cuboid_name(dims), 'key': {field: group['_id'].get(field) for field in dims},
+             **{name: group[name] for name in ['count'] + SCORE_FIELDS}, 'first': group['first']}
+            for group in collection.aggregate(pipeline, allowDiskUse=True)
+        ]
+        if cells:
+            db['cube'].insert_many(cells)
+        sizes[cuboid_name(dims)] = len(cells)
+
+    db['meta'].replace_one(
+        {'_id': 'cube'},
+        {'_id': 'cube', 'version': version, 'build': build, 'cuboids': [list(dims) for dims in cuboids], 'cells': sum(sizes.values())},
+        upsert=True
+    )
+    db['cube'].delete_many({'build': {'$ne': build}})
+    logger.info(f"Built cube with {sum(sizes.values())} cells at dataset version {version} in {time.perf_counter() - started:.2f}s")
+    return sizes
+
+
+def ensure_cube(collection=None):
+    """Build the cube if it is missing or older than the data"""
+    meta = get_database()['meta'].find_one({'_id': 'cube'})
+    if meta is None or meta['version'] != get_data_version():
+        build_cube(parse_cuboids(os.getenv('CUBE_CUBOIDS')) if meta is None else [tuple(dims) for dims in meta['cuboids']], collection)
+
+
+def refresh_cube(collection=None):
+    """Rebuild a previously built cube that is older than the data; a cube that was never built stays unbuilt"""
+    meta = get_database()['meta'].find_one({'_id': 'cube'})
+    if meta is not None and meta['version'] != get_data_version():
+        build_cube([tuple(dims) for dims in meta['cuboids']], collection)
+
+
+def coverage_report(cube, rows, max_filters=2):
+    """Cube size and which filter combinations of up to max_filters fields each view can answer"""
+    filter_sets = [combo for size in range(max_filters + 1) for combo in combinations(REPORT_FILTER_FIELDS, size)]
+    coverage = {}
+    for view in VIEW_FIELDS:
+        uncovered = [list(combo) for combo in filter_sets if cube.cuboid_for(view, dict.fromkeys(combo, '')) is None]
+        coverage[view] = {
+            'covered': len(filter_sets) - len(uncovered),
+            'total': len(filter_sets),
+            'uncovered': uncovered,
+        }
+    return {
+        'version': cube.version,
+        'rows': rows,
+        'cells': cube.cells,
+        'cells_per_row': round(cube.cells / rows, 4) if rows else 0,
+        'cuboids': {cuboid_name(dims): len(cells) for dims, cells in cube.cuboids.items()},
+        'coverage': coverage,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the pre-aggregated cube and report its size and coverage')
+    parser.add_argument('--cuboids', default=os.getenv('CUBE_CUBOIDS'), help="';'-separated cuboids of ','-separated fields")
+    parser.add_argument('--report-only', action='store_true', help='report on the stored cube without rebuilding it')
+    args = parser.parse_args()
+
+    if not args.report_only:
+        build_cube(parse_cuboids(args.cuboids))
+    cube = Cube.load()
+    if cube is None:
+        logger.error("No cube has been built")
+        return 1
+    rows = get_database()['visualizations'].estimated_document_count()
+    print(json.dumps(coverage_report(cube, rows), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
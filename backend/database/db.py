@@ -1,9 +1,14 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+import atexit
 import json
 import os
 from dotenv import load_dotenv
 import logging
+import threading
+import time
 from pathlib import Path
+from .query import compile_filters
+from .records import records_from
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +17,10 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Bookkeeping fields written by incremental ingestion, never returned to clients
+HASH_FIELDS = ['record_key', 'content_hash']
+RECORD_PROJECTION = {'_id': 0, **{field: 0 for field in HASH_FIELDS}}
+
 def clean_data(data):
     """Clean the data before inserting into MongoDB"""
     cleaned = []
@@ -44,19 +53,178 @@ def clean_data(data):
         cleaned.append(item)
     return cleaned
 
+class ConnectionManager:
+    """Process-wide owner of the pooled MongoClient.
+
+    The client is created lazily on first use and shared by every helper in
+    this module. It is recreated after a fork so pre-forked workers never
+    reuse sockets inherited from the parent, and a background thread pings
+    the server periodically instead of every call paying for a ping.
+    """
+
+    def __init__(self, uri, db_name='visualization_db', max_pool_size=50, min_pool_size=0,
+                 max_idle_time_ms=60000, connect_timeout_ms=5000, server_selection_timeout_ms=5000,
+                 socket_timeout_ms=30000, wait_queue_timeout_ms=5000, health_check_interval=30):
+        self.uri = uri
+        self.db_name = db_name
+        self.client_options = {
+            'maxPoolSize': max_pool_size,
+            'minPoolSize': min_pool_size,
+            'maxIdleTimeMS': max_idle_time_ms,
+            'connectTimeoutMS': connect_timeout_ms,
+            'serverSelectionTimeoutMS': server_selection_timeout_ms,
+            'socketTimeoutMS': socket_timeout_ms,
+            'waitQueueTimeoutMS': wait_queue_timeout_ms,
+        }
+        self.health_check_interval = health_check_interval
+        self.healthy = None
+        self.last_health_check = None
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self._stop_event = threading.Event()
+        self._health_thread = None
+
+    @property
+    def client(self):
+        """Return the shared MongoClient, creating it for this process if needed"""
+        pid = os.getpid()
+        if self._client is None or self._pid != pid:
+            with self._lock:
+                if self._client is None or self._pid != pid:
+                    self._client = self._create_client()
+                    self._pid = pid
+                    self._start_health_checks()
+        return self._client
+
+    @property
+    def database(self):
+        return self.client[self.db_name]
+
+    def _create_client(self):
+        if not self.uri:
+            raise ValueError("MongoDB Atlas connection string (DB_CONNECTION_STRING) not found in environment variables")
+
+        client = MongoClient(self.uri, **self.client_options)
+        # Test connection once per process; later checks run in the background
+        client.admin.command('ping')
+        self.healthy = True
+        self.last_health_check = time.time()
+        logger.info(f"Successfully connected to MongoDB Atlas (pid {os.getpid()}, maxPoolSize {self.client_options['maxPoolSize']})")
+        return client
+
+    def _start_health_checks(self):
+        if not self.health_check_interval or self.health_check_interval <= 0:
+            return
+        self._stop_event = threading.Event()
+        self._health_thread = threading.Thread(
+            target=self._health_check_loop,
+            args=(self._client, self._stop_event),
+            name='mongo-health-check',
+            daemon=True
+        )
+        self._health_thread.start()
+
+    def _health_check_loop(self, client, stop_event):
+        while not stop_event.wait(self.health_check_interval):
+            try:
+                client.admin.command('ping')
+                if not self.healthy:
+                    logger.info("MongoDB connection is healthy again")
+                self.healthy = True
+            except Exception as e:
+                if self.healthy is not False:
+                    logger.error(f"MongoDB health check failed: {str(e)}")
+                self.healthy = False
+            self.last_health_check = time.time()
+
+    def status(self):
+        """Summarize the connection state for health reporting"""
+        return {
+            'connected': self._client is not None and self._pid == os.getpid(),
+            'healthy': self.healthy,
+            'last_health_check': self.last_health_check,
+            'pid': os.getpid(),
+            'max_pool_size': self.client_options['maxPoolSize'],
+        }
+
+    def reset_after_fork(self):
+        """Forget the client inherited from the parent process.
+
+        The parent's sockets and monitor threads are unusable in the child,
+        so the client is dropped without closing it and is recreated on
+        next use.
+        """
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self._health_thread = None
+        self.healthy = None
+
+    def close(self):
+        """Stop the health checks and close the pooled connections"""
+        self._stop_event.set()
+        if self._health_thread is not None and self._health_thread.is_alive():
+            self._health_thread.join(timeout=1)
+        self._health_thread = None
+        if self._client is not None and self._pid == os.getpid():
+            self._client.close()
+            logger.info("Closed MongoDB connection pool")
+        self._client = None
+        self._pid = None
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def configure_connection(uri=None, **options):
+    """Install the process-wide connection manager, replacing any existing one"""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+        _manager = ConnectionManager(uri or os.getenv('DB_CONNECTION_STRING'), **options)
+        return _manager
+
+
+def get_connection_manager():
+    """Return the process-wide connection manager, configuring it from the environment if needed"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ConnectionManager(os.getenv('DB_CONNECTION_STRING'))
+    return _manager
+
+
+def close_connection():
+    """Close the process-wide connection pool"""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
+
+
+def _reset_connection_after_fork():
+    global _manager_lock
+    _manager_lock = threading.Lock()
+    if _manager is not None:
+        _manager.reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_connection_after_fork)
+
+# Registered once per process; closes whichever manager is installed at exit
+atexit.register(close_connection)
+
+
 def get_database():
     """Get MongoDB database connection"""
     try:
-        MONGODB_URI = os.getenv('DB_CONNECTION_STRING') 
-        if not MONGODB_URI:
-            raise ValueError("MongoDB Atlas connection string (DB_CONNECTION_STRING) not found in environment variables")
-        
-        client = MongoClient(MONGODB_URI)
-        # Test connection
-        client.admin.command('ping')
-        logger.info("Successfully connected to MongoDB Atlas")
-        
-        return client['visualization_db']
+        return get_connection_manager().database
     except Exception as e:
         logger.error(f"Error connecting to MongoDB Atlas: {str(e)}")
         raise
@@ -89,7 +257,10 @@ def init_db():
     try:
         db = get_database()
         collection = db['visualizations']
-        metrics_collection = db['base_metrics']
+        
+        # Make sure every filtered query is index-backed
+        from .indexes import ensure_indexes
+        ensure_indexes(collection)
         
         # Check if data already exists
         if collection.count_documents({}) == 0:
@@ -101,53 +272,107 @@ def init_db():
             if not json_path.exists():
                 raise FileNotFoundError(f"JSON file not found at {json_path}")
             
-            # Load and clean data from JSON file
-            with open(json_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                cleaned_data = clean_data(data)
-                
-                # Insert data into MongoDB
-                result = collection.insert_many(cleaned_data)
-                logger.info(f"Successfully loaded {len(result.inserted_ids)} records into MongoDB Atlas")
-                
-                # Calculate and store base metrics
-                base_metrics = calculate_base_metrics(cleaned_data)
-                metrics_collection.delete_many({})  # Clear existing metrics
-                metrics_collection.insert_one(base_metrics)
-                logger.info("Successfully stored base metrics")
+            # Stream, clean and insert the file in batches; this also stores
+            # the base metrics and bumps the dataset version
+            from .ingest import ingest
+            summary = ingest(json_path, collection)
+            logger.info(f"Successfully loaded {summary['records']} records into MongoDB Atlas")
         else:
             logger.info(f"Data already exists in database ({collection.count_documents({})} records)")
             
-            # Ensure base metrics exist
-            if metrics_collection.count_documents({}) == 0:
-                data = list(collection.find({}, {'_id': 0}))
-                base_metrics = calculate_base_metrics(data)
-                metrics_collection.insert_one(base_metrics)
-                logger.info("Successfully stored base metrics")
+            # Ensure the base metrics rollups exist
+            from .rollups import ensure_rollups
+            ensure_rollups(collection)
+        
+        # Pre-aggregate the cube for the current data if it is missing or stale
+        from .cube import ensure_cube
+        ensure_cube(collection)
+        
+        # Build the full-text index now rather than on the first search
+        from .search import get_search_index
+        get_search_index().sync(collection)
             
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
 
-def get_all_data():
+_data_version = {'value': None, 'fetched_at': 0.0}
+
+def get_data_state():
+    """Get the dataset version and how many of its changes did more than append records"""
+    doc = get_database()['meta'].find_one({'_id': 'dataset'}) or {}
+    state = {'version': doc.get('version', 0), 'rewrites': doc.get('rewrites', 0)}
+    _data_version.update(value=state['version'], fetched_at=time.monotonic())
+    return state
+
+def get_data_version():
+    """Get the dataset version, bumped whenever the visualizations collection changes"""
+    return get_data_state()['version']
+
+def current_data_version(max_age=5.0):
+    """Get the dataset version, re-reading it from MongoDB at most every max_age seconds"""
+    if _data_version['value'] is None or time.monotonic() - _data_version['fetched_at'] > max_age:
+        return get_data_version()
+    return _data_version['value']
+
+def bump_data_version(appended=False):
+    """Mark the dataset as changed so cached results and in-memory copies are invalidated.
+
+    appended marks a change that only inserted records, all with higher
+    _ids than any stored before, so in-memory copies can add them instead
+    of reloading.
+    """
+    doc = get_database()['meta'].find_one_and_update(
+        {'_id': 'dataset'},
+        {'$inc': {'version': 1} if appended else {'version': 1, 'rewrites': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    _data_version.update(value=doc['version'], fetched_at=time.monotonic())
+    logger.info(f"Dataset version is now {doc['version']}")
+    return doc['version']
+
+def record_projection(fields=None):
+    """Projection returning every record field, or only the given ones"""
+    if not fields:
+        return RECORD_PROJECTION
+    return {'_id': 0, **{field: 1 for field in fields}}
+
+def get_all_data(fields=None):
     """Get all data from database"""
     try:
         db = get_database()
-        return list(db.visualizations.find({}, {'_id': 0}))
+        return records_from(db.visualizations.find({}, record_projection(fields)))
     except Exception as e:
         logger.error(f"Error fetching data: {str(e)}")
         return []
 
-def get_filtered_data(filters):
+def build_query(filters):
+    """Translate a filter dict into a MongoDB query through its compiled plan.
+
+    Blank values are ignored. end_year is stored as a string, so an
+    end_year range becomes an $in over the stored years it covers.
+    """
+    plan = compile_filters(filters)
+    if not plan.year_range:
+        return plan.mongo
+    return plan.mongo_query(current_data_version(), lambda: get_distinct_values('end_year'))
+
+def get_filtered_data(filters, fields=None):
     """Get filtered data from database"""
     try:
         db = get_database()
-        query = {k: v for k, v in filters.items() if v is not None and v != ''}
-        return list(db.visualizations.find(query, {'_id': 0}))
+        query = build_query(filters)
+        return records_from(db.visualizations.find(query, record_projection(fields)))
     except Exception as e:
         logger.error(f"Error fetching filtered data: {str(e)}")
         return []
 
+def iter_filtered_data(filters, batch_size=1000, fields=None):
+    """Iterate over matching documents without materializing them all"""
+    db = get_database()
+    return db.visualizations.find(build_query(filters), record_projection(fields), batch_size=batch_size)
+
 def get_distinct_values(field):
     """Get distinct values for a field"""
     try:
@@ -161,27 +386,18 @@ def get_distinct_values(field):
 
 def get_collection():
     try:
-        mongodb_uri = os.getenv('DB_CONNECTION_STRING') 
-        if not mongodb_uri:
-            raise ValueError("MongoDB Atlas connection string (DB_CONNECTION_STRING) not found in environment variables")
-            
-        client = MongoClient(mongodb_uri)
-        db = client['visualization_db']
-        
-        # Test connection
-        client.admin.command('ping')
-        logger.info("Successfully connected to MongoDB Atlas")
-        
-        return db['data']
+        return get_database()['data']
     except Exception as e:
         logger.error(f"Error connecting to database: {str(e)}")
         raise
 
 def get_base_metrics():
-    """Get the base metrics for the entire dataset"""
+    """Get the base metrics for the entire dataset from the running rollups"""
     try:
+        from .rollups import base_metrics
         db = get_database()
-        metrics = db['base_metrics'].find_one({}, {'_id': 0})
+        # Deployments loaded before rollups existed only have the stored snapshot
+        metrics = base_metrics(db) or db['base_metrics'].find_one({}, {'_id': 0})
         return metrics if metrics else {}
     except Exception as e:
         logger.error(f"Error fetching base metrics: {str(e)}")
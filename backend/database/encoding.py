@@ -0,0 +1,40 @@
+def encode_column(values):
+    """(column, dictionary) for a list of values; dictionary is None when the column is left as is.
+
+    Columns of strings are encoded when they hold at most half as many
+    distinct values as rows, which is where codes beat repeating the text.
+    """
+    codes = {}
+    for value in values:
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            return list(values), None
+        codes.setdefault(value, len(codes))
+    if not codes or len(codes) * 2 > len(values):
+        return list(values), None
+    return [None if value is None else codes[value] for value in values], list(codes)
+
+
+def columnar_result(count, fields, encoded):
+    """Columnar response body from (field, (column, dictionary)) pairs"""
+    columns, dictionaries = {}, {}
+    for field, (column, dictionary) in zip(fields, encoded):
+        columns[field] = column
+        if dictionary is not None:
+            dictionaries[field] = dictionary
+    return {'count': count, 'fields': fields, 'columns': columns, 'dictionaries': dictionaries}
+
+
+def encode_columns(rows, fields=None):
+    """Columnar form of a list of records: one array per field instead of one object per row.
+
+    fields defaults to every key in first-seen order. Repeating string
+    columns hold integer codes into their table in dictionaries, in the
+    order values first appear; missing values are null either way.
+    """
+    rows = list(rows)
+    if fields is None:
+        fields = list(dict.fromkeys(field for row in rows for field in row))
+    return columnar_result(len(rows), fields, [encode_column([row.get(field) for row in rows]) for field in fields])
+
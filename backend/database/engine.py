@@ -0,0 +1,318 @@
+import base64
+import binascii
+import json
+import logging
+import threading
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
+from .db import (
+    get_all_data,
+    get_filtered_data,
+    iter_filtered_data,
+    build_query,
+    get_database,
+    HASH_FIELDS,
+    get_distinct_values,
+    get_base_metrics,
+    current_data_version
+)
+from . import pipelines
+from . import rollups
+from .encoding import encode_columns
+from .records import Record
+from .cube import Cube, VIEW_FIELDS
+from .views import (
+    build_facets,
+    build_views,
+    build_metrics,
+    build_timeseries,
+    build_network,
+    build_geo,
+    build_topic_distribution,
+    build_charts
+)
+
+logger = logging.getLogger(__name__)
+
+# Sections the dashboard endpoint can return
+DASHBOARD_VIEWS = ['data', 'metrics', 'network', 'topic_distribution', 'timeseries', 'geo', 'charts']
+
+
+class InvalidPageToken(ValueError):
+    """Raised when an 'after' pagination token cannot be decoded"""
+
+
+def encode_page_token(kind, key):
+    """Opaque pagination token for the last row of a page"""
+    raw = json.dumps({'k': kind, 'v': key}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_page_token(token, kind):
+    """Key stored in a pagination token issued by the same kind of engine"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidPageToken("Malformed pagination token")
+    if not isinstance(payload, dict) or payload.get('k') != kind:
+        raise InvalidPageToken("Pagination token was not issued by this query engine")
+    return payload.get('v')
+
+
+class MongoEngine:
+    """Query engine backed by MongoDB.
+
+    With pushdown enabled the dashboard aggregations run server-side as
+    aggregation pipelines and only the aggregates cross the network;
+    otherwise matching documents are fetched and aggregated in Python.
+    In parity-check mode both paths run and any difference is logged.
+    Views whose filters are covered by an up-to-date cube are answered
+    from its pre-aggregated cells without touching the raw records.
+    """
+
+    name = 'mongo'
+
+    def __init__(self, pushdown=True, parity_check=False, cube=True, version_check_interval=5.0):
+        self.pushdown = pushdown
+        self.parity_check = parity_check
+        self.use_cube = cube
+        self.version_check_interval = version_check_interval
+        self._cube = None
+        self._cube_checked = None
+
+    def _fresh_cube(self):
+        """The cube if it matches the current dataset version, reloading it when it was rebuilt"""
+        if not self.use_cube:
+            return None
+        version = current_data_version(self.version_check_interval)
+        cube = self._cube
+        if cube is None or cube.version != version:
+            now = time.monotonic()
+            if self._cube_checked is not None and now - self._cube_checked < self.version_check_interval:
+                return None
+            self._cube_checked = now
+            cube = self._cube = Cube.load()
+        return cube if cube is not None and cube.version == version else None
+
+    def _from_cube(self, view, filters, base_metrics=None):
+        cube = self._fresh_cube()
+        return cube.answer(view, filters, base_metrics) if cube is not None else None
+
+    def _aggregate(self, view, filters, pipeline_fn, python_fn):
+        if not self.pushdown:
+            return python_fn()
+        result = pipeline_fn()
+        if self.parity_check:
+            expected = python_fn()
+            if result != expected:
+                logger.warning(f"Aggregation pipeline for {view} disagrees with the Python path (filters: {filters})")
+        return result
+
+    def records(self, filters, fields=None):
+        if filters:
+            return get_filtered_data(filters, fields)
+        return get_all_data(fields)
+
+    def columns(self, filters, fields=None):
+        """Matching rows in columnar form, fetching only the requested fields"""
+        return encode_columns(self.records(filters, fields), fields)
+
+    def iter_records(self, filters, batch_size=1000, fields=None):
+        """Matching rows streamed from a cursor, batch_size documents per round trip"""
+        return iter_filtered_data(filters, batch_size=batch_size, fields=fields)
+
+    def page(self, filters, limit, after=None, fields=None):
+        """One page of matching rows in _id order, plus the token for the next page"""
+        query = build_query(filters)
+        if after is not None:
+            try:
+                last_id = ObjectId(decode_page_token(after, 'id'))
+            except (InvalidId, TypeError):
+                raise InvalidPageToken("Malformed pagination token")
+            query = {'$and': [query, {'_id': {'$gt': last_id}}]} if query else {'_id': {'$gt': last_id}}
+
+        # One extra row tells whether another page follows
+        projection = {field: 1 for field in fields} if fields else {field: 0 for field in HASH_FIELDS}
+        docs = list(get_database().visualizations.find(query, projection).sort('_id', 1).limit(limit + 1))
+        next_token = encode_page_token('id', str(docs[limit - 1]['_id'])) if len(docs) > limit else None
+        docs = docs[:limit]
+        for doc in docs:
+            del doc['_id']
+        return [Record(doc) for doc in docs], next_token
+
+    def distinct(self, field):
+        return get_distinct_values(field)
+
+    def facets(self, filters, fields):
+        """{field: {value: count}} for each field, counting rows that match the other fields' filters"""
+        return self._aggregate(
+            'facets', filters,
+            lambda: pipelines.aggregate_facets(filters, fields),
+            lambda: build_facets(iter_filtered_data({}), filters, fields)
+        )
+
+    def base_metrics(self):
+        base_metrics = get_base_metrics()
+        if not base_metrics:
+            # Fallback: build the rollups with one aggregation per dimension
+            rollups.rebuild_rollups()
+            base_metrics = rollups.base_metrics() or rollups.metrics_from_total(None)
+        return base_metrics
+
+    def metrics(self, filters):
+        base_metrics = self.base_metrics()
+        if not filters:
+            return base_metrics
+        cubed = self._from_cube('metrics', filters, base_metrics)
+        if cubed is not None:
+            return cubed
+        return self._aggregate(
+            'metrics', filters,
+            lambda: pipelines.aggregate_metrics(filters, base_metrics),
+            lambda: build_metrics(iter_filtered_data(filters), base_metrics)
+        )
+
+    def timeseries(self, filters):
+        cubed = self._from_cube('timeseries', filters)
+        if cubed is not None:
+            return cubed
+        return self._aggregate(
+            'timeseries', filters,
+            lambda: pipelines.aggregate_timeseries(filters),
+            lambda: build_timeseries(iter_filtered_data(filters))
+        )
+
+    def network(self, filters):
+        return self._aggregate(
+            'network', filters,
+            lambda: pipelines.aggregate_network(filters),
+            lambda: build_network(iter_filtered_data(filters))
+        )
+
+    def geo(self, filters):
+        cubed = self._from_cube('geo', filters)
+        if cubed is not None:
+            return cubed
+        return self._aggregate(
+            'geo', filters,
+            lambda: pipelines.aggregate_geo(filters),
+            lambda: build_geo(iter_filtered_data(filters))
+        )
+
+    def topic_distribution(self, filters):
+        cubed = self._from_cube('topic_distribution', filters)
+        if cubed is not None:
+            return cubed
+        return self._aggregate(
+            'topic_distribution', filters,
+            lambda: pipelines.aggregate_topic_distribution(filters),
+            lambda: build_topic_distribution(iter_filtered_data(filters))
+        )
+
+    def charts(self, filters):
+        return self._aggregate(
+            'charts', filters,
+            lambda: pipelines.aggregate_charts(filters),
+            lambda: build_charts(iter_filtered_data(filters))
+        )
+
+    def dashboard(self, filters, views):
+        """Several views for one filter set, reading the matching documents once.
+
+        When the rows themselves are requested they are fetched once and
+        every view is built from them in one scan. Otherwise all aggregate
+        views come back from the cube when it covers the filters, and the
+        rest from a single $facet pipeline, or from one streamed scan of the
+        cursor when pushdown is off.
+        """
+        base_metrics = self.base_metrics() if 'metrics' in views else None
+        aggregate_views = [view for view in views if view != 'data']
+
+        if 'data' in views:
+            data = self.records(filters)
+            result = {'data': data}
+            result.update(self._build_views(data, filters, aggregate_views, base_metrics))
+            return result
+
+        # Unfiltered metrics are the stored base metrics, as in metrics()
+        result = {'metrics': base_metrics} if 'metrics' in views and not filters else {}
+        cube = self._fresh_cube()
+        if cube is not None:
+            for view in aggregate_views:
+                if view in VIEW_FIELDS and view not in result:
+                    cubed = cube.answer(view, filters, base_metrics)
+                    if cubed is not None:
+                        result[view] = cubed
+
+        remaining = [view for view in aggregate_views if view not in result]
+        if not remaining:
+            return result
+        if not self.pushdown:
+            result.update(self._build_views(iter_filtered_data(filters), filters, remaining, base_metrics))
+            return result
+        result.update(self._aggregate(
+            'dashboard', filters,
+            lambda: pipelines.aggregate_dashboard(filters, remaining, base_metrics),
+            lambda: self._build_views(iter_filtered_data(filters), filters, remaining, base_metrics)
+        ))
+        return result
+
+    def _build_views(self, data, filters, views, base_metrics):
+        # Every aggregate view is fed from the same single scan
+        scanned = [view for view in views if filters or view != 'metrics']
+        result = build_views(data, scanned, base_metrics)
+        if 'metrics' in views and not filters:
+            result['metrics'] = base_metrics
+        return {view: result[view] for view in views}
+
+    @property
+    def concurrent_queries(self):
+        """Whether separate view queries can usefully run side by side.
+
+        Pushed-down pipelines wait on the server, so they overlap; without
+        pushdown every view would fetch the matching documents again.
+        """
+        return self.pushdown
+
+    def reload(self):
+        """Nothing is held in memory, so there is nothing to reload"""
+
+    def warm(self):
+        """Load the cube now rather than on the first request"""
+        self._cube_checked = None
+        self._fresh_cube()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_engine(name, **options):
+    """Instantiate the query engine registered under the given name"""
+    if name in [None, '', 'mongo']:
+        return MongoEngine(**options)
+    if name == 'columnar':
+        from .columnar import ColumnarEngine
+        return ColumnarEngine(**options)
+    raise ValueError(f"Unknown query engine: {name}")
+
+
+def configure_engine(name='mongo', **options):
+    """Install the process-wide query engine"""
+    global _engine
+    with _engine_lock:
+        _engine = create_engine(name, **options)
+        logger.info(f"Using {_engine.name} query engine")
+        return _engine
+
+
+def get_engine():
+    """Return the process-wide query engine, defaulting to MongoDB"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = MongoEngine()
+    return _engine
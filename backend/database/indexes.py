@@ -0,0 +1,158 @@
+import argparse
+import json
+import logging
+import time
+from pymongo import ASCENDING, IndexModel
+from .db import get_database, build_query, RECORD_PROJECTION
+from . import pipelines
+
+logger = logging.getLogger(__name__)
+
+# Fields the routes accept as equality filters
+FILTER_FIELDS = ['end_year', 'sector', 'topic', 'region', 'country', 'city', 'pestle', 'source']
+
+# Score and year fields the routes accept <field>_min / <field>_max bounds on;
+# end_year ranges are rewritten to $in and use the end_year index
+RANGE_FIELDS = ['intensity', 'likelihood', 'relevance', 'start_year']
+
+# Compound indexes for the common drill-downs: a year or sector first, then
+# the narrower field the dashboard usually adds next
+COMPOUND_INDEXES = [
+    ('end_year', 'sector'),
+    ('sector', 'topic', 'pestle'),
+    ('region', 'country'),
+    ('sector', 'region'),
+    ('pestle', 'source'),
+]
+
+
+def index_models():
+    """IndexModels for every single-field and compound filter index.
+
+    Each index ends in _id, so equality filters followed by the keyset
+    pagination sort on _id are one bounded index scan at any page depth.
+    """
+    models = []
+    for fields in [(field,) for field in FILTER_FIELDS + RANGE_FIELDS] + COMPOUND_INDEXES:
+        keys = [(field, ASCENDING) for field in fields] + [('_id', ASCENDING)]
+        models.append(IndexModel(keys, name='_'.join(f'{field}_1' for field, _ in keys)))
+    return models
+
+
+def record_key_index():
+    """Unique index behind incremental upserts; sparse so records loaded before keys existed are allowed"""
+    return IndexModel([('record_key', ASCENDING)], name='record_key_1', unique=True, sparse=True)
+
+
+def ensure_indexes(collection=None):
+    """Create any missing filter and record key indexes; existing ones are left untouched"""
+    if collection is None:
+        collection = get_database().visualizations
+    names = collection.create_indexes(index_models() + [record_key_index()])
+    logger.info(f"Ensured {len(names)} indexes on {collection.name}")
+    return names
+
+
+def _collect(document, key, found):
+    """Gather every value stored under key anywhere in a nested explain document"""
+    if isinstance(document, dict):
+        for k, v in document.items():
+            if k == key:
+                found.append(v)
+            _collect(v, key, found)
+    elif isinstance(document, list):
+        for item in document:
+            _collect(item, key, found)
+    return found
+
+
+def _summarize(explain, elapsed_ms):
+    winning_plans = _collect(explain, 'winningPlan', [])
+    stages = _collect(winning_plans, 'stage', [])
+    index_names = sorted(set(_collect(winning_plans, 'indexName', [])))
+    stats = _collect(explain, 'executionStats', [])
+    stats = stats[0] if stats else {}
+    return {
+        'stages': stages,
+        'indexes': index_names,
+        'index_backed': 'IXSCAN' in stages and 'COLLSCAN' not in stages,
+        'docs_examined': stats.get('totalDocsExamined'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'returned': stats.get('nReturned'),
+        'execution_time_ms': stats.get('executionTimeMillis', round(elapsed_ms, 2)),
+    }
+
+
+def sample_filter_sets(db=None, per_field=1):
+    """Representative filter sets: the most common value of each field, one combination,
+    a multi-value set and a score range"""
+    db = db if db is not None else get_database()
+    filter_sets = []
+    combined = {}
+    for field in FILTER_FIELDS:
+        top = list(db.visualizations.aggregate([
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1}},
+            {'$limit': per_field},
+        ]))
+        for group in top:
+            filter_sets.append({field: group['_id']})
+        if top and field in ['end_year', 'sector']:
+            combined[field] = top[0]['_id']
+    if combined:
+        filter_sets.append(combined)
+    sectors = db.visualizations.distinct('sector')[:2]
+    if len(sectors) == 2:
+        filter_sets.append({'sector': {'$in': sorted(sectors)}})
+    filter_sets.append({'intensity': {'$gte': 5.0}})
+    return filter_sets
+
+
+def explain_queries(filter_sets=None):
+    """Run explain() on the queries the dashboard issues and report index usage"""
+    db = get_database()
+    filter_sets = filter_sets if filter_sets is not None else sample_filter_sets(db)
+    builders = {
+        'metrics': pipelines.metrics_pipeline,
+        'timeseries': pipelines.timeseries_pipeline,
+        'geo': pipelines.geo_pipeline,
+        'topic_distribution': pipelines.topic_distribution_pipeline,
+        'network': pipelines.network_pipeline,
+    }
+
+    report = []
+    for filters in filter_sets:
+        start = time.perf_counter()
+        explain = db.visualizations.find(build_query(filters), RECORD_PROJECTION).explain()
+        report.append({'query': 'data', 'filters': filters, **_summarize(explain, (time.perf_counter() - start) * 1000)})
+
+        for name, builder in builders.items():
+            start = time.perf_counter()
+            explain = db.command(
+                'explain',
+                {'aggregate': 'visualizations', 'pipeline': builder(filters), 'cursor': {}},
+                verbosity='executionStats'
+            )
+            report.append({'query': name, 'filters': filters, **_summarize(explain, (time.perf_counter() - start) * 1000)})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Provision filter indexes and report query plans')
+    parser.add_argument('--ensure', action='store_true', help='create missing indexes first')
+    parser.add_argument('--filters', help='JSON list of filter sets to explain instead of sampled ones')
+    args = parser.parse_args()
+
+    if args.ensure:
+        ensure_indexes()
+    report = explain_queries(json.loads(args.filters) if args.filters else None)
+    print(json.dumps(report, indent=2, default=str))
+
+    unindexed = [entry for entry in report if not entry['index_backed']]
+    if unindexed:
+        logger.warning(f"{len(unindexed)} of {len(report)} queries are not index-backed")
+    return 1 if unindexed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
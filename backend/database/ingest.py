@@ -0,0 +1,362 @@
+import argparse
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from .db import get_database, bump_data_version, HASH_FIELDS
+from . import rollups
+from .cube import refresh_cube
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JSON_PATH = Path(__file__).parent.parent.parent / 'jsondata.json'
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_WORKERS = 4
+
+NUMERIC_FIELDS = ['intensity', 'likelihood', 'relevance']
+STRING_FIELDS = ['sector', 'topic', 'region', 'country', 'city', 'pestle', 'source']
+
+# Fields that identify one article across feed refreshes
+RECORD_KEY_FIELDS = ['url', 'title', 'added', 'published']
+HASH_EXCLUDED_FIELDS = ['_id'] + HASH_FIELDS
+
+# Whitespace and the array punctuation between top-level records
+_SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+
+def iter_json_records(path, chunk_size=1024 * 1024):
+    """Yield the records of a JSON array or newline-delimited JSON file one at a time.
+
+    The file is read chunk_size characters at a time, so memory is bounded
+    by the chunk size and the largest single record.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer, pos, eof = '', 0, False
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos < len(buffer):
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    item = None
+                if item is not None:
+                    if not isinstance(item, dict):
+                        raise ValueError(f"Expected a JSON object at character {pos}, got {type(item).__name__}")
+                    yield item
+                    pos = end
+                    continue
+            elif eof:
+                return
+
+            # Need more input: drop what has been consumed and read the next chunk
+            chunk = file.read(chunk_size)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+
+
+def batched(iterable, size):
+    """Split an iterable into lists of at most size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _column(batch, field):
+    return pd.Series([item.get(field) for item in batch], dtype=object)
+
+
+def _blank(values):
+    """Mask of the values clean_data treats as missing: None, '' and 'null'"""
+    return values.isna() | values.isin(['', 'null'])
+
+
+def clean_batch(batch):
+    """Vectorized clean_data for one batch of records, cleaned in place.
+
+    Applies the same rules as clean_data: blank or non-numeric scores
+    become 0.0, end_year becomes an integer string or 'Unknown', and blank
+    categorical fields become 'Unknown'.
+    """
+    for field in NUMERIC_FIELDS:
+        values = _column(batch, field)
+        numbers = pd.to_numeric(values.mask(_blank(values)), errors='coerce').fillna(0.0).astype(float)
+        for item, number in zip(batch, numbers.tolist()):
+            item[field] = number
+
+    values = _column(batch, 'end_year')
+    years = pd.to_numeric(values.mask(_blank(values) | values.isin([0])), errors='coerce')
+    years = years.to_numpy(dtype=float)
+    valid = np.isfinite(years) & (np.abs(years) < 2.0 ** 63)
+    cleaned = pd.Series('Unknown', index=values.index, dtype=object)
+    cleaned[valid] = years[valid].astype(np.int64).astype(str).astype(object)
+    for item, year in zip(batch, cleaned.tolist()):
+        item['end_year'] = year
+
+    for field in STRING_FIELDS:
+        values = _column(batch, field)
+        cleaned = values.astype(str).mask(_blank(values), 'Unknown')
+        for item, value in zip(batch, cleaned.tolist()):
+            item[field] = value
+
+    return batch
+
+
+def log_progress(progress):
+    logger.info(
+        f"Ingested {progress['records']} records in {progress['batches']} batches "
+        f"({progress['records_per_second']:.0f} records/s)"
+    )
+
+
+def _load(path, write, batch_size, workers, progress, key=None):
+    """Clean path's records a batch at a time and hand each batch to write() on a thread pool.
+
+    At most two batches per worker are in flight, so memory is bounded by
+    the batch size rather than the file size. With key, every batch is
+    split by key over one single-threaded lane per worker instead, so
+    records sharing a key are always written by the same thread in file
+    order and a write never races another for the same key. Returns the
+    number of records and batches and the list of write() results.
+    """
+    started = time.perf_counter()
+    loaded = batches = 0
+    pending = deque()
+    results = []
+
+    with ExitStack() as stack:
+        lanes = workers if key is not None else 1
+        pools = [
+            stack.enter_context(ThreadPoolExecutor(max_workers=1 if key is not None else workers))
+            for _ in range(lanes)
+        ]
+        for batch in batched(iter_json_records(path), batch_size):
+            stamp_batch(clean_batch(batch))
+            loaded += len(batch)
+            batches += 1
+            if key is None:
+                parts = [batch]
+            else:
+                parts = [[] for _ in pools]
+                for item in batch:
+                    parts[hash(key(item)) % lanes].append(item)
+            pending.append([pool.submit(write, part) for pool, part in zip(pools, parts) if part])
+            while len(pending) > workers * 2:
+                results.extend(future.result() for future in pending.popleft())
+            if progress is not None:
+                elapsed = time.perf_counter() - started
+                progress({
+                    'records': loaded,
+                    'batches': batches,
+                    'elapsed': round(elapsed, 3),
+                    'records_per_second': loaded / elapsed if elapsed else 0.0,
+                })
+        while pending:
+            results.extend(future.result() for future in pending.popleft())
+    return loaded, batches, results
+
+
+def ingest(path=DEFAULT_JSON_PATH, collection=None, batch_size=DEFAULT_BATCH_SIZE,
+           workers=DEFAULT_WORKERS, progress=log_progress):
+    """Stream a JSON file into the visualizations collection.
+
+    Records are parsed incrementally, cleaned a batch at a time and written
+    with unordered insert_many calls spread over a pool of worker threads.
+    Records whose record key is already stored, or appeared earlier in the
+    file, are skipped and counted as duplicates. Each written batch is
+    added to the rollups. Bumps the dataset version when anything was
+    inserted, and returns a summary. When every new _id sorts after the
+    existing ones, the bump is marked as an append, so in-memory copies
+    add the new records instead of reloading. A previously built cube is
+    rebuilt for the new version.
+    """
+    db = get_database()
+    collection = collection if collection is not None else db['visualizations']
+    rollups.ensure_rollups(collection)
+    last = collection.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+    started = time.perf_counter()
+
+    def write(batch):
+        """Insert a batch, skipping repeats of records already loaded; returns its lowest _id and how many repeats"""
+        try:
+            collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            # The rest of the batch was written and still moves the rollups
+            failed = {error['index'] for error in errors}
+            written = [item for i, item in enumerate(batch) if i not in failed]
+            rollups.record_inserted(written, db)
+            if any(error.get('code') != 11000 for error in errors):
+                raise
+            return min((item['_id'] for item in written), default=None), len(errors)
+        rollups.record_inserted(batch, db)
+        return min(item['_id'] for item in batch), 0
+
+    try:
+        loaded, batches, results = _load(path, write, batch_size, workers, progress)
+    except Exception:
+        # Batches written before the failure are in; let readers see them
+        bump_data_version()
+        raise
+    first_ids = [first_id for first_id, _ in results if first_id is not None]
+    duplicates = sum(repeats for _, repeats in results)
+    if duplicates:
+        logger.warning(f"Skipped {duplicates} records already loaded with the same record key; use --upsert to update changed records")
+    base_metrics = rollups.base_metrics(db)
+    if loaded > duplicates:
+        bump_data_version(appended=last is None or all(first_id > last['_id'] for first_id in first_ids))
+        refresh_cube(collection)
+
+    summary = {'records': loaded, 'duplicates': duplicates, 'batches': batches, 'seconds': round(time.perf_counter() - started, 3), 'base_metrics': base_metrics}
+    logger.info(f"Loaded {loaded} records from {path} in {summary['seconds']}s")
+    return summary
+
+
+def record_key(item):
+    """Stable identity of a record, from the fields that identify one article"""
+    raw = json.dumps([item.get(field) for field in RECORD_KEY_FIELDS], default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def content_hash(item):
+    """Hash of everything stored for a record, to tell changed rows from unchanged ones"""
+    content = {k: v for k, v in item.items() if k not in HASH_EXCLUDED_FIELDS}
+    raw = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def stamp_batch(batch):
+    """Add the record key and content hash to cleaned records"""
+    for item in batch:
+        item['record_key'] = record_key(item)
+        item['content_hash'] = content_hash(item)
+    return batch
+
+
+def backfill_hashes(collection, batch_size=DEFAULT_BATCH_SIZE):
+    """Stamp records loaded before keys and hashes existed; returns how many were updated"""
+    updated = 0
+    cursor = collection.find({'record_key': {'$exists': False}}, batch_size=batch_size)
+    for batch in batched(cursor, batch_size):
+        requests = [
+            UpdateOne({'_id': item['_id']}, {'$set': {'record_key': record_key(item), 'content_hash': content_hash(item)}})
+            for item in batch
+        ]
+        updated += collection.bulk_write(requests, ordered=False).modified_count
+    if updated:
+        logger.info(f"Added record keys and content hashes to {updated} existing records")
+    return updated
+
+
+def _upsert_batch(collection, batch, db):
+    """Write the new and changed records of a stamped batch; the last duplicate of a key wins"""
+    latest = {item['record_key']: item for item in batch}
+    projection = {'_id': 0, 'record_key': 1, 'content_hash': 1, **rollups.ROLLUP_PROJECTION}
+    existing = {doc['record_key']: doc for doc in collection.find({'record_key': {'$in': list(latest)}}, projection)}
+    changed = {
+        key: item for key, item in latest.items()
+        if key not in existing or existing[key].get('content_hash') != item['content_hash']
+    }
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': len(latest) - len(changed)}
+    if changed:
+        result = collection.bulk_write(
+            [ReplaceOne({'record_key': key}, item, upsert=True) for key, item in changed.items()],
+            ordered=False
+        )
+        counts['inserted'] = result.upserted_count
+        counts['updated'] = result.modified_count
+        rollups.record_replaced(
+            [existing[key] for key in changed if key in existing],
+            list(changed.values()),
+            db
+        )
+    return counts
+
+
+def upsert(path=DEFAULT_JSON_PATH, collection=None, batch_size=DEFAULT_BATCH_SIZE,
+           workers=DEFAULT_WORKERS, progress=log_progress):
+    """Incrementally load a JSON file, writing only new or changed records.
+
+    Records are matched on their record key, which has a unique index, and
+    only rewritten when their content hash differs. Each key is written by
+    one worker thread in file order, so the last copy of a record in the
+    file wins. The rollups move by the difference between the old and new
+    versions of each written record, and the dataset version is bumped,
+    and a previously built cube rebuilt, only when something changed.
+    """
+    db = get_database()
+    collection = collection if collection is not None else db['visualizations']
+    backfill_hashes(collection, batch_size)
+    rollups.ensure_rollups(collection)
+    started = time.perf_counter()
+
+    # Batches are split by record key so two writes of one key never interleave
+    # their read of the stored record with each other's replace
+    loaded, batches, results = _load(
+        path, lambda batch: _upsert_batch(collection, batch, db), batch_size, workers, progress,
+        key=lambda item: item['record_key']
+    )
+
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    for result in results:
+        for name, count in result.items():
+            counts[name] += count
+    if counts['inserted'] or counts['updated']:
+        bump_data_version()
+        refresh_cube(collection)
+
+    summary = {'records': loaded, 'batches': batches, **counts, 'seconds': round(time.perf_counter() - started, 3)}
+    logger.info(
+        f"Upserted {loaded} records from {path}: {counts['inserted']} inserted, "
+        f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream a JSON or NDJSON file into MongoDB')
+    parser.add_argument('path', nargs='?', default=str(DEFAULT_JSON_PATH), help='JSON array or NDJSON file')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='records cleaned and inserted per batch')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='threads issuing insert_many calls')
+    parser.add_argument('--replace', action='store_true', help='delete existing records before loading')
+    parser.add_argument('--upsert', action='store_true', help='only insert new and update changed records')
+    parser.add_argument('--verify-rollups', action='store_true', help='recompute the rollups from the records afterwards and report any drift')
+    args = parser.parse_args()
+
+    collection = get_database()['visualizations']
+    if args.replace:
+        deleted = collection.delete_many({}).deleted_count
+        # Start the rollups from zero too, so the reload does not add to the old totals
+        rollups.rebuild_rollups(collection)
+        bump_data_version()
+        logger.info(f"Deleted {deleted} existing records")
+    load = upsert if args.upsert else ingest
+    summary = load(args.path, collection, batch_size=args.batch_size, workers=args.workers)
+    drifted = 0
+    if args.verify_rollups:
+        report = rollups.verify_rollups(collection)
+        drifted = report['drifted']
+        summary['rollups'] = {'rollups': report['rollups'], 'drifted': drifted}
+        if drifted:
+            logger.error(f"{drifted} rollups differ from the stored records; rebuild them with python -m database.rollups --rebuild")
+    print(json.dumps(summary, indent=2))
+    return 1 if drifted else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
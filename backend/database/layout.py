@@ -0,0 +1,175 @@
+import math
+import numpy as np
+
+# Graphs up to this many nodes use exact all-pairs repulsion
+EXACT_LIMIT = 512
+
+# Average nodes per cell of the finest Barnes-Hut grid
+LEAF_SIZE = 4
+
+DEFAULT_ITERATIONS = 150
+
+# Pull towards the center, so separate components stay in view
+GRAVITY = 0.5
+
+# 3x3 neighbourhood of a cell, and the 6x6 block of its parent's neighbours' children
+_NEAR = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+_BLOCK = [(dx, dy) for dx in range(6) for dy in range(6)]
+
+
+def _phyllotaxis(count):
+    """Deterministic, evenly spread starting positions"""
+    index = np.arange(count, dtype=np.float64)
+    radius = np.sqrt(index + 0.5) / math.sqrt(max(count, 1))
+    angle = index * math.pi * (3 - math.sqrt(5))
+    return np.stack([radius * np.cos(angle), radius * np.sin(angle)], axis=1)
+
+
+def _push(diff, k2):
+    """Fruchterman-Reingold repulsion k^2 / d along diff, for rows of pair offsets"""
+    d2 = np.maximum((diff ** 2).sum(axis=1), 1e-9)
+    return diff * (k2 / d2)[:, None]
+
+
+def _exact_repulsion(pos, k2):
+    diff = pos[:, None, :] - pos[None, :, :]
+    d2 = np.maximum((diff ** 2).sum(axis=2), 1e-9)
+    np.fill_diagonal(d2, np.inf)
+    return (diff * (k2 / d2)[:, :, None]).sum(axis=1)
+
+
+def _grid_repulsion(pos, k2):
+    """Barnes-Hut repulsion over a hierarchy of uniform grids, in O(n log n).
+
+    At each level a node feels the cells that are children of its parent
+    cell's neighbours but not its own neighbours, each as one mass at its
+    centroid; at the finest level the nodes in the neighbouring cells are
+    summed exactly. Every loop is over a fixed set of cell offsets, with
+    the work on nodes vectorized.
+    """
+    n = len(pos)
+    levels = max(2, min(10, math.ceil(math.log(n / LEAF_SIZE, 4))))
+    low = pos.min(axis=0)
+    extent = max(float((pos.max(axis=0) - low).max()), 1e-9)
+    finest = 1 << levels
+    cells = np.clip(((pos - low) / extent * finest).astype(np.int64), 0, finest - 1)
+    force = np.zeros_like(pos)
+
+    for level in range(2, levels + 1):
+        size = 1 << level
+        cx, cy = cells[:, 0] >> (levels - level), cells[:, 1] >> (levels - level)
+        cell = cx * size + cy
+        mass = np.bincount(cell, minlength=size * size).astype(np.float64)
+        centroid = np.stack([
+            np.bincount(cell, weights=pos[:, 0], minlength=size * size),
+            np.bincount(cell, weights=pos[:, 1], minlength=size * size),
+        ], axis=1) / np.maximum(mass, 1)[:, None]
+        base_x, base_y = 2 * ((cx >> 1) - 1), 2 * ((cy >> 1) - 1)
+        for dx, dy in _BLOCK:
+            x, y = base_x + dx, base_y + dy
+            far = (x >= 0) & (x < size) & (y >= 0) & (y < size) & ((np.abs(x - cx) > 1) | (np.abs(y - cy) > 1))
+            other = np.where(far, x * size + y, 0)
+            weight = np.where(far, mass[other], 0.0)
+            force += _push(pos - centroid[other], k2) * weight[:, None]
+
+    # Near field: exact pairs with the nodes of the 3x3 neighbouring cells
+    cell = cells[:, 0] * finest + cells[:, 1]
+    order = np.argsort(cell, kind='stable')
+    starts = np.searchsorted(cell[order], np.arange(finest * finest), side='left')
+    ends = np.searchsorted(cell[order], np.arange(finest * finest), side='right')
+    for dx, dy in _NEAR:
+        x, y = cells[:, 0] + dx, cells[:, 1] + dy
+        valid = (x >= 0) & (x < finest) & (y >= 0) & (y < finest)
+        other = np.where(valid, x * finest + y, 0)
+        counts = np.where(valid, ends[other] - starts[other], 0)
+        source = np.repeat(np.arange(n), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        target = order[starts[other][source] + offset]
+        keep = source != target
+        source, target = source[keep], target[keep]
+        push = _push(pos[source] - pos[target], k2)
+        force[:, 0] += np.bincount(source, weights=push[:, 0], minlength=n)
+        force[:, 1] += np.bincount(source, weights=push[:, 1], minlength=n)
+    return force
+
+
+def repulsion(pos, k2):
+    return _exact_repulsion(pos, k2) if len(pos) <= EXACT_LIMIT else _grid_repulsion(pos, k2)
+
+
+def force_layout(count, sources, targets, weights, iterations=DEFAULT_ITERATIONS):
+    """Fruchterman-Reingold positions of a weighted graph, scaled into the unit square.
+
+    Starts from a deterministic spiral, so the same graph always gets the
+    same layout. Heavier edges pull harder, on a log scale.
+    """
+    if count == 0:
+        return np.empty((0, 2))
+    if count == 1:
+        return np.full((1, 2), 0.5)
+    sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+    strength = np.log1p(np.asarray(weights, dtype=np.float64))
+    strength = strength / strength.mean() if len(strength) else strength
+
+    pos = _phyllotaxis(count)
+    k = 1 / math.sqrt(count)
+    temperature = 0.1
+    cooling = temperature / max(iterations, 1)
+    for _ in range(iterations):
+        force = repulsion(pos, k * k)
+        diff = pos[sources] - pos[targets]
+        pull = diff * (np.sqrt((diff ** 2).sum(axis=1)) * strength / k)[:, None]
+        for axis in range(2):
+            force[:, axis] -= np.bincount(sources, weights=pull[:, axis], minlength=count)
+            force[:, axis] += np.bincount(targets, weights=pull[:, axis], minlength=count)
+        force -= GRAVITY * pos * count * k
+        length = np.maximum(np.sqrt((force ** 2).sum(axis=1)), 1e-12)
+        pos += force * (np.minimum(length, temperature) / length)[:, None]
+        temperature = max(temperature - cooling, 1e-4)
+
+    # Unit square with a margin, keeping the aspect ratio
+    low, high = pos.min(axis=0), pos.max(axis=0)
+    scale = max(float((high - low).max()), 1e-9)
+    return 0.05 + 0.9 * (pos - low + (scale - (high - low)) / 2) / scale
+
+
+def prune_links(links, max_edges=None, min_weight=1):
+    """Links of at least min_weight, keeping the max_edges heaviest (earliest first on ties)"""
+    kept = [link for link in links if link['value'] >= min_weight]
+    if max_edges is not None and len(kept) > max_edges:
+        heaviest = sorted(range(len(kept)), key=lambda i: (-kept[i]['value'], i))[:max_edges]
+        kept = [kept[i] for i in sorted(heaviest)]
+    return kept
+
+
+def layout_network(network, max_edges=None, min_weight=1, iterations=DEFAULT_ITERATIONS):
+    """Network view with pruned links and laid-out nodes.
+
+    Links are pruned first, nodes left without links are dropped and the
+    rest renumbered in their original order; each node then gets x and y
+    coordinates in [0, 1].
+    """
+    links = prune_links(network['links'], max_edges, min_weight)
+    if len(links) < len(network['links']):
+        linked = {link['source'] for link in links} | {link['target'] for link in links}
+        renumber = {}
+        nodes = []
+        for node in network['nodes']:
+            if node['id'] in linked:
+                renumber[node['id']] = len(nodes)
+                nodes.append({**node, 'id': len(nodes)})
+        links = [{**link, 'source': renumber[link['source']], 'target': renumber[link['target']]} for link in links]
+    else:
+        nodes = [dict(node) for node in network['nodes']]
+
+    positions = force_layout(
+        len(nodes),
+        [link['source'] for link in links],
+        [link['target'] for link in links],
+        [link['value'] for link in links],
+        iterations
+    )
+    for node, (x, y) in zip(nodes, positions.tolist()):
+        node['x'] = round(x, 4)
+        node['y'] = round(y, 4)
+    return {'nodes': nodes, 'links': links}
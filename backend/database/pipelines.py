@@ -0,0 +1,359 @@
+from .db import get_database, build_query
+from .aggregators import CHART_SUMS
+from .views import hierarchy_to_tree, facet_counts
+
+# Values the Python views treat as missing for a categorical field
+_BLANK = [None, '', 'Unknown']
+
+
+def _or_unknown(field):
+    """Field value, or 'Unknown' when it is missing or blank"""
+    return {'$cond': [{'$in': [{'$ifNull': [f'${field}', '']}, ['']]}, 'Unknown', f'${field}']}
+
+
+def _score_sums():
+    # Only equal to summing safe_float() over cleaned records: $sum skips
+    # every non-numeric value, numeric strings included, where safe_float()
+    # parses them. clean_data() and clean_batch() store every score as a
+    # float, so records loaded through them agree.
+    return {
+        'count': {'$sum': 1},
+        'intensity': {'$sum': '$intensity'},
+        'likelihood': {'$sum': '$likelihood'},
+        'relevance': {'$sum': '$relevance'},
+    }
+
+
+def _averages(group):
+    count = group['count']
+    return {
+        'intensity': round(group['intensity'] / count, 2),
+        'likelihood': round(group['likelihood'] / count, 2),
+        'relevance': round(group['relevance'] / count, 2),
+    }
+
+
+def _aggregate(pipeline):
+    return list(get_database().visualizations.aggregate(pipeline, allowDiskUse=True))
+
+
+def metrics_stages():
+    return [
+        {'$group': {'_id': None, **_score_sums()}},
+    ]
+
+
+def metrics_pipeline(filters):
+    return [{'$match': build_query(filters)}] + metrics_stages()
+
+
+def metrics_result(groups, base_metrics):
+    if not groups or not groups[0]['count']:
+        return {
+            'total_records': base_metrics['total_records'],
+            'avg_intensity': 0,
+            'avg_likelihood': 0,
+            'avg_relevance': 0
+        }
+    averages = _averages(groups[0])
+    return {
+        'total_records': base_metrics['total_records'],
+        'avg_intensity': averages['intensity'],
+        'avg_likelihood': averages['likelihood'],
+        'avg_relevance': averages['relevance']
+    }
+
+
+def aggregate_metrics(filters, base_metrics):
+    return metrics_result(_aggregate(metrics_pipeline(filters)), base_metrics)
+
+
+def timeseries_stages():
+    return [
+        {'$match': {'end_year': {'$nin': _BLANK}}},
+        {'$group': {'_id': '$end_year', **_score_sums()}},
+    ]
+
+
+def timeseries_pipeline(filters):
+    return [{'$match': build_query(filters)}] + timeseries_stages()
+
+
+def timeseries_result(groups):
+    result = []
+    for group in groups:
+        result.append({
+            'year': group['_id'],
+            **_averages(group),
+            'count': group['count']
+        })
+    result.sort(key=lambda x: x['year'])
+    return result
+
+
+def aggregate_timeseries(filters):
+    return timeseries_result(_aggregate(timeseries_pipeline(filters)))
+
+
+def geo_stages():
+    # Groups are ordered by their first document, matching the Python view
+    return [
+        {'$match': {'country': {'$nin': _BLANK}}},
+        {'$group': {'_id': '$country', 'first': {'$min': '$_id'}, **_score_sums()}},
+        {'$sort': {'first': 1}},
+    ]
+
+
+def geo_pipeline(filters):
+    return [{'$match': build_query(filters)}] + geo_stages()
+
+
+def geo_result(groups):
+    result = []
+    for group in groups:
+        result.append({
+            'country': group['_id'],
+            **_averages(group),
+            'count': group['count']
+        })
+    return result
+
+
+def aggregate_geo(filters):
+    return geo_result(_aggregate(geo_pipeline(filters)))
+
+
+def topic_distribution_stages():
+    return [
+        {'$project': {
+            'sector': _or_unknown('sector'),
+            'topic': _or_unknown('topic'),
+            'pestle': _or_unknown('pestle'),
+        }},
+        {'$match': {'$or': [
+            {'sector': {'$ne': 'Unknown'}},
+            {'topic': {'$ne': 'Unknown'}},
+            {'pestle': {'$ne': 'Unknown'}},
+        ]}},
+        {'$group': {
+            '_id': {'sector': '$sector', 'topic': '$topic', 'pestle': '$pestle'},
+            'first': {'$min': '$_id'},
+            'count': {'$sum': 1},
+        }},
+        {'$sort': {'first': 1}},
+    ]
+
+
+def topic_distribution_pipeline(filters):
+    return [{'$match': build_query(filters)}] + topic_distribution_stages()
+
+
+def topic_distribution_result(groups):
+    hierarchy = {}
+    for group in groups:
+        key = group['_id']
+        topics = hierarchy.setdefault(key['sector'], {})
+        topics.setdefault(key['topic'], {})[key['pestle']] = group['count']
+    return hierarchy_to_tree(hierarchy)
+
+
+def aggregate_topic_distribution(filters):
+    return topic_distribution_result(_aggregate(topic_distribution_pipeline(filters)))
+
+
+def charts_facets():
+    """One $facet branch per chart, groups ordered by their first document; scores must be cleaned, as in _score_sums()"""
+    return {
+        name: [
+            {'$match': {field: {'$nin': _BLANK}}},
+            {'$group': {'_id': f'${field}', 'first': {'$min': '$_id'}, 'total': {'$sum': f'${score}'}}},
+            {'$sort': {'first': 1}},
+        ]
+        for name, (field, score) in CHART_SUMS.items()
+    }
+
+
+def charts_pipeline(filters):
+    return [{'$match': build_query(filters)}, {'$facet': charts_facets()}]
+
+
+def charts_result(facets):
+    return {
+        name: {group['_id']: round(group['total'], 2) for group in facets.get(name, [])}
+        for name in CHART_SUMS
+    }
+
+
+def aggregate_charts(filters):
+    facets = _aggregate(charts_pipeline(filters))
+    return charts_result(facets[0] if facets else {})
+
+
+def _by_position(*fields):
+    """Expression picking the nth field for the unwound position n"""
+    return {'$switch': {'branches': [
+        {'case': {'$eq': ['$pos', i]}, 'then': f'${field}'} for i, field in enumerate(fields)
+    ]}}
+
+
+def network_node_stages():
+    """Node counts ordered by first occurrence; expects documents sorted by _id"""
+    return [
+        {'$match': {'topic': {'$nin': _BLANK}, 'sector': {'$nin': _BLANK}}},
+        {'$project': {'topic': 1, 'sector': 1, 'region': 1, 'pos': {'$literal': [0, 1, 2]}}},
+        {'$unwind': '$pos'},
+        {'$project': {
+            'pos': 1,
+            'name': _by_position('topic', 'sector', 'region'),
+            'type': {'$arrayElemAt': [['topic', 'sector', 'region'], '$pos']},
+        }},
+        # Only the region can be blank here
+        {'$match': {'name': {'$nin': _BLANK}}},
+        {'$group': {
+            '_id': '$name',
+            'value': {'$sum': 1},
+            'first': {'$first': '$_id'},
+            'pos': {'$first': '$pos'},
+            'type': {'$first': '$type'},
+        }},
+        {'$sort': {'first': 1, 'pos': 1}},
+    ]
+
+
+def network_link_stages():
+    """Link counts ordered by first occurrence; expects documents sorted by _id"""
+    return [
+        {'$match': {'topic': {'$nin': _BLANK}, 'sector': {'$nin': _BLANK}}},
+        {'$project': {'topic': 1, 'sector': 1, 'region': 1, 'pos': {'$literal': [0, 1]}}},
+        {'$unwind': '$pos'},
+        {'$project': {
+            'pos': 1,
+            'source': _by_position('topic', 'sector'),
+            'target': _by_position('sector', 'region'),
+        }},
+        {'$match': {'target': {'$nin': _BLANK}}},
+        {'$group': {
+            '_id': {'source': '$source', 'target': '$target'},
+            'value': {'$sum': 1},
+            'first': {'$first': '$_id'},
+            'pos': {'$first': '$pos'},
+        }},
+        {'$sort': {'first': 1, 'pos': 1}},
+    ]
+
+
+def network_pipeline(filters):
+    """Node and link counts in one $facet, each ordered by first occurrence.
+
+    Documents are sorted by _id and each one's occurrences are unwound as
+    topic, sector, region, so the first (document _id, position) seen for
+    a name or pair is where the Python view would have created it.
+    """
+    return [
+        {'$match': build_query(filters)},
+        {'$match': {'topic': {'$nin': _BLANK}, 'sector': {'$nin': _BLANK}}},
+        {'$sort': {'_id': 1}},
+        {'$facet': {
+            'nodes': network_node_stages(),
+            'links': network_link_stages(),
+        }},
+    ]
+
+
+def network_result(node_groups, link_groups):
+    nodes = []
+    node_map = {}
+    for group in node_groups:
+        node_map[group['_id']] = len(nodes)
+        nodes.append({
+            'id': len(nodes),
+            'name': group['_id'],
+            'type': group['type'],
+            'value': group['value']
+        })
+
+    links = []
+    for group in link_groups:
+        links.append({
+            'source': node_map[group['_id']['source']],
+            'target': node_map[group['_id']['target']],
+            'value': group['value']
+        })
+
+    return {
+        'nodes': nodes,
+        'links': links
+    }
+
+
+def aggregate_network(filters):
+    facets = _aggregate(network_pipeline(filters))
+    facets = facets[0] if facets else {'nodes': [], 'links': []}
+    return network_result(facets['nodes'], facets['links'])
+
+
+def facets_pipeline(filters, fields):
+    """Value counts of every facet field in one $facet, each matching only the other fields' filters"""
+    query = build_query(filters)
+    facets = {}
+    for field in fields:
+        others = {k: v for k, v in query.items() if k != field}
+        facets[field] = [
+            {'$match': others},
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+        ]
+    return [{'$facet': facets}]
+
+
+def facets_result(facets, fields):
+    return {field: facet_counts((group['_id'], group['count']) for group in facets.get(field, [])) for field in fields}
+
+
+def aggregate_facets(filters, fields):
+    facets = _aggregate(facets_pipeline(filters, fields))
+    return facets_result(facets[0] if facets else {}, fields)
+
+
+def dashboard_pipeline(filters, views):
+    """One $facet computing every requested aggregate view over a single $match"""
+    facets = {}
+    if 'metrics' in views:
+        facets['metrics'] = metrics_stages()
+    if 'timeseries' in views:
+        facets['timeseries'] = timeseries_stages()
+    if 'geo' in views:
+        facets['geo'] = geo_stages()
+    if 'topic_distribution' in views:
+        facets['topic_distribution'] = topic_distribution_stages()
+    if 'charts' in views:
+        facets.update({f'charts_{name}': stages for name, stages in charts_facets().items()})
+    if 'network' in views:
+        facets['network_nodes'] = network_node_stages()
+        facets['network_links'] = network_link_stages()
+
+    pipeline = [{'$match': build_query(filters)}]
+    if 'network' in views:
+        pipeline.append({'$sort': {'_id': 1}})
+    pipeline.append({'$facet': facets})
+    return pipeline
+
+
+def aggregate_dashboard(filters, views, base_metrics=None):
+    """Compute several aggregate views in one round trip"""
+    facets = _aggregate(dashboard_pipeline(filters, views)) if views else []
+    facets = facets[0] if facets else {}
+
+    result = {}
+    if 'metrics' in views:
+        result['metrics'] = metrics_result(facets.get('metrics', []), base_metrics)
+    if 'timeseries' in views:
+        result['timeseries'] = timeseries_result(facets.get('timeseries', []))
+    if 'geo' in views:
+        result['geo'] = geo_result(facets.get('geo', []))
+    if 'topic_distribution' in views:
+        result['topic_distribution'] = topic_distribution_result(facets.get('topic_distribution', []))
+    if 'charts' in views:
+        result['charts'] = charts_result({name: facets.get(f'charts_{name}', []) for name in CHART_SUMS})
+    if 'network' in views:
+        result['network'] = network_result(facets.get('network_nodes', []), facets.get('network_links', []))
+    return result
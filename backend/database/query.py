@@ -0,0 +1,311 @@
+import json
+import operator
+import threading
+from collections import OrderedDict
+
+# Stored fields a filter can name, with the type of their request values.
+# end_year is stored as an integer string or 'Unknown' and compared as a
+# year; start_year holds numbers and blanks.
+SCHEMA = {
+    'end_year': 'year',
+    'topic': 'str',
+    'sector': 'str',
+    'region': 'str',
+    'pestle': 'str',
+    'source': 'str',
+    'country': 'str',
+    'city': 'str',
+    'intensity': 'float',
+    'likelihood': 'float',
+    'relevance': 'float',
+    'start_year': 'int',
+}
+
+# Fields filtered by value; the others only take bounds
+VALUE_FIELDS = ['end_year', 'topic', 'sector', 'region', 'pestle', 'source', 'country', 'city']
+
+# Fields that take <field>_min / <field>_max bounds, and the type of the bounds
+RANGE_FIELDS = {
+    field: float if kind == 'float' else int
+    for field, kind in SCHEMA.items() if kind in ['float', 'int', 'year']
+}
+
+# Fields of a stored record, in load order, that a fields= projection may name
+RECORD_FIELDS = [
+    'end_year', 'intensity', 'sector', 'topic', 'insight', 'url', 'region', 'start_year', 'impact',
+    'added', 'published', 'country', 'relevance', 'pestle', 'source', 'title', 'likelihood',
+]
+
+# Request parameters that name a stored field differently
+ALIASES = {'pest': 'pestle'}
+
+# Canonical order of the operators in a predicate
+OPERATORS = ['$eq', '$ne', '$in', '$nin', '$gt', '$gte', '$lt', '$lte']
+
+_COMPARISONS = {
+    '$gt': operator.gt,
+    '$gte': operator.ge,
+    '$lt': operator.lt,
+    '$lte': operator.le,
+}
+
+
+class InvalidFilter(ValueError):
+    """Raised when request arguments do not form a valid filter"""
+
+
+def _unique(values):
+    values = list(dict.fromkeys(value for value in values if value != ''))
+    try:
+        return sorted(values)
+    except TypeError:
+        return sorted(values, key=repr)
+
+
+def _bound(field, name, raw):
+    try:
+        return RANGE_FIELDS[field](raw)
+    except ValueError:
+        raise InvalidFilter(f"{name} must be a number")
+
+
+def _names(field):
+    return [field] + [alias for alias, target in ALIASES.items() if target == field]
+
+
+def parse_filters(args):
+    """Canonical filter dict from request arguments, typed by SCHEMA.
+
+    A single value is a plain equality. Repeated values become an $in
+    set, <field>_not values an $nin set, and <field>_min / <field>_max
+    inclusive $gte / $lte bounds. Aliases such as pest are read as the
+    stored field they name.
+    """
+    filters = {}
+    for field in VALUE_FIELDS:
+        names = _names(field)
+        values = [value for name in names for value in args.getlist(name)]
+        excluded = [value for name in names for value in args.getlist(f'{name}_not')]
+        predicate = {}
+        if values:
+            predicate['$in'] = values
+        if excluded:
+            predicate['$nin'] = excluded
+        if predicate:
+            filters[field] = predicate
+
+    for field in RANGE_FIELDS:
+        predicate = filters.get(field, {})
+        for suffix, op in [('min', '$gte'), ('max', '$lte')]:
+            name = f'{field}_{suffix}'
+            raw = args.get(name)
+            if raw not in [None, '']:
+                predicate[op] = _bound(field, name, raw)
+        if predicate:
+            filters[field] = predicate
+
+    return canonical_filters(filters)
+
+
+def parse_fields(args):
+    """Requested record fields from comma-separated fields= arguments, or None for all of them"""
+    names = [name.strip() for raw in args.getlist('fields') for name in raw.split(',')]
+    fields = list(dict.fromkeys(ALIASES.get(name, name) for name in names if name))
+    unknown = [field for field in fields if field not in RECORD_FIELDS]
+    if unknown:
+        raise InvalidFilter(f"Unknown fields: {', '.join(unknown)}")
+    return fields or None
+
+
+def _canonical_predicate(predicate):
+    if not isinstance(predicate, dict):
+        return predicate
+    unknown = [op for op in predicate if op not in OPERATORS]
+    if unknown:
+        raise InvalidFilter(f"Unsupported filter operator: {unknown[0]}")
+    predicate = {
+        op: _unique(predicate[op]) if op in ['$in', '$nin'] else predicate[op]
+        for op in OPERATORS if op in predicate
+    }
+    if predicate.get('$in') == []:
+        # Blank values only: no constraint, like a blank scalar
+        del predicate['$in']
+    if predicate.get('$nin') == []:
+        del predicate['$nin']
+    if len(predicate.get('$in', [])) == 1:
+        predicate['$eq'] = predicate.pop('$in')[0]
+    if list(predicate) == ['$eq']:
+        # Plain equality keeps its scalar form
+        return predicate['$eq']
+    return {op: predicate[op] for op in OPERATORS if op in predicate} or None
+
+
+def canonical_filters(filters):
+    """Filters with aliases resolved, blanks dropped, keys sorted and sets sorted"""
+    canonical = {}
+    for field, predicate in filters.items():
+        predicate = _canonical_predicate(predicate)
+        if predicate is None or predicate == '':
+            continue
+        canonical[ALIASES.get(field, field)] = predicate
+    return {field: canonical[field] for field in sorted(canonical)}
+
+
+def canonical_key(filters):
+    """String identifying a canonical filter set, for plan and result caching"""
+    return json.dumps(filters, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def is_range(predicate):
+    return isinstance(predicate, dict) and any(op in _COMPARISONS for op in predicate)
+
+
+def parse_year(value):
+    """Integer year of a stored end_year, or None for 'Unknown' and anything non-canonical"""
+    if isinstance(value, str):
+        try:
+            year = int(value)
+        except ValueError:
+            return None
+        return year if str(year) == value else None
+    return None
+
+
+def _comparable(field, value):
+    """Value as MongoDB would compare it with a numeric bound, or None if it cannot match"""
+    if field == 'end_year':
+        return parse_year(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def matches(field, value, predicate):
+    """Whether a stored value satisfies a filter predicate, with MongoDB semantics.
+
+    Numeric bounds on end_year compare the year its string holds.
+    """
+    if not isinstance(predicate, dict):
+        return value == predicate
+    for op, operand in predicate.items():
+        if op == '$eq':
+            if value != operand:
+                return False
+        elif op == '$ne':
+            if value == operand:
+                return False
+        elif op == '$in':
+            if value not in operand:
+                return False
+        elif op == '$nin':
+            if value in operand:
+                return False
+        elif op in _COMPARISONS:
+            number = _comparable(field, value)
+            if number is None or not _COMPARISONS[op](number, operand):
+                return False
+        else:
+            raise InvalidFilter(f"Unsupported filter operator: {op}")
+    return True
+
+
+def year_range_values(predicate, years):
+    """Compile numeric bounds on end_year into the stored year strings they cover.
+
+    The bounds become an $in over the matching years, which an index on
+    end_year answers directly, unlike string comparisons on the column.
+    """
+    compiled = {op: operand for op, operand in predicate.items() if op not in _COMPARISONS}
+    bounds = {op: operand for op, operand in predicate.items() if op in _COMPARISONS}
+    covered = [year for year in years if matches('end_year', year, bounds)]
+    if '$in' in compiled:
+        covered = [year for year in covered if year in compiled['$in']]
+    compiled['$in'] = covered
+    return compiled
+
+
+class QueryPlan:
+    """A canonical filter set compiled into the form each backend runs.
+
+    filters is the canonical filter dict the in-memory paths evaluate,
+    key identifies it for result caching, fields picks a covering cuboid
+    and mongo is the MongoDB query document. An end_year range is
+    compiled against the stored years, once per dataset version.
+    """
+
+    __slots__ = ('filters', 'key', 'fields', 'mongo', 'year_range', '_years')
+
+    def __init__(self, filters, key=None):
+        self.filters = filters
+        self.key = key if key is not None else canonical_key(filters)
+        self.fields = frozenset(filters)
+        self.mongo = dict(filters)
+        self.year_range = is_range(filters.get('end_year'))
+        self._years = None
+
+    def mongo_query(self, version=None, years=None):
+        """The MongoDB query; years() lists the stored end_year values of the given dataset version"""
+        if not self.year_range:
+            return self.mongo
+        compiled = self._years
+        if compiled is None or compiled[0] != version:
+            compiled = self._years = (version, year_range_values(self.filters['end_year'], years()))
+        return {**self.mongo, 'end_year': compiled[1]}
+
+
+class PlanCache:
+    """LRU of compiled plans keyed by their canonical filter set"""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, filters):
+        filters = canonical_filters(filters)
+        key = canonical_key(filters)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+        plan = QueryPlan(filters, key)
+        if self.max_size > 0:
+            with self._lock:
+                self._plans[key] = plan
+                while len(self._plans) > self.max_size:
+                    self._plans.popitem(last=False)
+        return plan
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'plans': len(self._plans),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+        }
+
+
+_plans = PlanCache()
+
+
+def configure_plan_cache(max_size=1024):
+    """Install the process-wide compiled plan cache; 0 disables caching"""
+    global _plans
+    _plans = PlanCache(max_size)
+    return _plans
+
+
+def get_plan_cache():
+    return _plans
+
+
+def compile_filters(filters):
+    """Compiled plan for a filter dict, from the plan cache when it was seen before"""
+    return _plans.compile(filters)
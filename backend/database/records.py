@@ -0,0 +1,184 @@
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from collections.abc import Mapping
+from pathlib import Path
+from .query import RECORD_FIELDS, VALUE_FIELDS
+
+# Categorical fields whose strings are interned, so rows share one copy of each value
+INTERNED_FIELDS = frozenset(VALUE_FIELDS + ['impact', 'published'])
+
+_FIELDS = frozenset(RECORD_FIELDS)
+
+_ABSENT = object()
+
+
+class Record(Mapping):
+    """One visualization record held in slots instead of a dict.
+
+    Behaves as a read-only mapping (get, [], in, keys, items, len), so
+    code written against the row dicts works unchanged. Categorical
+    strings are interned. Fields outside RECORD_FIELDS go in a small side
+    dict. The record becomes a plain dict only when serialized, through
+    to_dict().
+    """
+
+    __slots__ = tuple(RECORD_FIELDS) + ('_extra',)
+
+    def __init__(self, document=()):
+        extra = None
+        for field, value in (document.items() if isinstance(document, Mapping) else document):
+            if field in _FIELDS:
+                if field in INTERNED_FIELDS and type(value) is str:
+                    value = sys.intern(value)
+                setattr(self, field, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[field] = value
+        self._extra = extra
+
+    @classmethod
+    def from_columns(cls, columns, count, missing):
+        """count records from (field, values) columns, leaving out values that are missing"""
+        records = [cls.__new__(cls) for _ in range(count)]
+        clear = cls._extra.__set__
+        for record in records:
+            clear(record, None)
+        for field, values in columns:
+            if field in _FIELDS:
+                assign = getattr(cls, field).__set__
+                for record, value in zip(records, values):
+                    if value is not missing:
+                        assign(record, value)
+            else:
+                for record, value in zip(records, values):
+                    if value is not missing:
+                        if record._extra is None:
+                            record._extra = {}
+                        record._extra[field] = value
+        return records
+
+    def __getitem__(self, field):
+        if field in _FIELDS:
+            try:
+                return getattr(self, field)
+            except AttributeError:
+                pass
+        elif self._extra is not None and field in self._extra:
+            return self._extra[field]
+        raise KeyError(field)
+
+    def get(self, field, default=None):
+        if field in _FIELDS:
+            return getattr(self, field, default)
+        return self._extra.get(field, default) if self._extra is not None else default
+
+    def __contains__(self, field):
+        if field in _FIELDS:
+            return hasattr(self, field)
+        return self._extra is not None and field in self._extra
+
+    def __iter__(self):
+        for field in RECORD_FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """The record as a plain dict, fields in stored order"""
+        row = {}
+        for field in RECORD_FIELDS:
+            value = getattr(self, field, _ABSENT)
+            if value is not _ABSENT:
+                row[field] = value
+        if self._extra is not None:
+            row.update(self._extra)
+        return row
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'Record({self.to_dict()!r})'
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+
+def records_from(documents):
+    """Records for an iterable of documents, such as a cursor"""
+    return [Record(document) for document in documents]
+
+
+def to_json(value):
+    """json.dumps default for records and the other values documents hold"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    return str(value)
+
+
+def _measure(build):
+    """Objects built by build() and the bytes they hold, as traced by tracemalloc"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    built = build()
+    seconds = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return built, size, seconds
+
+
+def benchmark(documents):
+    """Memory held by documents as dicts and as Records, each decoded from its own copy of the JSON.
+
+    Every row is decoded separately, as a MongoDB cursor does, so dict
+    rows each hold their own copy of every string.
+    """
+    raw = [json.dumps(document) for document in documents]
+    dicts, dict_bytes, dict_seconds = _measure(lambda: [json.loads(line) for line in raw])
+    del dicts
+    records, record_bytes, record_seconds = _measure(lambda: [Record(json.loads(line)) for line in raw])
+    del records
+    rows = len(raw)
+    return {
+        'rows': rows,
+        'dict_bytes_per_row': round(dict_bytes / rows, 1) if rows else 0,
+        'record_bytes_per_row': round(record_bytes / rows, 1) if rows else 0,
+        'saved': round(1 - record_bytes / dict_bytes, 4) if dict_bytes else 0,
+        'dict_seconds': round(dict_seconds, 3),
+        'record_seconds': round(record_seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory held by the dataset as dict rows and as Records')
+    parser.add_argument('path', nargs='?', default=str(Path(__file__).parent.parent.parent / 'jsondata.json'), help='JSON array of records')
+    parser.add_argument('--rows', type=int, default=100000, help='rows to build, repeating the file as needed')
+    args = parser.parse_args()
+
+    from .db import clean_data
+    with open(args.path, 'r', encoding='utf-8') as file:
+        documents = clean_data(json.load(file))
+    documents = [documents[i % len(documents)] for i in range(args.rows)] if documents else []
+    print(json.dumps(benchmark(documents), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
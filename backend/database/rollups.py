@@ -0,0 +1,233 @@
+import argparse
+import json
+import logging
+import math
+import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .db import get_database
+
+logger = logging.getLogger(__name__)
+
+SCORE_FIELDS = ['intensity', 'likelihood', 'relevance']
+
+# Rollup name -> fields it is grouped by; 'total' is the whole dataset
+ROLLUP_DIMENSIONS = {
+    'total': [],
+    'end_year': ['end_year'],
+    'country': ['country'],
+    'sector_topic_pestle': ['sector', 'topic', 'pestle'],
+}
+
+# Fields a rollup delta needs from a stored record
+ROLLUP_FIELDS = sorted({field for fields in ROLLUP_DIMENSIONS.values() for field in fields}) + SCORE_FIELDS
+ROLLUP_PROJECTION = {field: 1 for field in ROLLUP_FIELDS}
+
+
+def rollup_id(dimension, values):
+    return {'dimension': dimension, 'values': list(values)}
+
+
+def _frame(records):
+    frame = pd.DataFrame([{field: record.get(field) for field in ROLLUP_FIELDS} for record in records], columns=ROLLUP_FIELDS)
+    for field in SCORE_FIELDS:
+        frame[field] = pd.to_numeric(frame[field], errors='coerce').fillna(0.0)
+    return frame
+
+
+def rollup_deltas(records, sign=1):
+    """Per-rollup count and score sums of some records, negated when sign is -1.
+
+    Returns {(dimension, values): {'count': n, 'intensity': sum, ...}}.
+    """
+    records = list(records)
+    if not records:
+        return {}
+    frame = _frame(records)
+    frame['count'] = 1
+    deltas = {}
+    for dimension, fields in ROLLUP_DIMENSIONS.items():
+        if not fields:
+            sums = frame[['count'] + SCORE_FIELDS].sum()
+            deltas[(dimension, ())] = {name: sign * float(value) for name, value in sums.items()}
+            continue
+        grouped = frame.groupby([frame[field].fillna('Unknown').astype(str) for field in fields], sort=False)
+        for key, sums in grouped[['count'] + SCORE_FIELDS].sum().iterrows():
+            key = key if isinstance(key, tuple) else (key,)
+            deltas[(dimension, key)] = {name: sign * float(value) for name, value in sums.items()}
+    return deltas
+
+
+def merge_deltas(*deltas):
+    merged = {}
+    for delta in deltas:
+        for key, sums in delta.items():
+            target = merged.setdefault(key, dict.fromkeys(sums, 0.0))
+            for name, value in sums.items():
+                target[name] += value
+    return merged
+
+
+def apply_deltas(deltas, db=None):
+    """Add deltas to the stored rollups with one unordered bulk of atomic $inc upserts.
+
+    $inc is commutative, so batches written concurrently by different
+    threads or processes never lose each other's updates. Two writers
+    creating the same rollup at once can race on its upsert; the loser
+    gets a duplicate key error and is retried as a plain $inc.
+    """
+    if not deltas:
+        return
+    db = db if db is not None else get_database()
+    requests = []
+    for (dimension, values), sums in deltas.items():
+        sums = {name: value for name, value in sums.items() if value}
+        if not sums:
+            continue
+        sums['count'] = int(sums.get('count', 0))
+        fields = dict(zip(ROLLUP_DIMENSIONS[dimension], values))
+        requests.append(UpdateOne(
+            {'_id': rollup_id(dimension, values)},
+            {'$inc': sums, '$setOnInsert': {'dimension': dimension, **fields}},
+            upsert=True
+        ))
+    if not requests:
+        return
+    try:
+        db['rollups'].bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != 11000 for error in errors):
+            raise
+        db['rollups'].bulk_write([requests[error['index']] for error in errors], ordered=False)
+
+
+def record_inserted(records, db=None):
+    apply_deltas(rollup_deltas(records), db)
+
+
+def record_replaced(old_records, new_records, db=None):
+    apply_deltas(merge_deltas(rollup_deltas(old_records, -1), rollup_deltas(new_records)), db)
+
+
+def record_deleted(records, db=None):
+    db = db if db is not None else get_database()
+    apply_deltas(rollup_deltas(records, -1), db)
+    # Groups whose last record is gone
+    db['rollups'].delete_many({'count': {'$lte': 0}, 'dimension': {'$ne': 'total'}})
+
+
+def delete_records(query, collection=None, batch_size=5000):
+    """Delete matching records, keeping the rollups in step; returns how many were deleted"""
+    from .db import bump_data_version
+
+    db = get_database()
+    collection = collection if collection is not None else db['visualizations']
+    deleted = 0
+    batch = []
+    for record in collection.find(query, ROLLUP_PROJECTION, batch_size=batch_size):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            deleted += _delete_batch(collection, batch, db)
+            batch = []
+    if batch:
+        deleted += _delete_batch(collection, batch, db)
+    if deleted:
+        bump_data_version()
+    return deleted
+
+
+def _delete_batch(collection, batch, db):
+    result = collection.delete_many({'_id': {'$in': [record['_id'] for record in batch]}})
+    record_deleted(batch, db)
+    return result.deleted_count
+
+
+def metrics_from_total(doc):
+    """base_metrics shaped result from the 'total' rollup"""
+    count = int(doc.get('count', 0)) if doc else 0
+    return {
+        'total_records': count,
+        'avg_intensity': round(doc['intensity'] / count, 2) if count > 0 else 0,
+        'avg_likelihood': round(doc['likelihood'] / count, 2) if count > 0 else 0,
+        'avg_relevance': round(doc['relevance'] / count, 2) if count > 0 else 0
+    }
+
+
+def base_metrics(db=None):
+    """base_metrics read from the 'total' rollup, or None when rollups were never built"""
+    db = db if db is not None else get_database()
+    doc = db['rollups'].find_one({'_id': rollup_id('total', [])})
+    return metrics_from_total(doc) if doc else None
+
+
+def compute_rollups(collection=None):
+    """Recompute every rollup from scratch with one $group per dimension on the server"""
+    collection = collection if collection is not None else get_database()['visualizations']
+    sums = {'count': {'$sum': 1}, **{field: {'$sum': f'${field}'} for field in SCORE_FIELDS}}
+    rollups = {}
+    for dimension, fields in ROLLUP_DIMENSIONS.items():
+        group_id = {field: {'$ifNull': [f'${field}', 'Unknown']} for field in fields} if fields else None
+        for group in collection.aggregate([{'$group': {'_id': group_id, **sums}}], allowDiskUse=True):
+            values = tuple(str(group['_id'][field]) for field in fields) if fields else ()
+            if group['count']:
+                rollups[(dimension, values)] = {name: float(group[name]) for name in ['count'] + SCORE_FIELDS}
+    return rollups
+
+
+def stored_rollups(db=None):
+    db = db if db is not None else get_database()
+    return {
+        (doc['_id']['dimension'], tuple(doc['_id']['values'])): {name: float(doc.get(name, 0)) for name in ['count'] + SCORE_FIELDS}
+        for doc in db['rollups'].find({'count': {'$gt': 0}})
+    }
+
+
+def ensure_rollups(collection=None):
+    """Build the rollups once for a collection loaded before they existed"""
+    db = get_database()
+    collection = collection if collection is not None else db['visualizations']
+    if db['rollups'].find_one({'_id': rollup_id('total', [])}) is None and collection.estimated_document_count():
+        logger.info("No rollups found, computing them from the stored records")
+        rebuild_rollups(collection)
+
+
+def rebuild_rollups(collection=None):
+    """Replace the stored rollups with freshly computed ones"""
+    db = get_database()
+    rollups = compute_rollups(collection)
+    db['rollups'].delete_many({})
+    if rollups:
+        apply_deltas(rollups, db)
+    logger.info(f"Rebuilt {len(rollups)} rollups")
+    return len(rollups)
+
+
+def verify_rollups(collection=None, rel_tol=1e-9, abs_tol=1e-6):
+    """Compare stored rollups with a full recomputation and list every difference"""
+    expected = compute_rollups(collection)
+    stored = stored_rollups()
+    drift = []
+    for key in sorted(set(expected) | set(stored), key=str):
+        want, have = expected.get(key), stored.get(key)
+        if want is None or have is None or any(
+            not math.isclose(want[name], have[name], rel_tol=rel_tol, abs_tol=abs_tol) for name in want
+        ):
+            drift.append({'dimension': key[0], 'values': list(key[1]), 'expected': want, 'stored': have})
+    return {'rollups': len(expected), 'drifted': len(drift), 'drift': drift}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check or rebuild the incrementally maintained rollups')
+    parser.add_argument('--rebuild', action='store_true', help='recompute every rollup from the raw records')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild_rollups()
+    report = verify_rollups()
+    print(json.dumps(report, indent=2))
+    return 1 if report['drifted'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,378 @@
+import argparse
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+import numpy as np
+from bson import ObjectId
+from .db import RECORD_PROJECTION, build_query, current_data_version, get_data_state, get_database
+
+logger = logging.getLogger(__name__)
+
+# Free-text fields that are indexed, as one document per record
+TEXT_FIELDS = ['title', 'insight']
+
+# BM25 term frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+# Segments are merged once there are more than this many
+MAX_SEGMENTS = 8
+
+# Deleted rows are dropped from the postings once they outnumber live ones
+COMPACT_RATIO = 1.0
+
+# Ids fetched per $in query when syncing or applying filters
+FETCH_BATCH_SIZE = 1000
+
+# Windows of ranked candidates checked against the filters with $in
+# queries before the filter's matching ids are streamed instead
+FILTER_ROUNDS = 3
+
+_TOKEN = re.compile(r'[^\W_]+')
+
+STOPWORDS = frozenset('''
+a an and are as at be been but by for from has have in into is it its of on or that the their this to was were will with
+'''.split())
+
+
+def tokenize(text):
+    """Lowercase word tokens of a text, without stopwords and single letters"""
+    if not isinstance(text, str):
+        return []
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+
+def record_terms(record):
+    return Counter(token for field in TEXT_FIELDS for token in tokenize(record.get(field)))
+
+
+class Segment:
+    """Immutable postings of a run of consecutive rows: term -> (rows, term frequencies)"""
+
+    __slots__ = ('postings',)
+
+    def __init__(self, postings):
+        self.postings = postings
+
+    @classmethod
+    def build(cls, start, documents):
+        """Segment for term counts of rows start, start + 1, ..."""
+        rows, tfs = {}, {}
+        for row, terms in enumerate(documents, start):
+            for term, tf in terms.items():
+                rows.setdefault(term, []).append(row)
+                tfs.setdefault(term, []).append(tf)
+        return cls({
+            term: (np.array(rows[term], dtype=np.int32), np.array(tfs[term], dtype=np.float32))
+            for term in rows
+        })
+
+    @classmethod
+    def merge(cls, segments, remap=None):
+        """One segment holding the postings of several, with rows renumbered through remap if given"""
+        parts = {}
+        for segment in segments:
+            for term, posting in segment.postings.items():
+                parts.setdefault(term, []).append(posting)
+        postings = {}
+        for term, posting in parts.items():
+            rows = np.concatenate([rows for rows, _ in posting])
+            tfs = np.concatenate([tfs for _, tfs in posting])
+            if remap is not None:
+                keep = remap[rows] >= 0
+                rows, tfs = remap[rows[keep]], tfs[keep]
+            if len(rows):
+                postings[term] = (rows.astype(np.int32), tfs)
+        return cls(postings)
+
+
+class Snapshot:
+    """One consistent state of the index; replaced as a whole, never modified"""
+
+    __slots__ = ('version', 'rewrites', 'last_id', 'segments', 'ids', 'hashes', 'lengths', 'alive', 'live', 'avgdl')
+
+    def __init__(self, version, segments, ids, hashes, lengths, alive, rewrites=None, last_id=None):
+        self.version = version
+        # Dataset rewrite count synced to, and the highest _id indexed
+        self.rewrites = rewrites
+        self.last_id = last_id
+        self.segments = segments
+        # Row -> record _id and content hash, both as hex
+        self.ids = ids
+        self.hashes = hashes
+        self.lengths = lengths
+        self.alive = alive
+        self.live = int(alive.sum())
+        self.avgdl = float(lengths[alive].mean()) if self.live else 0.0
+
+    @classmethod
+    def empty(cls):
+        return cls(None, (), np.empty(0, dtype='S24'), np.empty(0, dtype='S40'), np.empty(0, dtype=np.float32), np.empty(0, dtype=bool))
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    def postings(self, term):
+        """Live rows holding term and their term frequencies, across segments"""
+        parts = [segment.postings[term] for segment in self.segments if term in segment.postings]
+        if not parts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        rows = np.concatenate([rows for rows, _ in parts])
+        tfs = np.concatenate([tfs for _, tfs in parts])
+        live = self.alive[rows]
+        return rows[live], tfs[live]
+
+    def score(self, terms):
+        """Candidate rows and their BM25 scores for the query terms"""
+        all_rows, all_scores = [], []
+        for term in dict.fromkeys(terms):
+            rows, tfs = self.postings(term)
+            if not len(rows):
+                continue
+            idf = math.log(1 + (self.live - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = K1 * (1 - B + B * self.lengths[rows] / self.avgdl)
+            all_rows.append(rows)
+            all_scores.append(idf * tfs * (K1 + 1) / (tfs + norm))
+        if not all_rows:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+        rows = np.concatenate(all_rows)
+        weights = np.concatenate(all_scores).astype(np.float64)
+        if len(rows) * 8 > self.size:
+            # Common terms: a dense sum over every row beats sorting the postings
+            scores = np.bincount(rows, weights=weights, minlength=self.size)
+            # BM25 term scores are always positive, so a zero sum means no match
+            candidates = np.flatnonzero(scores).astype(np.int32)
+            return candidates, scores[candidates]
+        candidates, inverse = np.unique(rows, return_inverse=True)
+        return candidates, np.bincount(inverse.reshape(-1), weights=weights)
+
+
+def ranked(rows, scores, count):
+    """Positions of the count best scores, best first; ties go to the row loaded first"""
+    if count < len(scores):
+        # Keep every row tied with the count-th score so the order is total
+        # and a longer ranking always extends a shorter one
+        cutoff = -np.partition(-scores, count - 1)[count - 1]
+        top = np.flatnonzero(scores >= cutoff)
+    else:
+        top = np.arange(len(scores))
+    return top[np.lexsort((rows[top], -scores[top]))][:count]
+
+
+class SearchIndex:
+    """In-memory inverted index over the text fields of the visualizations collection.
+
+    Postings live in immutable segments and every change publishes a new
+    Snapshot, so searches never lock. When the dataset version changes the
+    index syncs incrementally. When every change since the last sync only
+    appended records, just the records after the highest indexed _id are
+    read. Otherwise records whose _id and content hash it already holds
+    are kept, new and changed ones are tokenized into a new segment, and
+    removed or replaced rows are marked dead until the next compaction.
+    """
+
+    def __init__(self, version_check_interval=5.0):
+        self.version_check_interval = version_check_interval
+        self._snapshot = Snapshot.empty()
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self):
+        snapshot = self._snapshot
+        version = current_data_version(self.version_check_interval)
+        if snapshot.version != version:
+            # One thread syncs; the others keep reading the previous snapshot
+            blocking = snapshot.version is None
+            if self._lock.acquire(blocking=blocking):
+                try:
+                    if self._snapshot.version != version:
+                        self.sync()
+                finally:
+                    self._lock.release()
+            snapshot = self._snapshot
+        return snapshot
+
+    def sync(self, collection=None):
+        """Bring the index in line with the collection; returns the rows added and removed"""
+        collection = collection if collection is not None else get_database()['visualizations']
+        started = time.perf_counter()
+        state = get_data_state()
+        version = state['version']
+        old = self._snapshot
+        projection = {field: 1 for field in TEXT_FIELDS + ['content_hash']}
+
+        if not old.size:
+            records = list(collection.find({}, projection))
+            removed = np.empty(0, dtype=bool)
+        elif state['rewrites'] == old.rewrites and old.last_id is not None:
+            # Only appends since the last sync: every new record sorts after the indexed ones
+            records = list(collection.find({'_id': {'$gt': old.last_id}}, projection))
+            removed = np.empty(0, dtype=bool)
+        else:
+            stored = list(collection.find({}, {'content_hash': 1}))
+            stored_keys = np.array([_key(doc) for doc in stored], dtype='S64')
+            held_keys = np.char.add(old.ids, old.hashes)
+            # Without a content hash a rewrite cannot be told from an unchanged
+            # record, so such records are always reindexed
+            unhashed = old.hashes == b''
+            removed = old.alive & (unhashed | ~np.isin(held_keys, stored_keys))
+            kept = held_keys[old.alive & ~unhashed]
+            fresh = [doc['_id'] for doc, held in zip(stored, np.isin(stored_keys, kept)) if not held]
+            records = []
+            for start in range(0, len(fresh), FETCH_BATCH_SIZE):
+                chunk = fresh[start:start + FETCH_BATCH_SIZE]
+                records.extend(collection.find({'_id': {'$in': chunk}}, projection))
+
+        last_id = max([record['_id'] for record in records] + ([old.last_id] if old.last_id is not None else []), default=None)
+        self._snapshot = self._apply(old, version, records, removed, state['rewrites'], last_id)
+        added, dropped = len(records), int(removed.sum())
+        logger.info(
+            f"Search index synced to dataset version {version}: {added} added, {dropped} removed, "
+            f"{self._snapshot.live} live rows in {time.perf_counter() - started:.2f}s"
+        )
+        return {'added': added, 'removed': dropped}
+
+    def _apply(self, old, version, records, removed, rewrites, last_id):
+        documents = [record_terms(record) for record in records]
+        ids = np.concatenate([old.ids, np.array([str(record['_id']) for record in records], dtype='S24')])
+        hashes = np.concatenate([old.hashes, np.array([record.get('content_hash') or '' for record in records], dtype='S40')])
+        lengths = np.concatenate([old.lengths, np.array([sum(terms.values()) for terms in documents], dtype=np.float32)])
+        alive = np.concatenate([old.alive & ~removed if len(removed) else old.alive, np.ones(len(records), dtype=bool)])
+
+        segments = old.segments + ((Segment.build(old.size, documents),) if records else ())
+        dead = len(alive) - int(alive.sum())
+        if dead and dead > alive.sum() * COMPACT_RATIO:
+            # Renumber the live rows and drop the dead ones everywhere
+            remap = np.full(len(alive), -1, dtype=np.int64)
+            remap[alive] = np.arange(int(alive.sum()))
+            segments = (Segment.merge(segments, remap),)
+            ids, hashes, lengths = ids[alive], hashes[alive], lengths[alive]
+            alive = np.ones(len(ids), dtype=bool)
+        elif len(segments) > MAX_SEGMENTS:
+            segments = (Segment.merge(segments),)
+        return Snapshot(version, segments, ids, hashes, lengths, alive, rewrites, last_id)
+
+    def search(self, query, limit=10, filters=None, collection=None):
+        """Best matching records for a text query, as (score, record) pairs.
+
+        Candidates are scored with BM25 from the postings of the query
+        terms. With filters, candidates are checked against MongoDB in
+        rank order, a growing window of at most FETCH_BATCH_SIZE ids at a
+        time, for FILTER_ROUNDS rounds. If limit of them have not matched
+        by then the filter is selective, so the ids it matches are
+        streamed from its index and the candidates ranked among them.
+        """
+        snapshot = self.snapshot
+        collection = collection if collection is not None else get_database()['visualizations']
+        rows, scores = snapshot.score(tokenize(query))
+        if not len(rows) or limit <= 0:
+            return []
+        query = build_query(filters or {})
+
+        def ids_at(positions):
+            return [ObjectId(raw.decode('ascii')) for raw in snapshot.ids[rows[positions]]]
+
+        if not query:
+            order = ranked(rows, scores, min(limit, len(rows))).tolist()
+            hits = [(float(scores[position]), _id) for position, _id in zip(order, ids_at(order))]
+        else:
+            hits = []
+            checked = 0
+            window = min(limit * 4, FETCH_BATCH_SIZE)
+            for _ in range(FILTER_ROUNDS):
+                if len(hits) >= limit or checked >= len(rows):
+                    break
+                order = ranked(rows, scores, min(checked + window, len(rows)))[checked:].tolist()
+                checked += len(order)
+                window = min(window * 4, FETCH_BATCH_SIZE)
+                ids = ids_at(order)
+                matching = {doc['_id'] for doc in collection.find({'$and': [query, {'_id': {'$in': ids}}]}, {'_id': 1})}
+                hits.extend((float(scores[position]), _id) for position, _id in zip(order, ids) if _id in matching)
+            if len(hits) < limit and checked < len(rows):
+                hits = self._selective_hits(snapshot, rows, scores, query, limit, collection)
+        hits = hits[:limit]
+
+        records = {doc['_id']: doc for doc in collection.find({'_id': {'$in': [_id for _, _id in hits]}}, {**RECORD_PROJECTION, '_id': 1})}
+        results = []
+        for score, _id in hits:
+            record = records.get(_id)
+            if record is not None:
+                record.pop('_id')
+                results.append((score, record))
+        return results
+
+    def _selective_hits(self, snapshot, rows, scores, query, limit, collection):
+        """Best limit candidates among the records a selective filter matches, read off its index"""
+        position_of = {raw: position for position, raw in enumerate(snapshot.ids[rows].tolist())}
+        matching = [
+            position_of[key] for key in (str(doc['_id']).encode('ascii') for doc in collection.find(query, {'_id': 1}))
+            if key in position_of
+        ]
+        if not matching:
+            return []
+        matching = np.array(matching)
+        order = matching[ranked(rows[matching], scores[matching], min(limit, len(matching)))]
+        return [(float(scores[position]), ObjectId(snapshot.ids[rows[position]].decode('ascii'))) for position in order.tolist()]
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version,
+            'rows': snapshot.size,
+            'live': snapshot.live,
+            'segments': len(snapshot.segments),
+            'terms': len({term for segment in snapshot.segments for term in segment.postings}),
+            'postings': sum(len(rows) for segment in snapshot.segments for rows, _ in segment.postings.values()),
+        }
+
+
+def _key(doc):
+    return (str(doc['_id']) + (doc.get('content_hash') or '')).encode('ascii')
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def configure_search(version_check_interval=5.0):
+    """Install the process-wide search index; it is built on first use"""
+    global _index
+    with _index_lock:
+        _index = SearchIndex(version_check_interval)
+        return _index
+
+
+def get_search_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SearchIndex()
+    return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the full-text index and run a query against it')
+    parser.add_argument('query', nargs='?', help='text to search for')
+    parser.add_argument('--limit', type=int, default=10, help='results to show')
+    args = parser.parse_args()
+
+    index = SearchIndex()
+    index.sync()
+    report = {'index': index.stats()}
+    if args.query:
+        started = time.perf_counter()
+        results = index.search(args.query, args.limit)
+        report['ms'] = round((time.perf_counter() - started) * 1000, 2)
+        report['results'] = [{'score': round(score, 4), 'title': record.get('title')} for score, record in results]
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,281 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import numpy as np
+from .bitmap import BitmapIndex
+from .columnar import ColumnarStore, Dictionary, _MISSING
+from .db import RECORD_PROJECTION, current_data_version, get_database
+
+logger = logging.getLogger(__name__)
+
+# File signature; the last byte is the layout version
+MAGIC = b'VDSNAP\x00\x01'
+FORMAT_VERSION = 1
+
+# Buffers start on cache-line boundaries
+ALIGNMENT = 64
+
+# Kinds of the values in an object column
+KIND_MISSING, KIND_STRING, KIND_JSON = 0, 1, 2
+
+_HEADER = struct.Struct('<8sQ')
+
+
+class InvalidSnapshot(ValueError):
+    """Raised when a snapshot file is missing, truncated or of another layout version"""
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class PackedColumn:
+    """Read-only object column over a memory-mapped buffer.
+
+    Strings are stored as UTF-8 and other values as JSON, one after the
+    other, with an offset and a kind per row. Only the rows asked for are
+    decoded, so opening a snapshot does not touch the text itself.
+    """
+
+    def __init__(self, offsets, kinds, data, start=0):
+        self.offsets = offsets
+        self.kinds = kinds
+        # Bytes or the whole mapping, with the column's data at start
+        self.data = data
+        self.start = start
+
+    @classmethod
+    def pack(cls, values):
+        """Offsets, kinds and data bytes of a sequence of values"""
+        kinds = np.empty(len(values), dtype=np.uint8)
+        chunks = []
+        for i, value in enumerate(values):
+            if value is _MISSING:
+                kinds[i] = KIND_MISSING
+                chunks.append(b'')
+            elif isinstance(value, str):
+                kinds[i] = KIND_STRING
+                chunks.append(value.encode('utf-8'))
+            else:
+                kinds[i] = KIND_JSON
+                chunks.append(json.dumps(value, default=str).encode('utf-8'))
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+        return offsets, kinds, b''.join(chunks)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def _value(self, kind, start, end):
+        if kind == KIND_STRING:
+            return self.data[self.start + start:self.start + end].decode('utf-8')
+        if kind == KIND_JSON:
+            return json.loads(self.data[self.start + start:self.start + end])
+        return _MISSING
+
+    def __getitem__(self, idx):
+        idx = np.arange(len(self))[idx] if isinstance(idx, slice) else np.asarray(idx)
+        values = np.empty(len(idx), dtype=object)
+        values[:] = [
+            self._value(kind, start, end)
+            for kind, start, end in zip(self.kinds[idx].tolist(), self.offsets[idx].tolist(), self.offsets[idx + 1].tolist())
+        ]
+        return values
+
+    def __iter__(self):
+        return iter(self[:].tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:]
+
+    def tolist(self):
+        return self[:].tolist()
+
+
+def _object_column(values):
+    if isinstance(values, PackedColumn):
+        return values.offsets, values.kinds, values.data[values.start:values.start + int(values.offsets[-1])]
+    return PackedColumn.pack(values.tolist())
+
+
+def _dictionary_values(dictionary):
+    return {
+        'values': [None if value is _MISSING else value for value in dictionary.values],
+        'missing': dictionary.code_of(_MISSING),
+    }
+
+
+def write_snapshot(store, path, dataset_version):
+    """Write a ColumnarStore to path as a snapshot of the given dataset version.
+
+    The file holds a JSON header followed by aligned column buffers:
+    float64 scores, the int32 end_year column, int32 categorical codes
+    with their dictionaries in the header, one word matrix per bitmap
+    index and the remaining fields as packed values. It is written under
+    a temporary name and moved into place, so readers never see half a
+    file. Returns the size in bytes.
+    """
+    started = time.perf_counter()
+    buffers = []
+
+    def add(name, array):
+        buffers.append((name, np.ascontiguousarray(array)))
+
+    for field, column in store.numeric.items():
+        add(f'numeric/{field}', column)
+    add('end_year', store.end_year)
+    for field, codes in store.codes.items():
+        add(f'codes/{field}', codes)
+    index_codes = {}
+    for field, index in store.indexes.items():
+        codes = sorted(index.bitmaps)
+        index_codes[field] = codes
+        words = np.stack([index.get(code) for code in codes]) if codes else np.empty((0, 0), dtype=np.uint64)
+        add(f'index/{field}', words)
+    for field, values in store.objects.items():
+        offsets, kinds, data = _object_column(values)
+        add(f'objects/{field}/offsets', offsets)
+        add(f'objects/{field}/kinds', kinds)
+        add(f'objects/{field}/data', np.frombuffer(data, dtype=np.uint8))
+
+    layout, offset = {}, 0
+    for name, array in buffers:
+        offset = _aligned(offset)
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += array.nbytes
+
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'dataset_version': dataset_version,
+        'size': store.size,
+        'field_order': store.field_order,
+        'dictionaries': {field: _dictionary_values(dictionary) for field, dictionary in store.dictionaries.items()},
+        'indexes': index_codes,
+        'objects': list(store.objects),
+        'buffers': layout,
+    }, separators=(',', ':'), default=str).encode('utf-8')
+    base = _aligned(_HEADER.size + len(header))
+
+    temp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp, 'wb') as file:
+            file.write(_HEADER.pack(MAGIC, len(header)))
+            file.write(header)
+            for name, array in buffers:
+                file.seek(base + layout[name]['offset'])
+                file.write(array.tobytes())
+            file.truncate(base + offset)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+    size = base + offset
+    logger.info(f"Wrote a snapshot of {store.size} records at dataset version {dataset_version} to {path} ({size} bytes) in {time.perf_counter() - started:.2f}s")
+    return size
+
+
+def read_header(path):
+    """The header of a snapshot file and the offset its buffers start at"""
+    try:
+        with open(path, 'rb') as file:
+            magic, length = _HEADER.unpack(file.read(_HEADER.size))
+            if magic != MAGIC:
+                raise InvalidSnapshot(f"{path} is not a snapshot of layout version {FORMAT_VERSION}")
+            header = json.loads(file.read(length))
+    except (OSError, struct.error, ValueError) as e:
+        if isinstance(e, InvalidSnapshot):
+            raise
+        raise InvalidSnapshot(f"Cannot read snapshot {path}: {e}")
+    if header.get('format') != FORMAT_VERSION:
+        raise InvalidSnapshot(f"{path} is a snapshot of layout version {header.get('format')}, expected {FORMAT_VERSION}")
+    return header, _aligned(_HEADER.size + length)
+
+
+def load_snapshot(path):
+    """A ColumnarStore over a memory-mapped snapshot, and the dataset version it holds.
+
+    Columns and bitmaps are read-only views of the mapping, so processes
+    opening the same file share its pages through the OS page cache and
+    nothing is read until a query touches it.
+    """
+    header, base = read_header(path)
+    with open(path, 'rb') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def buffer(name):
+        spec = header['buffers'][name]
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        if base + spec['offset'] + count * dtype.itemsize > len(mapping):
+            raise InvalidSnapshot(f"Snapshot {path} is truncated")
+        return np.frombuffer(mapping, dtype=dtype, count=count, offset=base + spec['offset']).reshape(spec['shape'])
+
+    store = ColumnarStore()
+    store.size = header['size']
+    store.field_order = header['field_order']
+    store.numeric = {name.split('/', 1)[1]: buffer(name) for name in header['buffers'] if name.startswith('numeric/')}
+    store.end_year = buffer('end_year')
+    store.codes = {name.split('/', 1)[1]: buffer(name) for name in header['buffers'] if name.startswith('codes/')}
+
+    for field, stored in header['dictionaries'].items():
+        dictionary = Dictionary()
+        dictionary.values = [_MISSING if code == stored['missing'] else value for code, value in enumerate(stored['values'])]
+        dictionary.index = {value: code for code, value in enumerate(dictionary.values)}
+        store.dictionaries[field] = dictionary
+
+    for field, codes in header['indexes'].items():
+        index = BitmapIndex()
+        index.size = store.size
+        words = buffer(f'index/{field}')
+        index.bitmaps = {code: words[i] for i, code in enumerate(codes)}
+        store.indexes[field] = index
+
+    for field in header['objects']:
+        data = f'objects/{field}/data'
+        # Checks the bounds; values are then sliced from the mapping itself, which yields bytes
+        buffer(data)
+        store.objects[field] = PackedColumn(
+            buffer(f'objects/{field}/offsets'),
+            buffer(f'objects/{field}/kinds'),
+            mapping,
+            base + header['buffers'][data]['offset']
+        )
+    return store, header['dataset_version']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the dataset to a memory-mappable columnar snapshot, or inspect one')
+    parser.add_argument('path', nargs='?', default=os.getenv('SNAPSHOT_PATH') or 'dataset.snapshot', help='snapshot file')
+    parser.add_argument('--info', action='store_true', help='open an existing snapshot and report on it instead of writing one')
+    args = parser.parse_args()
+
+    if not args.info:
+        started = time.perf_counter()
+        version = current_data_version(0)
+        store = ColumnarStore.from_records(get_database()['visualizations'].find({}, RECORD_PROJECTION))
+        size = write_snapshot(store, args.path, version)
+        print(json.dumps({'path': args.path, 'records': store.size, 'dataset_version': version,
+                          'bytes': size, 'seconds': round(time.perf_counter() - started, 3)}, indent=2))
+        return 0
+
+    started = time.perf_counter()
+    try:
+        store, version = load_snapshot(args.path)
+    except InvalidSnapshot as e:
+        logger.error(str(e))
+        return 1
+    print(json.dumps({'path': args.path, 'records': store.size, 'dataset_version': version,
+                      'bytes': os.path.getsize(args.path), 'open_ms': round((time.perf_counter() - started) * 1000, 2)}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
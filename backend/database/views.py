@@ -0,0 +1,67 @@
+from .aggregators import (
+    MetricsAccumulator,
+    ChartsAccumulator,
+    TimeSeriesAccumulator,
+    NetworkAccumulator,
+    GeoAccumulator,
+    TopicHierarchyAccumulator,
+    FacetAccumulator,
+    facet_counts,
+    hierarchy_to_tree,
+    scan
+)
+
+# Accumulator factory for each view; adding a chart means registering one
+# here, and build_views() still makes a single pass over the records
+VIEW_ACCUMULATORS = {
+    'metrics': MetricsAccumulator,
+    'timeseries': TimeSeriesAccumulator,
+    'network': NetworkAccumulator,
+    'geo': GeoAccumulator,
+    'topic_distribution': TopicHierarchyAccumulator,
+    'charts': ChartsAccumulator,
+}
+
+
+def build_views(data, views, base_metrics=None):
+    """Compute several views in one pass over the records"""
+    accumulators = {}
+    for view in views:
+        factory = VIEW_ACCUMULATORS[view]
+        accumulators[view] = factory(base_metrics) if view == 'metrics' else factory()
+    return scan(data, accumulators)
+
+
+def build_metrics(data, base_metrics):
+    """Calculate averages for a filtered result, keeping total records from the base metrics"""
+    return build_views(data, ['metrics'], base_metrics)['metrics']
+
+
+def build_timeseries(data):
+    """Average intensity, likelihood and relevance per end year"""
+    return build_views(data, ['timeseries'])['timeseries']
+
+
+def build_network(data):
+    """Build topic/sector/region nodes and their co-occurrence links"""
+    return build_views(data, ['network'])['network']
+
+
+def build_geo(data):
+    """Average scores and record counts per country"""
+    return build_views(data, ['geo'])['geo']
+
+
+def build_topic_distribution(data):
+    """Build the sector -> topic -> pestle hierarchy used by the treemap"""
+    return build_views(data, ['topic_distribution'])['topic_distribution']
+
+
+def build_charts(data):
+    """Intensity by sector, likelihood by region and relevance by year, summed"""
+    return build_views(data, ['charts'])['charts']
+
+
+def build_facets(data, filters, fields):
+    """Value counts per facet field, conditioned on the other filters, in one pass"""
+    return scan(data, {'facets': FacetAccumulator(filters, fields)})['facets']
@@ -0,0 +1,250 @@
+import argparse
+import gc
+import logging
+import mmap
+import os
+import signal
+import socket
+import time
+import numpy as np
+from werkzeug.serving import make_server
+from app import create_app
+from database.db import current_data_version, init_db
+from database.engine import get_engine
+
+logger = logging.getLogger('serve')
+
+# Seconds between checks of the workers and the dataset version
+TICK = 0.5
+
+
+class PreforkServer:
+    """Serve the app from worker processes forked off one loaded master.
+
+    The master initializes the database and loads the query engine once,
+    then forks the workers, so they share the loaded dataset copy-on-write
+    (or the pages of its memory-mapped snapshot). Each worker handles one
+    request at a time on the shared listening socket.
+
+    The master keeps the worker count up. It kills workers whose heartbeat
+    stops for longer than timeout, and replaces workers that have served
+    max_requests. When the dataset version changes, or on SIGHUP, the
+    master reloads the data and starts a new generation of workers. The
+    old generation finishes its in-flight requests and exits. SIGTERM or
+    SIGINT stops everything gracefully.
+    """
+
+    def __init__(self, app, host='0.0.0.0', port=5000, workers=2, max_requests=0, timeout=30,
+                 graceful_timeout=30, version_check_interval=5.0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        self.version_check_interval = version_check_interval
+        self.version = None
+        self.socket = None
+        # pid -> heartbeat slot of the current generation, and of workers being retired
+        self.children = {}
+        self.retiring = {}
+        self.retire_deadline = None
+        # One last-seen timestamp per slot, in memory shared with the workers
+        # (room for a generation still retiring while another is replaced)
+        self.heartbeats = np.frombuffer(mmap.mmap(-1, 8 * workers * 4), dtype=np.float64)
+        self.stopping = False
+        self.reload_requested = False
+
+    def preload(self):
+        """Initialize the database and load everything the engine keeps in memory"""
+        started = time.perf_counter()
+        init_db()
+        engine = get_engine()
+        engine.warm()
+        self.version = current_data_version(0)
+        # Keep the garbage collector from writing to the pages shared with the workers
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        logger.info(f"Loaded dataset version {self.version} into the {engine.name} engine in {time.perf_counter() - started:.2f}s")
+
+    def run(self):
+        self.socket = socket.create_server((self.host, self.port), backlog=2048)
+        # Workers race for connections; the losers must not block in accept()
+        self.socket.setblocking(False)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+
+        self.preload()
+        logger.info(f"Listening on http://{self.host}:{self.port} with {self.workers} workers (master pid {os.getpid()})")
+        try:
+            while not self.stopping:
+                self._reap()
+                self._check_heartbeats()
+                self._check_version()
+                self._retire_overdue()
+                while len(self.children) < self.workers and not self.stopping and self._spawn():
+                    pass
+                time.sleep(TICK)
+        finally:
+            self._shutdown()
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _free_slot(self):
+        used = set(self.children.values()) | set(self.retiring.values())
+        return next((slot for slot in range(len(self.heartbeats)) if slot not in used), None)
+
+    def _spawn(self):
+        """Fork one worker; False when every heartbeat slot is still taken by retiring workers"""
+        slot = self._free_slot()
+        if slot is None:
+            return False
+        self.heartbeats[slot] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self._work(slot)
+            except Exception as e:
+                logger.error(f"Worker {os.getpid()} failed: {str(e)}")
+                status = 1
+            finally:
+                os._exit(status)
+        self.children[pid] = slot
+        logger.info(f"Started worker {pid}")
+        return True
+
+    def _work(self, slot):
+        """Worker loop: serve requests until told to stop or max_requests is reached"""
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        served = [0]
+
+        def counted(environ, start_response):
+            served[0] += 1
+            return self.app(environ, start_response)
+
+        server = make_server(self.host, self.port, counted, fd=self.socket.fileno())
+        # Wake up regularly to beat the heart even when idle
+        server.timeout = min(1.0, self.timeout / 2)
+        while not stopping and not (self.max_requests and served[0] >= self.max_requests):
+            self.heartbeats[slot] = time.monotonic()
+            server.handle_request()
+        if not stopping:
+            logger.info(f"Worker {os.getpid()} served {served[0]} requests, recycling")
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.children:
+                del self.children[pid]
+                if os.WIFSIGNALED(status) or os.WEXITSTATUS(status) != 0:
+                    logger.error(f"Worker {pid} exited unexpectedly with status {status}")
+            self.retiring.pop(pid, None)
+
+    def _check_heartbeats(self):
+        now = time.monotonic()
+        for pid, slot in list(self.children.items()) + list(self.retiring.items()):
+            if now - self.heartbeats[slot] > self.timeout:
+                logger.error(f"Worker {pid} has not responded for {now - self.heartbeats[slot]:.0f}s, killing it")
+                self._kill(pid, signal.SIGKILL)
+
+    def _check_version(self):
+        try:
+            version = current_data_version(self.version_check_interval)
+        except Exception as e:
+            logger.error(f"Error checking the dataset version: {str(e)}")
+            return
+        if self.reload_requested or version != self.version:
+            self.reload_requested = False
+            self._reload(version)
+
+    def _reload(self, version):
+        """Load the current dataset, then replace every worker with one forked from the new state"""
+        logger.info(f"Reloading dataset version {version} and replacing the workers")
+        try:
+            get_engine().reload()
+            self.preload()
+        except Exception as e:
+            # The running workers keep serving and reload the data themselves
+            logger.error(f"Error reloading the dataset: {str(e)}")
+            self.version = version
+            return
+        self.retiring.update(self.children)
+        self.children = {}
+        self.retire_deadline = time.monotonic() + self.graceful_timeout
+        for pid in self.retiring:
+            self._kill(pid, signal.SIGTERM)
+
+    def _retire_overdue(self):
+        if self.retiring and time.monotonic() > self.retire_deadline:
+            for pid in self.retiring:
+                logger.error(f"Worker {pid} did not finish within {self.graceful_timeout}s, killing it")
+                self._kill(pid, signal.SIGKILL)
+
+    def _kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _shutdown(self):
+        """Let every worker finish its request, killing those that take longer than graceful_timeout"""
+        logger.info("Shutting down")
+        self.retiring.update(self.children)
+        self.children = {}
+        for pid in self.retiring:
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.retiring and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self.retiring:
+            self._kill(pid, signal.SIGKILL)
+        self._reap()
+        self.socket.close()
+
+
+def main():
+    app = create_app()
+    config = app.config
+    parser = argparse.ArgumentParser(description='Serve the API from pre-forked worker processes sharing one loaded dataset')
+    parser.add_argument('--host', default=config['SERVER_HOST'], help='address to listen on')
+    parser.add_argument('--port', type=int, default=config['SERVER_PORT'], help='port to listen on')
+    parser.add_argument('--workers', type=int, default=config['SERVER_WORKERS'], help='worker processes')
+    parser.add_argument('--max-requests', type=int, default=config['SERVER_MAX_REQUESTS'], help='requests before a worker is replaced (0 never)')
+    parser.add_argument('--timeout', type=float, default=config['SERVER_WORKER_TIMEOUT'], help='seconds without a heartbeat before a worker is killed')
+    parser.add_argument('--graceful-timeout', type=float, default=config['SERVER_GRACEFUL_TIMEOUT'], help='seconds workers get to finish on reload or shutdown')
+    args = parser.parse_args()
+
+    server = PreforkServer(
+        app,
+        host=args.host,
+        port=args.port,
+        workers=max(args.workers, 1),
+        max_requests=args.max_requests,
+        timeout=args.timeout,
+        graceful_timeout=args.graceful_timeout,
+        version_check_interval=config['DATA_VERSION_CHECK_INTERVAL']
+    )
+    server.run()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
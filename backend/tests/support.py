@@ -0,0 +1,97 @@
+"""Shared fixtures: an in-memory MongoDB, through mongomock, loaded from jsondata.json"""
+import functools
+import json
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import MultiDict
+from database import db
+from database.query import parse_filters
+
+try:
+    import mongomock
+    from mongomock.collection import BulkOperationBuilder
+except ImportError:
+    mongomock = None
+
+JSON_PATH = Path(__file__).parent.parent.parent / 'jsondata.json'
+
+# Query strings covering equality, multi-value, negated and range filters
+FILTER_QUERIES = [
+    '',
+    'topic=oil',
+    'region=Northern America&sector=Energy',
+    'sector=Energy&sector=Retail',
+    'region_not=World&topic=gas',
+    'end_year_min=2018&end_year_max=2030',
+    'intensity_min=6&pestle=Economic',
+    'sector=No such sector',
+]
+
+
+def filters_from(query):
+    """Canonical filters for a query string, as the API parses them"""
+    return parse_filters(MultiDict(parse_qsl(query)))
+
+
+def raw_records(count=300):
+    """The first count records of jsondata.json, as stored in the file"""
+    with open(JSON_PATH) as f:
+        return json.load(f)[:count]
+
+
+def _without_sort(method):
+    # pymongo 4.11+ passes sort= for every bulk update and replace; older
+    # mongomock builders do not take it, and these tests never set it
+    @functools.wraps(method)
+    def wrapper(self, *args, sort=None, **kwargs):
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+if mongomock is not None:
+    for _name in ['add_update', 'add_replace']:
+        _method = getattr(BulkOperationBuilder, _name)
+        if 'sort' not in _method.__code__.co_varnames:
+            setattr(BulkOperationBuilder, _name, _without_sort(_method))
+
+
+def _atomic(method, lock=threading.RLock()):
+    # MongoDB applies each write to a document atomically; mongomock reads,
+    # modifies and stores it in Python, so concurrent $inc could lose counts
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with lock:
+            return method(*args, **kwargs)
+    return wrapper
+
+
+if mongomock is not None:
+    for _name in ['_insert', '_update']:
+        setattr(mongomock.collection.Collection, _name, _atomic(getattr(mongomock.collection.Collection, _name)))
+
+
+@unittest.skipIf(mongomock is None, 'mongomock is not installed')
+class MongoTestCase(unittest.TestCase):
+    """Test case with the process-wide connection pointed at a fresh in-memory MongoDB per test"""
+
+    def setUp(self):
+        client = mongomock.MongoClient()
+        patch = mock.patch.object(db, 'MongoClient', lambda *args, **kwargs: client)
+        patch.start()
+        self.addCleanup(patch.stop)
+        db.configure_connection('mongodb://localhost', health_check_interval=0)
+        self.addCleanup(db.close_connection)
+        # Forget the dataset version cached from the previous test's database
+        db._data_version.update(value=None, fetched_at=0.0)
+        self.db = db.get_database()
+        self.collection = self.db['visualizations']
+
+    def seed(self, count=300):
+        """Store the first count records of jsondata.json, cleaned, with the base metrics; returns them"""
+        records = db.clean_data(raw_records(count))
+        self.collection.insert_many(records)
+        self.db['base_metrics'].insert_one(db.calculate_base_metrics(records))
+        return records
@@ -0,0 +1,67 @@
+import asyncio
+from database import aio
+from database.aio import AsyncEngine
+from database.engine import DASHBOARD_VIEWS, configure_engine, get_engine
+from .support import MongoTestCase, filters_from
+
+FILTER_SETS = [filters_from(query) for query in ['', 'topic=oil', 'region=Northern America&sector=Energy']]
+
+
+class AsyncEngineTest(MongoTestCase):
+    """AsyncEngine against an in-memory MongoDB loaded with part of jsondata.json"""
+
+    def setUp(self):
+        super().setUp()
+        self.seed()
+        self.engine = configure_engine('mongo', cube=False)
+        self.async_engine = AsyncEngine(4, self.engine)
+        self.addCleanup(self.async_engine.close)
+
+    def test_filters_match_records(self):
+        for filters in FILTER_SETS:
+            with self.subTest(filters=filters):
+                self.assertTrue(get_engine().page(filters, 1)[0])
+
+    def test_dashboard_matches_engine(self):
+        for filters in FILTER_SETS:
+            with self.subTest(filters=filters):
+                expected = get_engine().dashboard(filters, DASHBOARD_VIEWS)
+                self.assertEqual(asyncio.run(self.async_engine.dashboard(filters, DASHBOARD_VIEWS)), expected)
+
+    def test_fanned_out_views_match_engine(self):
+        views = [view for view in DASHBOARD_VIEWS if view != 'data']
+        self.assertTrue(self.async_engine.fans_out(views))
+        self.assertFalse(self.async_engine.fans_out(DASHBOARD_VIEWS))
+        for filters in FILTER_SETS:
+            with self.subTest(filters=filters):
+                expected = get_engine().dashboard(filters, views)
+                self.assertEqual(asyncio.run(self.async_engine.dashboard(filters, views)), expected)
+
+    def test_call_reuses_one_loop(self):
+        views = ['metrics', 'geo']
+        first = self.async_engine.call(self.async_engine.dashboard({}, views))
+        loop = self.async_engine.loop
+        second = self.async_engine.call(self.async_engine.dashboard(FILTER_SETS[1], views))
+        self.assertIs(self.async_engine.loop, loop)
+        self.assertEqual(first, get_engine().dashboard({}, views))
+        self.assertEqual(second, get_engine().dashboard(FILTER_SETS[1], views))
+
+    def test_fork_reset_replaces_executor(self):
+        parent = aio.configure_async(3)
+        parent.call(parent.metrics({}))
+        try:
+            aio._reset_after_fork()
+            child = aio.get_async_engine()
+            self.assertIsNot(child, parent)
+            self.assertIsNot(child._executor, parent._executor)
+            self.assertIsNone(child._loop)
+            self.assertEqual(child.max_workers, 3)
+            self.assertEqual(child.call(child.metrics({})), get_engine().metrics({}))
+        finally:
+            parent.close()
+            aio.get_async_engine().close()
+            aio._async_engine = None
+
+
+if __name__ == '__main__':
+    unittest.main()
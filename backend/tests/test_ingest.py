@@ -0,0 +1,189 @@
+import copy
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+from database import cube, ingest, rollups
+from database.db import get_data_state, get_data_version
+from database.indexes import ensure_indexes
+from .support import MongoTestCase, mongomock, raw_records
+
+
+def write_json(records):
+    """Path of a temporary JSON array file holding the records, removed when the test ends"""
+    handle, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(handle, 'w') as f:
+        json.dump(records, f)
+    return path
+
+
+class UpsertTestCase(MongoTestCase):
+    def load(self, records, **options):
+        path = write_json(records)
+        self.addCleanup(os.remove, path)
+        return ingest.upsert(path, self.collection, progress=None, **options)
+
+
+class UpsertRollupsTest(UpsertTestCase):
+    """Rollups stay equal to a full recomputation while upsert batches run concurrently"""
+
+    def test_concurrent_batches_with_repeated_keys(self):
+        # Every record appears four times, changed each time, three batches
+        # apart, so with four workers copies of one key are in flight together
+        records = raw_records(150)
+        copies = []
+        for copy_number in range(4):
+            for record in records:
+                record = copy.deepcopy(record)
+                record['intensity'] = copy_number * 10 + 1
+                copies.append(record)
+
+        # Widen the gap between reading a key's stored version and replacing it
+        find = mongomock.collection.Collection.find
+
+        def slow_find(collection, query=None, *args, **kwargs):
+            cursor = find(collection, query, *args, **kwargs)
+            if isinstance(query, dict) and 'record_key' in query:
+                cursor = iter(list(cursor))
+                time.sleep(0.1)
+            return cursor
+
+        with mock.patch.object(mongomock.collection.Collection, 'find', slow_find):
+            summary = self.load(copies, batch_size=50, workers=4)
+
+        self.assertEqual(summary['inserted'], 150)
+        self.assertEqual(summary['updated'], 450)
+        self.assertEqual(self.collection.count_documents({}), 150)
+        # The last copy in the file wins
+        self.assertEqual(self.collection.count_documents({'intensity': 31}), 150)
+        self.assertEqual(rollups.verify_rollups(self.collection)['drifted'], 0)
+        self.assertEqual(rollups.base_metrics(self.db)['avg_intensity'], 31)
+
+    def test_unchanged_reload_writes_nothing(self):
+        records = raw_records(100)
+        self.load(copy.deepcopy(records), batch_size=30)
+        version = self.db['meta'].find_one({'_id': 'dataset'})['version']
+
+        summary = self.load(copy.deepcopy(records), batch_size=30)
+        self.assertEqual((summary['inserted'], summary['updated'], summary['unchanged']), (0, 0, 100))
+        self.assertEqual(self.db['meta'].find_one({'_id': 'dataset'})['version'], version)
+        self.assertEqual(rollups.verify_rollups(self.collection)['drifted'], 0)
+
+    def test_verify_reports_drift(self):
+        self.load(raw_records(50), batch_size=20)
+        rollups.apply_deltas({('country', ('India',)): {'count': 1.0, 'intensity': 5.0}}, self.db)
+        report = rollups.verify_rollups(self.collection)
+        self.assertEqual(report['drifted'], 1)
+        self.assertEqual(report['drift'][0]['values'], ['India'])
+
+
+class CubeRefreshTest(UpsertTestCase):
+    """A built cube follows the data through later loads"""
+
+    def cube_meta(self):
+        return self.db['meta'].find_one({'_id': 'cube'})
+
+    def test_upsert_rebuilds_built_cube(self):
+        records = raw_records(80)
+        self.load(copy.deepcopy(records), batch_size=30)
+        cube.build_cube(collection=self.collection)
+        for record in records[:10]:
+            record['intensity'] = 9
+        self.load(records, batch_size=30)
+        self.assertEqual(self.cube_meta()['version'], get_data_version())
+
+    def test_unbuilt_cube_stays_unbuilt(self):
+        self.load(raw_records(40), batch_size=30)
+        self.assertIsNone(self.cube_meta())
+
+
+class IngestTest(MongoTestCase):
+    """Plain inserts skip stored records and mark pure appends"""
+
+    def setUp(self):
+        super().setUp()
+        # init_db() creates the unique record key index duplicates are caught by
+        ensure_indexes(self.collection)
+
+    def load(self, records):
+        path = write_json(records)
+        self.addCleanup(os.remove, path)
+        return ingest.ingest(path, self.collection, batch_size=25, progress=None)
+
+    def test_reload_skips_duplicates(self):
+        records = raw_records(60)
+        self.load(copy.deepcopy(records))
+        version = get_data_version()
+        summary = self.load(copy.deepcopy(records))
+        self.assertEqual((summary['records'], summary['duplicates']), (60, 60))
+        self.assertEqual(self.collection.count_documents({}), 60)
+        self.assertEqual(get_data_version(), version)
+        self.assertEqual(rollups.verify_rollups(self.collection)['drifted'], 0)
+
+    def test_new_records_are_an_append(self):
+        records = raw_records(60)
+        self.load(copy.deepcopy(records[:40]))
+        before = get_data_state()
+        summary = self.load(copy.deepcopy(records))
+        after = get_data_state()
+        self.assertEqual(summary['duplicates'], 40)
+        self.assertEqual((after['version'], after['rewrites']), (before['version'] + 1, before['rewrites']))
+        self.assertEqual(rollups.base_metrics(self.db)['total_records'], 60)
+        self.assertEqual(rollups.verify_rollups(self.collection)['drifted'], 0)
+
+
+class RollupDeltasTest(UpsertTestCase):
+    """Replacing and deleting records move the rollups by exactly their difference"""
+
+    def test_replacing_a_record_with_itself_changes_nothing(self):
+        records = ingest.stamp_batch(ingest.clean_batch(raw_records(30)))
+        deltas = rollups.merge_deltas(rollups.rollup_deltas(records, -1), rollups.rollup_deltas(records))
+        self.assertTrue(deltas)
+        self.assertFalse([key for key, sums in deltas.items() if any(sums.values())])
+
+    def test_changes_and_deletes_keep_rollups_exact(self):
+        records = raw_records(80)
+        self.load(copy.deepcopy(records), batch_size=30)
+        for record in records[:10]:
+            record['intensity'] = 12
+            record['country'] = 'Atlantis'
+        self.load(records, batch_size=30)
+        deleted = rollups.delete_records({'sector': 'Energy'}, self.collection)
+        self.assertGreater(deleted, 0)
+        self.assertEqual(rollups.verify_rollups(self.collection)['drifted'], 0)
+        self.assertEqual(rollups.base_metrics(self.db)['total_records'], 80 - deleted)
+        self.assertEqual(
+            self.db['rollups'].find_one({'dimension': 'country', 'country': 'Atlantis'})['count'],
+            self.collection.count_documents({'country': 'Atlantis'})
+        )
+
+
+class VerifyRollupsFlagTest(MongoTestCase):
+    """python -m database.ingest --verify-rollups"""
+
+    def run_main(self, *args):
+        path = write_json(raw_records(60))
+        self.addCleanup(os.remove, path)
+        with mock.patch('sys.argv', ['ingest', path, '--batch-size', '25', *args]), \
+                mock.patch('builtins.print') as printed:
+            status = ingest.main()
+        return status, json.loads(printed.call_args[0][0])
+
+    def test_clean_load_passes(self):
+        status, summary = self.run_main('--upsert', '--verify-rollups')
+        self.assertEqual(status, 0)
+        self.assertEqual(summary['rollups']['drifted'], 0)
+        self.assertGreater(summary['rollups']['rollups'], 0)
+
+    def test_drift_fails(self):
+        original = rollups.record_replaced
+
+        def lossy(old_records, new_records, db=None):
+            # Drop one record's contribution, as a lost update would
+            original(old_records, new_records[1:], db)
+
+        with mock.patch.object(rollups, 'record_replaced', lossy):
+            status, summary = self.run_main('--upsert', '--verify-rollups')
+        self.assertEqual(status, 1)
+        self.assertGreater(summary['rollups']['drifted'], 0)
@@ -0,0 +1,62 @@
+from database import pipelines, views
+from database.db import iter_filtered_data
+from .support import FILTER_QUERIES, MongoTestCase, filters_from
+
+FACET_FIELDS = ['end_year', 'topic', 'sector', 'region', 'pestle', 'source', 'country']
+
+
+class PipelineParityTest(MongoTestCase):
+    """Every aggregation pipeline returns what the Python view builds from the same records"""
+
+    def setUp(self):
+        super().setUp()
+        self.seed()
+        self.base_metrics = {'total_records': 300}
+
+    def assertParity(self, pipeline_fn, python_fn):
+        for query in FILTER_QUERIES:
+            filters = filters_from(query)
+            with self.subTest(filters=query):
+                self.assertEqual(pipeline_fn(filters), python_fn(filters))
+
+    def test_metrics(self):
+        self.assertParity(
+            lambda filters: pipelines.aggregate_metrics(filters, self.base_metrics),
+            lambda filters: views.build_metrics(iter_filtered_data(filters), self.base_metrics)
+        )
+
+    def test_timeseries(self):
+        self.assertParity(pipelines.aggregate_timeseries, lambda filters: views.build_timeseries(iter_filtered_data(filters)))
+
+    def test_geo(self):
+        self.assertParity(pipelines.aggregate_geo, lambda filters: views.build_geo(iter_filtered_data(filters)))
+
+    def test_topic_distribution(self):
+        self.assertParity(
+            pipelines.aggregate_topic_distribution,
+            lambda filters: views.build_topic_distribution(iter_filtered_data(filters))
+        )
+
+    def test_network(self):
+        self.assertParity(pipelines.aggregate_network, lambda filters: views.build_network(iter_filtered_data(filters)))
+
+    def test_charts(self):
+        self.assertParity(pipelines.aggregate_charts, lambda filters: views.build_charts(iter_filtered_data(filters)))
+
+    def test_facets(self):
+        self.assertParity(
+            lambda filters: pipelines.aggregate_facets(filters, FACET_FIELDS),
+            lambda filters: views.build_facets(iter_filtered_data({}), filters, FACET_FIELDS)
+        )
+
+    def test_dashboard(self):
+        names = ['metrics', 'timeseries', 'geo', 'topic_distribution', 'network', 'charts']
+        self.assertParity(
+            lambda filters: pipelines.aggregate_dashboard(filters, names, self.base_metrics),
+            lambda filters: views.build_views(iter_filtered_data(filters), names, self.base_metrics)
+        )
+
+    def test_fixture_matches_records(self):
+        # Guard against the filters above silently matching nothing
+        self.assertGreater(len(pipelines.aggregate_geo(filters_from('topic=oil'))), 0)
+        self.assertGreater(len(pipelines.aggregate_network(filters_from('region=Northern America&sector=Energy'))['nodes']), 0)
@@ -0,0 +1,95 @@
+import unittest
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import MultiDict
+from database import db
+from database.query import (
+    InvalidFilter,
+    PlanCache,
+    canonical_filters,
+    canonical_key,
+    matches,
+    parse_fields,
+    parse_filters,
+    year_range_values,
+)
+from .support import FILTER_QUERIES, MongoTestCase, filters_from
+
+
+def args(query):
+    return MultiDict(parse_qsl(query))
+
+
+class ParseFiltersTest(unittest.TestCase):
+    """Request arguments become one canonical filter dict, however they are spelled"""
+
+    def test_canonical_forms(self):
+        cases = {
+            '': {},
+            'topic=oil': {'topic': 'oil'},
+            'topic=oil&topic=': {'topic': 'oil'},
+            'topic=': {},
+            'sector=Retail&sector=Energy&sector=Retail': {'sector': {'$in': ['Energy', 'Retail']}},
+            'region_not=World': {'region': {'$nin': ['World']}},
+            'pest=Economic': {'pestle': 'Economic'},
+            'intensity_min=6&intensity_max=9.5': {'intensity': {'$gte': 6.0, '$lte': 9.5}},
+            'end_year_min=2018&end_year=2020': {'end_year': {'$eq': '2020', '$gte': 2018}},
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(parse_filters(args(query)), expected)
+
+    def test_spellings_share_one_key(self):
+        first = parse_filters(args('topic=oil&sector=Retail&sector=Energy'))
+        second = parse_filters(args('sector=Energy&sector=Retail&topic=oil'))
+        self.assertEqual(list(first), list(second))
+        self.assertEqual(canonical_key(first), canonical_key(second))
+        self.assertEqual(canonical_filters(first), first)
+
+    def test_invalid_bounds(self):
+        for query in ['intensity_min=high', 'start_year_max=1.5', 'end_year_min=soon']:
+            with self.subTest(query=query):
+                with self.assertRaises(InvalidFilter):
+                    parse_filters(args(query))
+
+    def test_unsupported_operator(self):
+        with self.assertRaises(InvalidFilter):
+            canonical_filters({'topic': {'$regex': 'oil'}})
+
+    def test_fields(self):
+        self.assertIsNone(parse_fields(args('')))
+        self.assertEqual(parse_fields(args('fields=title,pest&fields=title')), ['title', 'pestle'])
+        with self.assertRaises(InvalidFilter):
+            parse_fields(args('fields=title,secret'))
+
+
+class CompileFiltersTest(unittest.TestCase):
+
+    def test_year_range_values(self):
+        years = ['2016', '2018', '2020', '2030', 'Unknown', '02020']
+        self.assertEqual(year_range_values({'$gte': 2018, '$lte': 2020}, years), {'$in': ['2018', '2020']})
+        self.assertEqual(year_range_values({'$in': ['2016', '2020'], '$gte': 2018}, years), {'$in': ['2020']})
+
+    def test_plan_cache_reuses_plans(self):
+        plans = PlanCache(max_size=2)
+        first = plans.compile({'sector': {'$in': ['Energy', 'Retail']}, 'topic': 'oil'})
+        self.assertIs(plans.compile({'topic': 'oil', 'sector': {'$in': ['Retail', 'Energy', '']}}), first)
+        plans.compile({'topic': 'gas'})
+        plans.compile({'topic': 'coal'})
+        self.assertIsNot(plans.compile(first.filters), first)
+        self.assertEqual(plans.stats()['plans'], 2)
+
+
+class MatchesMongoTest(MongoTestCase):
+    """matches(), which the in-memory engines filter with, agrees with the MongoDB query"""
+
+    def test_matches_agrees_with_build_query(self):
+        records = self.seed()
+        for query in FILTER_QUERIES + ['intensity_max=0', 'start_year_min=2017', 'end_year=2020&end_year_min=2025']:
+            filters = filters_from(query)
+            with self.subTest(filters=query):
+                expected = self.collection.count_documents(db.build_query(filters))
+                selected = [
+                    record for record in records
+                    if all(matches(field, record.get(field), predicate) for field, predicate in filters.items())
+                ]
+                self.assertEqual(len(selected), expected)
@@ -0,0 +1,64 @@
+from unittest import mock
+from database import db
+from database.ingest import stamp_batch
+from database.search import SearchIndex
+from .support import MongoTestCase, mongomock, raw_records
+
+
+class SearchSyncTest(MongoTestCase):
+    """The index follows the collection, reading only what the dataset state says may have changed"""
+
+    def setUp(self):
+        super().setUp()
+        records = raw_records(120)
+        self.extra = stamp_batch(db.clean_data(records[100:]))
+        self.collection.insert_many(stamp_batch(db.clean_data(records[:100])))
+        db.bump_data_version(appended=True)
+        self.index = SearchIndex(version_check_interval=0)
+        self.index.sync(self.collection)
+
+    def sync(self):
+        """Sync the index, returning its report and the queries it sent to the records"""
+        queries = []
+        find = mongomock.collection.Collection.find
+
+        def recording_find(collection, query=None, *args, **kwargs):
+            if collection.name == 'visualizations':
+                queries.append(query)
+            return find(collection, query, *args, **kwargs)
+
+        with mock.patch.object(mongomock.collection.Collection, 'find', recording_find):
+            report = self.index.sync(self.collection)
+        return report, queries
+
+    def titles(self, query):
+        return [record['title'] for _, record in self.index.search(query, 5, collection=self.collection)]
+
+    def rename(self, query, title, **fields):
+        self.collection.update_one(query, {'$set': {'title': title, **fields}})
+        db.bump_data_version()
+
+    def test_append_reads_only_new_records(self):
+        self.collection.insert_many(self.extra)
+        db.bump_data_version(appended=True)
+        report, queries = self.sync()
+        self.assertEqual(report, {'added': 20, 'removed': 0})
+        self.assertEqual(len(queries), 1)
+        self.assertIn('$gt', queries[0]['_id'])
+        self.assertEqual(self.index.snapshot.live, 120)
+
+    def test_rewrite_reindexes_changed_records(self):
+        target = self.collection.find_one({})
+        self.rename({'_id': target['_id']}, 'Xylophone exports', content_hash='changed')
+        report, _ = self.sync()
+        self.assertEqual(report, {'added': 1, 'removed': 1})
+        self.assertEqual(self.titles('xylophone'), ['Xylophone exports'])
+
+    def test_records_without_hash_are_reindexed(self):
+        self.collection.update_many({}, {'$unset': {'content_hash': ''}})
+        db.bump_data_version()
+        self.sync()
+        self.rename({'_id': self.collection.find_one({})['_id']}, 'Xylophone exports')
+        report, _ = self.sync()
+        self.assertEqual(report, {'added': 100, 'removed': 100})
+        self.assertEqual(self.titles('xylophone'), ['Xylophone exports'])
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { Container, Grid, CircularProgress, Alert, Snackbar, Box, Typography, Tab, Tabs, Paper, Button, ButtonGroup } from '@mui/material'
 import BarChartIcon from '@mui/icons-material/BarChart'
 import BubbleChartIcon from '@mui/icons-material/BubbleChart'
@@ -9,10 +9,17 @@ import NetworkChart from './components/NetworkChart'
 import TreeMapChart from './components/TreeMapChart'
 import TimeSeriesChart from './components/TimeSeriesChart'
 import GeoMapChart from './components/GeoMapChart'
-import { FilterState, Metrics, DataItem, NetworkData, TopicDistributionData, TimeSeriesData, GeoData } from './types'
+import { FilterState, Metrics, NetworkData, TopicDistributionData, TimeSeriesData, GeoData, DashboardData, ChartData } from './types'
+
+// Views fetched from /api/dashboard; the standard charts use the server-side sums, not the rows
+const DASHBOARD_VIEWS = 'metrics,network,topic_distribution,timeseries,geo,charts'
 
 function App() {
-  const [data, setData] = useState<DataItem[]>([])
+  const [charts, setCharts] = useState<ChartData>({
+    intensity_by_sector: {},
+    likelihood_by_region: {},
+    relevance_by_year: {}
+  })
   const [metrics, setMetrics] = useState<Metrics>({
     total_records: 0,
     avg_intensity: 0,
@@ -42,13 +49,14 @@ function App() {
   const [geoData, setGeoData] = useState<GeoData | null>(null)
   const [d3Loading, setD3Loading] = useState<boolean>(true)
 
+  // Only the latest filter change may update the charts
+  const latestRequest = useRef(0)
+
   // State for responsive charts
   const [windowWidth, setWindowWidth] = useState(window.innerWidth)
 
   useEffect(() => {
-    fetchMetrics()
-    fetchData()
-    fetchD3Data()
+    fetchDashboard()
     
     // Add window resize listener for responsive charts
     const handleResize = () => {
@@ -63,147 +71,50 @@ function App() {
     }
   }, [])
 
-  const fetchMetrics = async () => {
+  // Fetch every view for the current filters in one request
+  const fetchDashboard = async (filters?: FilterState) => {
+    const request = ++latestRequest.current
+    setLoading(true)
     setMetricsLoading(true)
-    try {
-      const response = await fetch('http://localhost:5000/api/metrics')
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`)
-      }
-      const data = await response.json()
-      setMetrics(data)
-    } catch (e) {
-      setError(`Failed to fetch metrics: ${e instanceof Error ? e.message : String(e)}`)
-      console.error('Error fetching metrics:', e)
-    } finally {
-      setMetricsLoading(false)
+    setD3Loading(true)
+    
+    // Build query string from filters
+    const queryParams = new URLSearchParams()
+    if (filters) {
+      Object.entries(filters).forEach(([key, value]) => {
+        if (value) queryParams.append(key, value)
+      })
     }
-  }
-
-  const fetchData = async () => {
-    setLoading(true)
+    queryParams.set('views', DASHBOARD_VIEWS)
+    
     try {
-      const response = await fetch('http://localhost:5000/api/data')
+      const response = await fetch(`http://localhost:5000/api/dashboard?${queryParams}`)
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`)
       }
-      const data = await response.json()
-      setData(data)
+      const dashboard: DashboardData = await response.json()
+      if (request !== latestRequest.current) return
+      setCharts(dashboard.charts)
+      setMetrics(dashboard.metrics)
+      setNetworkData(dashboard.network)
+      setTopicData(dashboard.topic_distribution)
+      setTimeSeriesData(dashboard.timeseries)
+      setGeoData(dashboard.geo)
     } catch (e) {
-      setError(`Failed to fetch data: ${e instanceof Error ? e.message : String(e)}`)
-      console.error('Error fetching data:', e)
+      setError(`Failed to fetch dashboard data: ${e instanceof Error ? e.message : String(e)}`)
+      console.error('Error fetching dashboard data:', e)
     } finally {
-      setLoading(false)
-    }
-  }
-
-  const fetchD3Data = async () => {
-    setD3Loading(true)
-    try {
-      // Fetch network data
-      const networkResponse = await fetch('http://localhost:5000/api/network')
-      if (!networkResponse.ok) {
-        throw new Error(`HTTP error! status: ${networkResponse.status}`)
-      }
-      const networkData = await networkResponse.json()
-      setNetworkData(networkData)
-
-      // Fetch topic distribution data
-      const topicResponse = await fetch('http://localhost:5000/api/topic-distribution')
-      if (!topicResponse.ok) {
-        throw new Error(`HTTP error! status: ${topicResponse.status}`)
-      }
-      const topicData = await topicResponse.json()
-      setTopicData(topicData)
-
-      // Fetch time series data
-      const timeSeriesResponse = await fetch('http://localhost:5000/api/timeseries')
-      if (!timeSeriesResponse.ok) {
-        throw new Error(`HTTP error! status: ${timeSeriesResponse.status}`)
+      if (request === latestRequest.current) {
+        setLoading(false)
+        setMetricsLoading(false)
+        setD3Loading(false)
       }
-      const timeSeriesData = await timeSeriesResponse.json()
-      setTimeSeriesData(timeSeriesData)
-
-      // Fetch geo data
-      const geoResponse = await fetch('http://localhost:5000/api/geo')
-      if (!geoResponse.ok) {
-        throw new Error(`HTTP error! status: ${geoResponse.status}`)
-      }
-      const geoData = await geoResponse.json()
-      setGeoData(geoData)
-    } catch (e) {
-      setError(`Failed to fetch D3 data: ${e instanceof Error ? e.message : String(e)}`)
-      console.error('Error fetching D3 data:', e)
-    } finally {
-      setD3Loading(false)
     }
   }
 
   const handleFilterChange = async (newFilters: FilterState) => {
     setFilterOptions(newFilters)
-    setLoading(true)
-    setMetricsLoading(true)
-    setD3Loading(true)
-    
-    try {
-      // Build query string from filters
-      const queryParams = new URLSearchParams()
-      Object.entries(newFilters).forEach(([key, value]) => {
-        if (value) queryParams.append(key, value)
-      })
-      
-      // Fetch filtered data
-      const dataResponse = await fetch(`http://localhost:5000/api/data?${queryParams}`)
-      if (!dataResponse.ok) {
-        throw new Error(`HTTP error! status: ${dataResponse.status}`)
-      }
-      const filteredData = await dataResponse.json()
-      setData(filteredData)
-      
-      // Fetch filtered metrics
-      const metricsResponse = await fetch(`http://localhost:5000/api/metrics?${queryParams}`)
-      if (!metricsResponse.ok) {
-        throw new Error(`HTTP error! status: ${metricsResponse.status}`)
-      }
-      const filteredMetrics = await metricsResponse.json()
-      setMetrics(filteredMetrics)
-      
-      // Fetch filtered D3 data
-      const networkResponse = await fetch(`http://localhost:5000/api/network?${queryParams}`)
-      if (!networkResponse.ok) {
-        throw new Error(`HTTP error! status: ${networkResponse.status}`)
-      }
-      const filteredNetworkData = await networkResponse.json()
-      setNetworkData(filteredNetworkData)
-      
-      const topicResponse = await fetch(`http://localhost:5000/api/topic-distribution?${queryParams}`)
-      if (!topicResponse.ok) {
-        throw new Error(`HTTP error! status: ${topicResponse.status}`)
-      }
-      const filteredTopicData = await topicResponse.json()
-      setTopicData(filteredTopicData)
-      
-      const timeSeriesResponse = await fetch(`http://localhost:5000/api/timeseries?${queryParams}`)
-      if (!timeSeriesResponse.ok) {
-        throw new Error(`HTTP error! status: ${timeSeriesResponse.status}`)
-      }
-      const filteredTimeSeriesData = await timeSeriesResponse.json()
-      setTimeSeriesData(filteredTimeSeriesData)
-      
-      const geoResponse = await fetch(`http://localhost:5000/api/geo?${queryParams}`)
-      if (!geoResponse.ok) {
-        throw new Error(`HTTP error! status: ${geoResponse.status}`)
-      }
-      const filteredGeoData = await geoResponse.json()
-      setGeoData(filteredGeoData)
-    } catch (e) {
-      setError(`Failed to fetch filtered data: ${e instanceof Error ? e.message : String(e)}`)
-      console.error('Error fetching filtered data:', e)
-    } finally {
-      setLoading(false)
-      setMetricsLoading(false)
-      setD3Loading(false)
-    }
+    await fetchDashboard(newFilters)
   }
 
   const handleD3TabChange = (event: React.SyntheticEvent, newValue: number) => {
@@ -280,7 +191,7 @@ function App() {
                   <CircularProgress />
                 </Box>
               ) : (
-                <VisualizationPanel data={data} />
+                <VisualizationPanel charts={charts} />
               )}
             </Paper>
           </Grid>
@@ -42,6 +42,8 @@ interface FilterOptions {
   sources: string[];
   countries: string[];
   cities: string[];
+  // Matching records per value, given the filters on the other fields
+  counts?: Partial<Record<Exclude<keyof FilterOptions, 'counts'>, Record<string, number>>>;
 }
 
 const initialFilterOptions: FilterOptions = {
@@ -52,7 +54,8 @@ const initialFilterOptions: FilterOptions = {
   pests: [],
   sources: [],
   countries: [],
-  cities: []
+  cities: [],
+  counts: {}
 }
 
 export default function FilterPanel({ onFilterChange }: FilterPanelProps) {
@@ -73,11 +76,19 @@ export default function FilterPanel({ onFilterChange }: FilterPanelProps) {
     )
   }, [selectedFilters])
 
-  const fetchFilterOptions = async () => {
+  // Options and counts reflect the current selection; only the first load shows the spinner
+  const fetchFilterOptions = async (filters: FilterState = selectedFilters, showLoading = true) => {
     try {
-      setLoading(true)
+      if (showLoading) {
+        setLoading(true)
+      }
       setError(null)
-      const response = await fetch('http://localhost:5000/api/filters')
+      const queryParams = new URLSearchParams()
+      Object.entries(filters).forEach(([key, value]) => {
+        if (value) queryParams.append(key, value)
+      })
+      const queryString = queryParams.toString()
+      const response = await fetch(`http://localhost:5000/api/filters${queryString ? `?${queryString}` : ''}`)
       if (!response.ok) {
         throw new Error('Failed to fetch filter options')
       }
@@ -98,27 +109,38 @@ export default function FilterPanel({ onFilterChange }: FilterPanelProps) {
     }
     setSelectedFilters(newFilters)
     onFilterChange(newFilters)
+    fetchFilterOptions(newFilters, false)
   }
 
   const handleClearFilters = () => {
     setSelectedFilters({})
     onFilterChange({})
+    fetchFilterOptions({}, false)
   }
 
   const handleRefreshFilters = () => {
-    fetchFilterOptions()
+    fetchFilterOptions(selectedFilters)
   }
 
   const filterControls = [
-    { field: 'end_year' as const, label: 'End Year', options: filterOptions.end_years, icon: <CalendarTodayIcon /> },
-    { field: 'topic' as const, label: 'Topic', options: filterOptions.topics, icon: <TopicIcon /> },
-    { field: 'sector' as const, label: 'Sector', options: filterOptions.sectors, icon: <BusinessIcon /> },
-    { field: 'region' as const, label: 'Region', options: filterOptions.regions, icon: <PublicIcon /> },
-    { field: 'pest' as const, label: 'PEST', options: filterOptions.pests, icon: <CategoryIcon /> },
-    { field: 'source' as const, label: 'Source', options: filterOptions.sources, icon: <SourceIcon /> },
-    { field: 'country' as const, label: 'Country', options: filterOptions.countries, icon: <FlagIcon /> },
-    { field: 'city' as const, label: 'City', options: filterOptions.cities, icon: <LocationCityIcon /> }
-  ]
+    { field: 'end_year' as const, label: 'End Year', facet: 'end_years' as const, icon: <CalendarTodayIcon /> },
+    { field: 'topic' as const, label: 'Topic', facet: 'topics' as const, icon: <TopicIcon /> },
+    { field: 'sector' as const, label: 'Sector', facet: 'sectors' as const, icon: <BusinessIcon /> },
+    { field: 'region' as const, label: 'Region', facet: 'regions' as const, icon: <PublicIcon /> },
+    { field: 'pest' as const, label: 'PEST', facet: 'pests' as const, icon: <CategoryIcon /> },
+    { field: 'source' as const, label: 'Source', facet: 'sources' as const, icon: <SourceIcon /> },
+    { field: 'country' as const, label: 'Country', facet: 'countries' as const, icon: <FlagIcon /> },
+    { field: 'city' as const, label: 'City', facet: 'cities' as const, icon: <LocationCityIcon /> }
+  ].map(control => {
+    // Keep the selected value listed even when nothing else matches it any more
+    const selected = selectedFilters[control.field]
+    const options = filterOptions[control.facet]
+    return {
+      ...control,
+      options: selected && !options.includes(selected) ? [selected, ...options] : options,
+      counts: filterOptions.counts?.[control.facet] || {}
+    }
+  })
 
   const container = {
     hidden: { opacity: 0 },
@@ -206,7 +228,7 @@ export default function FilterPanel({ onFilterChange }: FilterPanelProps) {
         animate="show"
       >
         <Box sx={{ display: 'flex', flexDirection: 'column', gap: 2 }}>
-          {filterControls.map(({ field, label, options, icon }) => (
+          {filterControls.map(({ field, label, options, counts, icon }) => (
             <motion.div key={field} variants={item}>
               <FormControl 
                 fullWidth 
@@ -237,6 +259,11 @@ export default function FilterPanel({ onFilterChange }: FilterPanelProps) {
                   {options.map(option => (
                     <MenuItem key={option} value={option}>
                       {option}
+                      {counts[option] !== undefined && (
+                        <Typography component="span" variant="caption" color="text.secondary" sx={{ ml: 1 }}>
+                          ({counts[option]})
+                        </Typography>
+                      )}
                     </MenuItem>
                   ))}
                 </Select>
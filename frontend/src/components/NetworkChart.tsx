@@ -2,18 +2,17 @@ import { useEffect, useRef, useState } from 'react';
 import { Box, Typography, CircularProgress, Paper, useTheme } from '@mui/material';
 import { motion } from 'framer-motion';
 import * as d3 from 'd3';
-import { NetworkData, NetworkNode, NetworkLink } from '../types';
+import { NetworkData, NetworkNode } from '../types';
 
-// Extend NetworkNode to include SimulationNodeDatum properties
-interface SimulationNode extends NetworkNode, d3.SimulationNodeDatum {
-  x?: number;
-  y?: number;
+// Nodes keep their server-side position in x/y and the drawn position in px/py
+interface PositionedNode extends NetworkNode {
+  px: number;
+  py: number;
 }
 
-// Define a custom link type for the simulation
-interface SimulationLink {
-  source: SimulationNode | string | number;
-  target: SimulationNode | string | number;
+interface PositionedLink {
+  source: PositionedNode;
+  target: PositionedNode;
   value: number;
 }
 
@@ -38,32 +37,12 @@ const NetworkChart = ({ data, loading, width = 800, height = 600 }: NetworkChart
     // Clear previous chart
     d3.select(svgRef.current).selectAll('*').remove();
 
-    // Create a map to track node connections
-    const linkedNodes = new Map<string, Set<string>>();
-    
-    // Initialize the map with empty sets for each node
-    data.nodes.forEach((node: NetworkNode) => {
-      linkedNodes.set(node.id, new Set<string>());
-    });
-    
-    // Populate the connections
-    data.links.forEach((link: NetworkLink) => {
-      const sourceId = typeof link.source === 'string' ? link.source : 
-                      typeof link.source === 'object' && 'id' in link.source ? link.source.id : 
-                      String(link.source);
-      
-      const targetId = typeof link.target === 'string' ? link.target : 
-                      typeof link.target === 'object' && 'id' in link.target ? link.target.id : 
-                      String(link.target);
-      
-      // Add bidirectional connections
-      if (linkedNodes.has(sourceId)) {
-        linkedNodes.get(sourceId)?.add(targetId);
-      }
-      
-      if (linkedNodes.has(targetId)) {
-        linkedNodes.get(targetId)?.add(sourceId);
-      }
+    // Count each node's connections for the tooltip
+    const connections = new Map<number, Set<number>>();
+    data.nodes.forEach((node: NetworkNode) => connections.set(node.id, new Set<number>()));
+    data.links.forEach(link => {
+      connections.get(link.source)?.add(link.target);
+      connections.get(link.target)?.add(link.source);
     });
 
     // Set margins
@@ -95,19 +74,15 @@ const NetworkChart = ({ data, loading, width = 800, height = 600 }: NetworkChart
       .attr('class', 'network-container')
       .attr('transform', `translate(${innerWidth / 2},${innerHeight / 2})`);
 
-    // Prepare data for simulation
-    const nodes = data.nodes.map(node => ({ ...node })) as SimulationNode[];
-    const links = data.links.map(link => ({ ...link })) as SimulationLink[];
-
-    // Create a force simulation
-    const simulation = d3.forceSimulation<SimulationNode>(nodes)
-      .force('link', d3.forceLink<SimulationNode, SimulationLink>(links)
-        .id(d => d.id)
-        .distance(100)
-        .strength(0.2))
-      .force('charge', d3.forceManyBody().strength(-300))
-      .force('center', d3.forceCenter(0, 0))
-      .force('collision', d3.forceCollide(30)); // Use a constant radius
+    // Positions come laid out from the server; only scale them to the chart
+    const xScale = d3.scaleLinear().domain([0, 1]).range([-innerWidth / 2, innerWidth / 2]);
+    const yScale = d3.scaleLinear().domain([0, 1]).range([-innerHeight / 2, innerHeight / 2]);
+    const nodes: PositionedNode[] = data.nodes.map(node => ({ ...node, px: xScale(node.x), py: yScale(node.y) }));
+    const links: PositionedLink[] = data.links.map(link => ({
+      source: nodes[link.source],
+      target: nodes[link.target],
+      value: link.value
+    }));
 
     // Create links
     const linkElements = container.append('g')
@@ -139,10 +114,8 @@ const NetworkChart = ({ data, loading, width = 800, height = 600 }: NetworkChart
       .attr('stroke', '#fff')
       .attr('stroke-width', 1.5)
       .style('cursor', 'pointer')
-      .call(d3.drag<SVGCircleElement, SimulationNode>()
-        .on('start', dragstarted)
-        .on('drag', dragged)
-        .on('end', dragended) as any);
+      .call(d3.drag<SVGCircleElement, PositionedNode>()
+        .on('drag', dragged) as any);
 
     // Create labels
     const labelElements = container.append('g')
@@ -161,7 +134,7 @@ const NetworkChart = ({ data, loading, width = 800, height = 600 }: NetworkChart
 
     // Add hover effects
     nodeElements
-      .on('mouseover', function(event, d: SimulationNode) {
+      .on('mouseover', function(event, d: PositionedNode) {
         // Highlight the current node
         d3.select(this)
           .transition()
@@ -177,7 +150,7 @@ const NetworkChart = ({ data, loading, width = 800, height = 600 }: NetworkChart
             l.source === d || l.target === d ? 3 : 1
           );
         
-        labelElements.filter((label: SimulationNode) => label.id === d.id)
+        labelElements.filter((label: PositionedNode) => label.id === d.id)
           .transition()
           .duration(200)
           .style('opacity', 1);
@@ -194,7 +167,7 @@ const NetworkChart = ({ data, loading, width = 800, height = 600 }: NetworkChart
             </div>
             <div>Type: ${d.type}</div>
             <div>Value: ${d.value.toFixed(2)}</div>
-            <div>Connections: ${Array.from(linkedNodes.get(d.id) || new Set()).length}</div>
+            <div>Connections: ${connections.get(d.id)?.size ?? 0}</div>
           `;
           
           tooltip.html(tooltipContent);
@@ -216,7 +189,7 @@ const NetworkChart = ({ data, loading, width = 800, height = 600 }: NetworkChart
         
         setSelectedNode(d.name);
       })
-      .on('mouseout', function(event, d: SimulationNode) {
+      .on('mouseout', function(event, d: PositionedNode) {
         // Restore original appearance
         d3.select(this)
           .transition()
@@ -271,44 +244,29 @@ const NetworkChart = ({ data, loading, width = 800, height = 600 }: NetworkChart
         .style('font-family', theme.typography.fontFamily as string);
     });
 
-    // Update positions on each tick
-    simulation.on('tick', () => {
+    function render() {
       linkElements
-        .attr('x1', d => typeof d.source === 'object' ? d.source.x || 0 : 0)
-        .attr('y1', d => typeof d.source === 'object' ? d.source.y || 0 : 0)
-        .attr('x2', d => typeof d.target === 'object' ? d.target.x || 0 : 0)
-        .attr('y2', d => typeof d.target === 'object' ? d.target.y || 0 : 0);
+        .attr('x1', d => d.source.px)
+        .attr('y1', d => d.source.py)
+        .attr('x2', d => d.target.px)
+        .attr('y2', d => d.target.py);
 
       nodeElements
-        .attr('cx', d => d.x || 0)
-        .attr('cy', d => d.y || 0);
+        .attr('cx', d => d.px)
+        .attr('cy', d => d.py);
 
       labelElements
-        .attr('x', d => d.x || 0)
-        .attr('y', d => d.y || 0);
-    });
-
-    function dragstarted(event: d3.D3DragEvent<SVGCircleElement, SimulationNode, SimulationNode>, d: SimulationNode) {
-      if (!event.active) simulation.alphaTarget(0.3).restart();
-      d.fx = d.x;
-      d.fy = d.y;
-    }
-
-    function dragged(event: d3.D3DragEvent<SVGCircleElement, SimulationNode, SimulationNode>, d: SimulationNode) {
-      d.fx = event.x;
-      d.fy = event.y;
+        .attr('x', d => d.px)
+        .attr('y', d => d.py);
     }
 
-    function dragended(event: d3.D3DragEvent<SVGCircleElement, SimulationNode, SimulationNode>, d: SimulationNode) {
-      if (!event.active) simulation.alphaTarget(0);
-      d.fx = null;
-      d.fy = null;
+    function dragged(event: d3.D3DragEvent<SVGCircleElement, PositionedNode, PositionedNode>, d: PositionedNode) {
+      d.px = event.x;
+      d.py = event.y;
+      render();
     }
 
-    // Clean up on unmount
-    return () => {
-      simulation.stop();
-    };
+    render();
   }, [data, loading, width, height, theme]);
 
   if (loading) {
@@ -15,7 +15,7 @@ import {
   ChartOptions
 } from 'chart.js'
 import { Line, Bar, Pie } from 'react-chartjs-2'
-import { DataItem } from '../types'
+import { ChartData } from '../types'
 import BarChartIcon from '@mui/icons-material/BarChart'
 import PieChartIcon from '@mui/icons-material/PieChart'
 import ShowChartIcon from '@mui/icons-material/ShowChart'
@@ -36,7 +36,7 @@ ChartJS.register(
 )
 
 interface VisualizationPanelProps {
-  data: DataItem[];
+  charts: ChartData;
 }
 
 interface TabPanelProps {
@@ -214,7 +214,7 @@ function TabPanel(props: TabPanelProps) {
   )
 }
 
-export default function VisualizationPanel({ data }: VisualizationPanelProps) {
+export default function VisualizationPanel({ charts }: VisualizationPanelProps) {
   const [tabValue, setTabValue] = useState(0)
 
   const handleTabChange = (_event: React.SyntheticEvent, newValue: number) => {
@@ -232,12 +232,7 @@ export default function VisualizationPanel({ data }: VisualizationPanelProps) {
   }
 
   // Prepare data for intensity by sector
-  const sectorData = data.reduce((acc: { [key: string]: number }, item) => {
-    if (item.sector && item.sector !== 'Unknown') {
-      acc[item.sector] = (acc[item.sector] || 0) + (item.intensity || 0)
-    }
-    return acc
-  }, {})
+  const sectorData = charts.intensity_by_sector
 
   const sectorChartData = {
     labels: Object.keys(sectorData),
@@ -255,12 +250,7 @@ export default function VisualizationPanel({ data }: VisualizationPanelProps) {
   }
 
   // Prepare data for likelihood by region
-  const regionData = data.reduce((acc: { [key: string]: number }, item) => {
-    if (item.region && item.region !== 'Unknown') {
-      acc[item.region] = (acc[item.region] || 0) + (item.likelihood || 0)
-    }
-    return acc
-  }, {})
+  const regionData = charts.likelihood_by_region
 
   const regionChartData = {
     labels: Object.keys(regionData),
@@ -284,12 +274,7 @@ export default function VisualizationPanel({ data }: VisualizationPanelProps) {
   }
 
   // Prepare data for relevance over time
-  const timeData = data.reduce((acc: { [key: string]: number }, item) => {
-    if (item.end_year && item.end_year !== 'Unknown') {
-      acc[item.end_year] = (acc[item.end_year] || 0) + (item.relevance || 0)
-    }
-    return acc
-  }, {})
+  const timeData = charts.relevance_by_year
 
   const timeChartData = {
     labels: Object.keys(timeData).sort(),
@@ -50,15 +50,18 @@ export interface TimeSeriesDataPoint {
 export type TimeSeriesData = TimeSeriesDataPoint[];
 
 export interface NetworkNode {
-    id: string;
+    id: number;
     name: string;
     type: string;
     value: number;
+    // Position laid out by the server, in [0, 1]
+    x: number;
+    y: number;
 }
 
 export interface NetworkLink {
-    source: string;
-    target: string;
+    source: number;
+    target: number;
     value: number;
 }
 
@@ -87,4 +90,22 @@ export interface TopicDistributionNode {
 
 export interface TopicDistributionData extends TopicDistributionNode {
     children: TopicDistributionNode[];
-}
\ No newline at end of file
+}
+
+// Score sums plotted by the standard charts, computed on the server
+export interface ChartData {
+    intensity_by_sector: { [sector: string]: number };
+    likelihood_by_region: { [region: string]: number };
+    relevance_by_year: { [year: string]: number };
+}
+
+// Response of /api/dashboard: every view for one filter set
+export interface DashboardData {
+    data?: DataItem[];
+    metrics: Metrics;
+    network: NetworkData;
+    topic_distribution: TopicDistributionData;
+    timeseries: TimeSeriesData;
+    geo: GeoData;
+    charts: ChartData;
+}